@@ -11,7 +11,7 @@ from torch.utils.data import DataLoader
 root_dir = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
 sys.path.append(root_dir)
 
-from shift_dev import SHIFTDataset
+from shift_dev import PackedTensor, SHIFTDataset, shift_collate
 from shift_dev.types import Keys
 from shift_dev.utils.backend import ZipBackend
 
@@ -38,13 +38,15 @@ def main():
         views_to_load=["front"],
         shift_type="discrete",          # also supports "continuous/1x", "continuous/10x", "continuous/100x"
         backend=ZipBackend(),           # also supports HDF5Backend(), FileBackend()
+        image_dtype=torch.uint8,        # default: torch.float32
         verbose=True,
     )
 
     dataloader = DataLoader(
         dataset,
-        batch_size=1,
+        batch_size=2,
         shuffle=False,
+        collate_fn=shift_collate,   # packs boxes and masks, which vary in number per sample
     )
 
     # Print the dataset size
@@ -57,6 +59,8 @@ def main():
         print(f"{'Item':20} {'Shape':35} {'Min':10} {'Max':10}")
         print("-" * 80)
         for k, data in batch["front"].items():
+            if isinstance(data, PackedTensor):
+                data = data.data    # all samples concatenated, split by the offsets
             if isinstance(data, torch.Tensor):
                 print(f"{k:20} {str(data.shape):35} {data.min():10.2f} {data.max():10.2f}")
             else:
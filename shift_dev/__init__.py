@@ -1,6 +1,16 @@
 """SHIFT Dataset DevKit."""
 
+from .dataloader.clip_dataset import SHIFTClipDataset
+from .dataloader.collate import PackedTensor, shift_clip_collate, shift_collate
+from .dataloader.sampler import VideoSampler
 from .dataloader.shift_dataset import SHIFTDataset
 
 __version__ = "1.0.0"
-__all__ = ["SHIFTDataset"]
+__all__ = [
+    "SHIFTDataset",
+    "SHIFTClipDataset",
+    "PackedTensor",
+    "shift_collate",
+    "shift_clip_collate",
+    "VideoSampler",
+]
@@ -1,3 +1,14 @@
+from .lazy import LazyDict
+from .masks import CroppedMasks, RLEMasks
 from .scalabel import Scalabel
+from .sequence import SequenceIndex
+from .store import AnnotationStore
 
-__all__ = ["Scalabel"]
+__all__ = [
+    "Scalabel",
+    "AnnotationStore",
+    "SequenceIndex",
+    "LazyDict",
+    "RLEMasks",
+    "CroppedMasks",
+]
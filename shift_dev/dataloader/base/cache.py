@@ -2,10 +2,14 @@
 from __future__ import annotations
 
 import copy
+import glob
 import hashlib
 import os
 import pickle
-from collections.abc import Callable
+import tempfile
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
 from typing import Any
 
 import appdirs
@@ -17,6 +21,137 @@ from shift_dev.utils import Timer, setup_logger
 
 logger = setup_logger()
 
+# content hashes of files already fingerprinted by this process, keyed by
+# (path, size, mtime)
+_CONTENT_HASHES: dict[tuple[str, int, int], str] = {}
+
+# node-local cache directory in memory, shared by all processes of a node
+NODE_LOCAL_CACHE_DIR = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "shift_dev"
+)
+# environment variable of the seconds to wait for the cache of local rank 0
+CACHE_TIMEOUT_ENV = "SHIFT_CACHE_TIMEOUT"
+# extension of the marker written next to a cache that failed to build
+FAILURE_EXT = ".failed"
+
+
+def get_local_rank() -> int:
+    """Get the rank of this process among the processes of its node.
+
+    Read from the environment set by the launcher, LOCAL_RANK for torchrun
+    and torch.distributed.launch or SLURM_LOCALID for SLURM, and 0 if not
+    launched as one of several processes.
+    """
+    for name in ("LOCAL_RANK", "SLURM_LOCALID"):
+        if name in os.environ:
+            return int(os.environ[name])
+    return 0
+
+
+def _get_run_id() -> str:
+    """Get the id of the launch, the same for all processes of a job."""
+    for name in ("TORCHELASTIC_RUN_ID", "SLURM_JOB_ID"):
+        if name in os.environ:
+            return os.environ[name]
+    return ""
+
+
+def mark_failure(path: str, error: BaseException) -> None:
+    """Mark that building the file at path failed, see wait_for_file.
+
+    Args:
+        path (str): Path to the file that failed to build.
+        error (BaseException): The error it failed with.
+    """
+    with atomic_write(path + FAILURE_EXT) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(f"{_get_run_id()}\n{error!r}")
+
+
+def _read_failure(path: str) -> None | str:
+    """Get the error of a failure marked by this launch for path, if any."""
+    try:
+        with open(path + FAILURE_EXT, "r", encoding="utf-8") as file:
+            run_id, _, error = file.read().partition("\n")
+    except FileNotFoundError:
+        return None
+    # markers of earlier launches are stale
+    return error if run_id == _get_run_id() else None
+
+
+def wait_for_file(
+    path: str, timeout: None | float = None, interval: float = 0.5
+) -> None:
+    """Wait until a file exists, e.g. a cache written by another process.
+
+    Args:
+        path (str): Path to the file, written with atomic_write so that it is
+            complete once it exists.
+        timeout (None | float): Seconds to wait at most. Defaults to the
+            value of the environment variable SHIFT_CACHE_TIMEOUT, or one
+            hour if not set.
+        interval (float): Seconds between checks. Defaults to 0.5.
+
+    Raises:
+        RuntimeError: If the process building the file failed, see
+            mark_failure.
+        TimeoutError: If the file does not exist after timeout seconds.
+    """
+    if timeout is None:
+        timeout = float(os.getenv(CACHE_TIMEOUT_ENV, "3600"))
+    start = time.monotonic()
+    while not os.path.exists(path):
+        error = _read_failure(path)
+        if error is not None:
+            raise RuntimeError(f"Building {path} failed in another process: {error}")
+        if time.monotonic() - start > timeout:
+            raise TimeoutError(
+                f"{path} not written within {timeout} seconds, set "
+                f"{CACHE_TIMEOUT_ENV} to wait longer."
+            )
+        time.sleep(interval)
+
+
+def file_fingerprint(path: str, chunk_size: int = 1 << 24) -> str:
+    """Fingerprint a file by its path, size, mtime and content hash.
+
+    Args:
+        path (str): Path to the file.
+        chunk_size (int): Number of bytes hashed at once. Defaults to 16 MiB.
+
+    Returns:
+        str: The fingerprint of the file.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _CONTENT_HASHES:
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                hasher.update(chunk)
+        _CONTENT_HASHES[key] = hasher.hexdigest()
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{_CONTENT_HASHES[key]}"
+
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[str]:
+    """Yield a temporary path that is atomically moved to path on success.
+
+    The temporary file is created next to the target, so that concurrent
+    writers (e.g. several ranks building the same cache) never expose a
+    partially written file: the last finished writer wins.
+    """
+    directory, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{basename}.")
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 # reference:
 # https://github.com/facebookresearch/detectron2/blob/7f8f29deae278b75625872c8a0b00b74129446ac/detectron2/data/common.py#L109
@@ -86,11 +221,22 @@ class CacheMappingMixin:
     Caching the mapping reduces startup time by loading the mapping instead of
     re-computing it at every startup.
 
+    With node_local_cache set on the instance, the cache is kept in memory in
+    NODE_LOCAL_CACHE_DIR and built only by the process of local rank 0, while
+    the other processes of the node wait for it, see get_local_rank. This is
+    meant for distributed training, where every rank builds the same dataset.
+    If local rank 0 fails to build the cache, the others fail as well instead
+    of waiting, see wait_for_file. Once a new cache is written, the caches of
+    the same dataset built from earlier versions of its files are removed, as
+    they take up memory.
+
     NOTE: The mapping will detect changes in the dataset by inspecting the
-    string representation (__repr__) of your dataset. Make sure your __repr__
-    implementation contains all parameters relevant to your mapping, so that
-    the mapping will get updated once one of those parameters is changed.
-    Conversely, make sure all non-relevant information is excluded from the
+    string representation (__repr__) of your dataset and the fingerprints
+    (path, size, mtime and content hash) of the files returned by
+    _get_cache_sources. Make sure your __repr__ implementation contains all
+    parameters relevant to your mapping, so that the mapping will get updated
+    once one of those parameters is changed. Conversely, make sure all
+    non-relevant information (e.g. object addresses) is excluded from the
     string representation, so that the mapping can be loaded and re-used.
     """
 
@@ -101,31 +247,87 @@ class CacheMappingMixin:
     ) -> list[DictStrAny]:
         """Load possibly cached mapping via generate_map_func."""
         if use_cache:
-            app_dir = os.getenv(
-                "SHIFT_CACHE_DIR",
-                os.getenv("TMPDIR", appdirs.user_cache_dir(appname="shift_dev")),
+            cache_path = self._get_cache_path(".pkl")
+            if self._waits_for_cache():
+                wait_for_file(cache_path)
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, "rb") as file:
+                        data = pickle.loads(file.read())
+                    logger.info(f"Annotation cache hit: {cache_path}")
+                    return data
+                except (EOFError, pickle.UnpicklingError) as e:
+                    logger.warning(f"Invalid annotation cache {cache_path}: {e}")
+            logger.info(
+                f"Annotation cache miss, generating and dumping to {cache_path} .."
             )
-            cache_dir = os.path.join(
-                app_dir,
-                "shfit_data_mapping",
-                self.__class__.__name__,
-            )
-            os.makedirs(cache_dir, exist_ok=True)
-            cache_path = os.path.join(cache_dir, self._get_hash() + ".pkl")
-            if not os.path.exists(cache_path):
-                logger.info(
-                    f"Generating annotation cache and dumping to {cache_path} .."
-                )
+            with self._building_cache(cache_path):
                 data = generate_map_func()
-                with open(cache_path, "wb") as file:
-                    file.write(pickle.dumps(data))
-            else:
-                with open(cache_path, "rb") as file:
-                    data = pickle.loads(file.read())
+                with atomic_write(cache_path) as tmp_path:
+                    with open(tmp_path, "wb") as file:
+                        file.write(pickle.dumps(data, protocol=-1))
         else:
             data = generate_map_func()
         return data
 
+    def _get_cache_sources(self) -> Sequence[str]:
+        """Get the files the mapping is generated from.
+
+        Their fingerprints are part of the cache key, so that the cache is
+        invalidated once any of them changes.
+        """
+        return []
+
+    def _waits_for_cache(self) -> bool:
+        """Whether to wait for the cache to be built by local rank 0."""
+        return getattr(self, "node_local_cache", False) and get_local_rank() > 0
+
+    @contextmanager
+    def _building_cache(self, cache_path: str) -> Iterator[None]:
+        """Build the node-local cache at cache_path within the context.
+
+        A failure is marked for the processes waiting for the cache, and
+        after success, the caches of the same dataset built from other
+        versions of its files are removed.
+        """
+        if not getattr(self, "node_local_cache", False) or self._waits_for_cache():
+            yield
+            return
+        if os.path.exists(cache_path + FAILURE_EXT):
+            os.remove(cache_path + FAILURE_EXT)
+        try:
+            yield
+        except BaseException as e:
+            mark_failure(cache_path, e)
+            raise
+        # caches are named "<dataset hash>-<hash with file fingerprints>"
+        cache_dir, name = os.path.split(cache_path)
+        prefix, ext = name.split("-")[0], os.path.splitext(name)[1]
+        for path in glob.glob(os.path.join(cache_dir, f"{prefix}-*{ext}")):
+            if path != cache_path:
+                logger.info(f"Removing stale cache {path}")
+                os.remove(path)
+
+    def _get_cache_path(self, ext: str) -> str:
+        """Get the path of the cache file of this dataset instance."""
+        name = self._get_hash()
+        if getattr(self, "node_local_cache", False):
+            # prefixed by the hash without the files, see _building_cache
+            name = f"{self._get_hash(include_sources=False)}-{name}"
+            app_dir = NODE_LOCAL_CACHE_DIR
+        else:
+            app_dir = os.getenv(
+                "SHIFT_CACHE_DIR",
+                os.getenv("TMPDIR", appdirs.user_cache_dir(appname="shift_dev")),
+            )
+        cache_dir = os.path.join(
+            app_dir,
+            "shfit_data_mapping",
+            self.__class__.__name__,
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+        return os.path.join(cache_dir, name + ext)
+
     def _load_mapping(
         self,
         generate_map_func: Callable[[], list[DictStrAny]],
@@ -135,12 +337,15 @@ class CacheMappingMixin:
         timer = Timer()
         data = self._load_mapping_data(generate_map_func, use_cache)
         dataset = DatasetFromList(data)
-        logger.info(f"Loading {str(self.__repr__)} takes {timer.time():.2f} seconds.")
+        logger.info(f"Loading {self!r} takes {timer.time():.2f} seconds.")
         return dataset
 
-    def _get_hash(self, length: int = 16) -> str:
-        """Get hash of current dataset instance."""
+    def _get_hash(self, length: int = 16, include_sources: bool = True) -> str:
+        """Get hash of current dataset instance and its source files."""
         hasher = hashlib.sha256()
-        hasher.update(str(self.__repr__).encode("utf8"))
+        hasher.update(repr(self).encode("utf8"))
+        if include_sources:
+            for path in self._get_cache_sources():
+                hasher.update(file_fingerprint(path).encode("utf8"))
         hash_value = hasher.hexdigest()[:length]
         return hash_value
@@ -0,0 +1,93 @@
+"""Sample data that is loaded on first access."""
+from __future__ import annotations
+
+from collections.abc import Callable, Iterator, Mapping, Sequence
+
+from shift_dev.types import DataDict
+
+# loads a part of a sample, together with the keys it may contain
+Loader = tuple[Sequence[str], Callable[[], DataDict]]
+
+
+class LazyDict(Mapping):
+    """Read-only mapping whose values are loaded on first access.
+
+    The data is split into parts, each loaded by one function. Accessing a
+    key runs the function of the part that may contain it and memoizes all
+    values it returns, so that the other parts are never loaded unless they
+    are accessed, too. Iterating, e.g. to copy the mapping into a dict or to
+    collate samples, loads all parts, and the keys then come in the order of
+    the parts.
+
+    When pickled, e.g. to be sent from a worker to the main process, all
+    parts are loaded and the mapping is turned into a dict.
+    """
+
+    def __init__(self, loaders: Sequence[Loader]) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            loaders (Sequence[Loader]): The parts of the data, as the keys that
+                a part may contain and the function that loads it. Keys not
+                listed are only reachable by iterating. If several parts
+                contain a key, the value is taken from the last of them.
+        """
+        self._loaders = [load for _, load in loaders]
+        self._parts: list[None | DataDict] = [None] * len(loaders)
+        self._key_to_parts: dict[str, list[int]] = {}
+        for i, (keys, _) in enumerate(loaders):
+            for key in keys:
+                self._key_to_parts.setdefault(key, []).append(i)
+
+    def _load_part(self, part: int) -> DataDict:
+        """Load a part of the data, once."""
+        data = self._parts[part]
+        if data is None:
+            data = self._loaders[part]()
+            self._parts[part] = data
+        return data
+
+    def is_loaded(self, key: str) -> bool:
+        """Check if the parts that may contain key have been loaded."""
+        parts = self._key_to_parts.get(key, [])
+        return len(parts) > 0 and all(self._parts[i] is not None for i in parts)
+
+    def __getitem__(self, key: str) -> object:
+        """Get the value of a key, loading its parts if needed."""
+        for part in reversed(self._key_to_parts.get(key, [])):
+            data = self._load_part(part)
+            if key in data:
+                return data[key]
+        raise KeyError(key)
+
+    def _items(self) -> DataDict:
+        """Load all parts and merge them, later parts taking precedence."""
+        items: DataDict = {}
+        for part in range(len(self._parts)):
+            items.update(self._load_part(part))
+        return items
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the keys, loading all parts."""
+        return iter(self._items())
+
+    def __len__(self) -> int:
+        """Get the number of keys, loading all parts."""
+        return len(self._items())
+
+    def __contains__(self, key: object) -> bool:
+        """Check if key is in the data, loading its parts if needed."""
+        try:
+            self[key]  # type: ignore
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self) -> str:
+        """Representation, listing only the keys loaded so far."""
+        loaded = [key for data in self._parts if data is not None for key in data]
+        return f"{self.__class__.__name__}(loaded={loaded})"
+
+    def __reduce__(self) -> tuple[type, tuple[DataDict]]:
+        """Pickle as a dict of all values."""
+        return dict, (self._items(),)
@@ -0,0 +1,268 @@
+"""Instance masks decoded from RLE, densely, cropped or on demand."""
+from __future__ import annotations
+
+import math
+from collections.abc import Sequence
+
+import numpy as np
+import torch
+from pycocotools import mask as mask_utils
+from torch import Tensor
+
+from shift_dev.types import DictStrAny, NDArrayU8
+
+MASK_FORMATS = ("bitmask", "rle", "cropped")
+# number of masks decoded at once, bounds the memory of the decoder output
+DECODE_CHUNK_SIZE = 16
+
+
+def _get_hw(
+    rles: Sequence[DictStrAny], image_hw: None | tuple[int, int]
+) -> tuple[int, int]:
+    """Get the size of the masks, from the RLEs if not given."""
+    if image_hw is None:
+        assert len(rles) > 0, "image size must be specified without masks!"
+        return (int(rles[0]["size"][0]), int(rles[0]["size"][1]))
+    return (int(image_hw[0]), int(image_hw[1]))
+
+
+def _decode_chunks(rles: Sequence[DictStrAny]):  # type: ignore
+    """Decode RLEs in chunks, yielding [H, W, n] arrays in Fortran order."""
+    for start in range(0, len(rles), DECODE_CHUNK_SIZE):
+        yield start, mask_utils.decode(list(rles[start : start + DECODE_CHUNK_SIZE]))
+
+
+def background_rle(
+    rles: Sequence[DictStrAny], image_hw: None | tuple[int, int] = None
+) -> DictStrAny:
+    """Get the RLE of the pixels not covered by any mask.
+
+    The union of the masks is computed on the RLEs, so that the foreground is
+    decoded once instead of combining the decoded masks.
+
+    Args:
+        rles (Sequence[DictStrAny]): The RLEs, with counts and size.
+        image_hw (tuple[int, int], optional): Image size, required if there
+            are no masks. Defaults to None.
+
+    Returns:
+        DictStrAny: The RLE of the background.
+    """
+    height, width = _get_hw(rles, image_hw)
+    if len(rles) == 0:
+        foreground = np.zeros((height, width), dtype=np.uint8, order="F")
+    else:
+        foreground = mask_utils.decode(mask_utils.merge(list(rles), intersect=False))
+    return mask_utils.encode(np.asfortranarray(1 - foreground))
+
+
+def decode_rles(
+    rles: Sequence[DictStrAny],
+    image_hw: None | tuple[int, int] = None,
+    bg_as_class: bool = False,
+) -> NDArrayU8:
+    """Decode RLEs into one [N, H, W] uint8 array.
+
+    The masks are decoded in chunks of DECODE_CHUNK_SIZE by pycocotools and
+    written straight into the preallocated output.
+
+    Args:
+        rles (Sequence[DictStrAny]): The RLEs, with counts and size.
+        image_hw (tuple[int, int], optional): Image size, required if there
+            are no masks. Defaults to None.
+        bg_as_class (bool): Whether to append the background as an additional
+            mask. Defaults to False.
+
+    Returns:
+        NDArrayU8: The binary masks.
+    """
+    height, width = _get_hw(rles, image_hw)
+    masks = np.empty((len(rles) + int(bg_as_class), height, width), dtype=np.uint8)
+    for start, decoded in _decode_chunks(rles):
+        masks[start : start + decoded.shape[2]] = decoded.transpose(2, 0, 1)
+    if bg_as_class:
+        if len(rles) == 0:
+            masks[-1] = 1
+        else:
+            foreground = mask_utils.decode(
+                mask_utils.merge(list(rles), intersect=False)
+            )
+            np.equal(foreground, 0, out=masks[-1], casting="unsafe")
+    return masks
+
+
+class RLEMasks:
+    """Instance masks kept as RLE, decoded on demand.
+
+    An RLE takes a few hundred bytes instead of a full-resolution bitmap, so
+    that the masks of a sample are cheap to send from the workers and only
+    decoded where needed, e.g. after filtering the instances.
+    """
+
+    def __init__(self, rles: list[DictStrAny], image_hw: tuple[int, int]) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            rles (list[DictStrAny]): The RLEs in COCO format, with counts and
+                size.
+            image_hw (tuple[int, int]): Image size.
+        """
+        self.rles = rles
+        self.image_hw = image_hw
+
+    def __len__(self) -> int:
+        """Number of masks."""
+        return len(self.rles)
+
+    def __getitem__(self, idx: int) -> Tensor:
+        """Decode a mask, [H, W] uint8."""
+        return torch.from_numpy(decode_rles(self.rles[idx : idx + 1], self.image_hw)[0])
+
+    def decode(self) -> Tensor:
+        """Decode all masks, [N, H, W] uint8."""
+        return torch.from_numpy(decode_rles(self.rles, self.image_hw))
+
+    def boxes(self) -> Tensor:
+        """Get the bounding boxes of the masks, [N, 4] (x1, y1, x2, y2)."""
+        if len(self.rles) == 0:
+            return torch.empty(0, 4)
+        boxes = mask_utils.toBbox(self.rles)
+        boxes[:, 2:] += boxes[:, :2]
+        return torch.from_numpy(boxes).float()
+
+    def area(self) -> Tensor:
+        """Get the number of pixels of each mask, [N]."""
+        if len(self.rles) == 0:
+            return torch.empty(0, dtype=torch.int64)
+        return torch.from_numpy(mask_utils.area(self.rles).astype(np.int64))
+
+    def crop(self) -> CroppedMasks:
+        """Decode the masks cropped to their bounding boxes."""
+        crops, origins = [], []
+        if len(self.rles) > 0:
+            boxes = mask_utils.toBbox(self.rles)
+            for start, decoded in _decode_chunks(self.rles):
+                for i in range(decoded.shape[2]):
+                    x, y, w, h = boxes[start + i]
+                    x1, y1 = int(x), int(y)
+                    x2, y2 = math.ceil(x + w), math.ceil(y + h)
+                    crops.append(
+                        torch.from_numpy(
+                            np.ascontiguousarray(decoded[y1:y2, x1:x2, i])
+                        )
+                    )
+                    origins.append((y1, x1))
+        return CroppedMasks(crops, origins, self.image_hw)
+
+    def __repr__(self) -> str:
+        """Representation, with the number of masks and image size."""
+        return f"{self.__class__.__name__}(num={len(self)}, image_hw={self.image_hw})"
+
+
+class CroppedMasks:
+    """Instance masks cropped to their bounding boxes, pasted on demand.
+
+    Each mask is a [h, w] uint8 bitmap of its bounding box and the position
+    of the box in the image. Objects mostly cover a small part of the image,
+    so the crops take a fraction of the memory of full-resolution masks.
+    """
+
+    def __init__(
+        self,
+        crops: list[Tensor],
+        origins: list[tuple[int, int]],
+        image_hw: tuple[int, int],
+    ) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            crops (list[Tensor]): The [h, w] uint8 bitmaps of the boxes.
+            origins (list[tuple[int, int]]): The top left corner (y, x) of
+                each box in the image.
+            image_hw (tuple[int, int]): Image size.
+        """
+        self.crops = crops
+        self.origins = origins
+        self.image_hw = image_hw
+
+    def __len__(self) -> int:
+        """Number of masks."""
+        return len(self.crops)
+
+    def paste(self, idx: int, out: None | Tensor = None) -> Tensor:
+        """Paste a mask into the full image, [H, W] uint8.
+
+        Args:
+            idx (int): Index of the mask.
+            out (Tensor, optional): [H, W] uint8 tensor to paste into,
+                zeroed first. Defaults to None, a new tensor.
+
+        Returns:
+            Tensor: The mask.
+        """
+        if out is None:
+            out = torch.zeros(self.image_hw, dtype=torch.uint8)
+        else:
+            out.zero_()
+        crop, (y, x) = self.crops[idx], self.origins[idx]
+        out[y : y + crop.shape[0], x : x + crop.shape[1]] = crop
+        return out
+
+    def __getitem__(self, idx: int) -> Tensor:
+        """Paste a mask into the full image, [H, W] uint8."""
+        return self.paste(idx)
+
+    def decode(self) -> Tensor:
+        """Paste all masks into the full image, [N, H, W] uint8."""
+        masks = torch.empty((len(self), *self.image_hw), dtype=torch.uint8)
+        for i in range(len(self)):
+            self.paste(i, masks[i])
+        return masks
+
+    def boxes(self) -> Tensor:
+        """Get the boxes the masks are cropped to, [N, 4] (x1, y1, x2, y2)."""
+        return torch.tensor(
+            [
+                [x, y, x + crop.shape[1], y + crop.shape[0]]
+                for crop, (y, x) in zip(self.crops, self.origins)
+            ],
+            dtype=torch.float32,
+        ).reshape(-1, 4)
+
+    def __repr__(self) -> str:
+        """Representation, with the number of masks and image size."""
+        return f"{self.__class__.__name__}(num={len(self)}, image_hw={self.image_hw})"
+
+
+def masks_from_rles(
+    rles: list[DictStrAny],
+    image_hw: None | tuple[int, int] = None,
+    bg_as_class: bool = False,
+    mask_format: str = "bitmask",
+) -> Tensor | RLEMasks | CroppedMasks:
+    """Convert RLEs of a frame into instance masks of the given format.
+
+    Args:
+        rles (list[DictStrAny]): The RLEs in COCO format, with counts and size.
+        image_hw (tuple[int, int], optional): Image size, required if there
+            are no masks. Defaults to None.
+        bg_as_class (bool): Whether to append the background as an additional
+            mask. Defaults to False.
+        mask_format (str): "bitmask" for a [N, H, W] uint8 tensor, "rle" for
+            RLEMasks or "cropped" for CroppedMasks. Defaults to "bitmask".
+
+    Returns:
+        Tensor | RLEMasks | CroppedMasks: The instance masks.
+    """
+    assert mask_format in MASK_FORMATS, f"Invalid mask_format {mask_format}."
+    if mask_format == "bitmask":
+        if len(rles) == 0 and not bg_as_class:
+            return torch.empty(0, 0, 0, dtype=torch.uint8)
+        return torch.from_numpy(decode_rles(rles, image_hw, bg_as_class))
+    image_hw = _get_hw(rles, image_hw) if len(rles) > 0 or bg_as_class else (0, 0)
+    if bg_as_class:
+        rles = rles + [background_rle(rles, image_hw)]
+    masks = RLEMasks(rles, image_hw)
+    if mask_format == "cropped":
+        return masks.crop()
+    return masks
@@ -1,6 +1,7 @@
 """Scalabel type dataset."""
 from __future__ import annotations
 
+import glob
 import os
 from collections import defaultdict
 from collections.abc import Callable, Sequence
@@ -8,9 +9,10 @@ from typing import Dict, Union
 
 import numpy as np
 import torch
+from pycocotools import mask as mask_utils
 from scalabel.label.io import load, load_label_config
 from scalabel.label.transforms import (
-    box2d_to_xyxy, poly2ds_to_mask, rle_to_mask
+    box2d_to_xyxy, poly2ds_to_mask
 )
 from scalabel.label.typing import Config
 from scalabel.label.typing import Dataset as ScalabelData
@@ -24,12 +26,15 @@ from scalabel.label.utils import (
 from torch import Tensor
 from torch.utils.data import Dataset
 
-from shift_dev.types import DataDict, DictStrAny, Keys, NDArrayU8
+from shift_dev.types import DataDict, DictStrAny, Keys, NDArrayI64
 from shift_dev.utils import Timer, setup_logger
 from shift_dev.utils.backend import DataBackend, FileBackend
-from shift_dev.utils.load import im_decode, ply_decode
+from shift_dev.utils.load import IMAGE_DECODERS, IMAGE_SCALES, ply_decode, rgb_decode
 
-from .cache import CacheMappingMixin, DatasetFromList
+from .cache import CacheMappingMixin, DatasetFromList, atomic_write, wait_for_file
+from .masks import MASK_FORMATS, CroppedMasks, RLEMasks, masks_from_rles
+from .sequence import SequenceIndex
+from .store import AnnotationStore
 
 logger = setup_logger()
 
@@ -50,49 +55,94 @@ def load_extrinsics(extrinsics: Extrinsics) -> Tensor:
     return extrinsics_matrix
 
 
-def load_image(url: str, backend: DataBackend) -> Tensor:
-    """Load image tensor from url."""
-    im_bytes = backend.get(url)
-    image = im_decode(im_bytes)
-    return torch.as_tensor(
-        np.ascontiguousarray(image.transpose(2, 0, 1)),
-        dtype=torch.float32,
-    ).unsqueeze(0)
+def decode_image(
+    im_bytes: bytes,
+    dtype: torch.dtype = torch.float32,
+    channels_last: bool = False,
+    scale: int = 1,
+    decoder: str = "pil",
+) -> Tensor:
+    """Decode image tensor of shape [1, C, H, W] from bytes.
+
+    Args:
+        im_bytes (bytes): The encoded image.
+        dtype (torch.dtype): Type of the image tensor. With torch.uint8, the
+            image takes a quarter of the memory of torch.float32, e.g. when
+            it is sent from the workers to the main process, and can be
+            normalized later on the device. Defaults to torch.float32.
+        channels_last (bool): Whether to return the image in channels last
+            memory format, which is the layout of the decoded image. With
+            torch.uint8, the image is then returned without any copy.
+            Defaults to False.
+        scale (int): Factor to downscale the image by while decoding, one of
+            1, 2, 4 or 8, see rgb_decode. Defaults to 1.
+        decoder (str): The image decoder, see rgb_decode. Defaults to "pil".
+
+    Returns:
+        Tensor: The image.
+    """
+    image = rgb_decode(im_bytes, scale, decoder=decoder)
+    image = torch.from_numpy(image).permute(2, 0, 1).unsqueeze(0)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    # to() returns the image itself if its dtype does not change
+    return image.to(dtype, memory_format=memory_format).contiguous(
+        memory_format=memory_format
+    )
+
+
+def decode_pointcloud(ply_bytes: bytes) -> Tensor:
+    """Decode pointcloud tensor from PLY bytes."""
+    pointcloud = ply_decode(ply_bytes)
+    return torch.as_tensor(pointcloud, dtype=torch.float32)
+
+
+def load_image(
+    url: str,
+    backend: DataBackend,
+    dtype: torch.dtype = torch.float32,
+    channels_last: bool = False,
+    scale: int = 1,
+    decoder: str = "pil",
+) -> Tensor:
+    """Load image tensor from url, see decode_image."""
+    return decode_image(backend.get(url), dtype, channels_last, scale, decoder)
 
 
 def load_pointcloud(url: str, backend: DataBackend) -> Tensor:
     """Load pointcloud tensor from url."""
     assert url.endswith(".ply"), "Only PLY files are supported now."
-    ply_bytes = backend.get(url)
-    pointcloud = ply_decode(ply_bytes)
-    return torch.as_tensor(pointcloud, dtype=torch.float32)
+    return decode_pointcloud(backend.get(url))
 
 
 def instance_ids_to_global(
-    frames: list[Frame], local_instance_ids: Dict[str, list[str]]
+    frames: list[Frame], local_instance_ids: Dict[str, Dict[str, int]]
 ) -> None:
-    """Use local (per video) instance ids to produce global ones."""
-    video_names = list(local_instance_ids.keys())
+    """Use local (per video) instance ids to produce global ones.
+
+    The instances of each video are offset by the number of instances of all
+    videos before it, in the order of local_instance_ids.
+
+    Args:
+        frames (list[Frame]): The frames, whose labels get the global ids.
+        local_instance_ids (Dict[str, Dict[str, int]]): Per video, the local
+            instance id of each label id, see prepare_labels.
+    """
+    video_offsets, num_instances = {}, 0
+    for video_name, instance_ids in local_instance_ids.items():
+        video_offsets[video_name] = num_instances
+        num_instances += len(instance_ids)
     for frame_id, ann in enumerate(frames):
         if ann.labels is None:  # pragma: no cover
             continue
+        video_name = (
+            ann.videoName if ann.videoName is not None else "no-video-" + str(frame_id)
+        )
         for label in ann.labels:
             assert label.attributes is not None
             if not check_crowd(label) and not check_ignored(label):
-                video_name = (
-                    ann.videoName
-                    if ann.videoName is not None
-                    else "no-video-" + str(frame_id)
-                )
-                sum_previous_vids = sum(
-                    (
-                        len(local_instance_ids[v])
-                        for v in video_names[: video_names.index(video_name)]
-                    )
+                label.attributes["instance_id"] = (
+                    video_offsets[video_name] + local_instance_ids[video_name][label.id]
                 )
-                label.attributes[
-                    "instance_id"
-                ] = sum_previous_vids + local_instance_ids[video_name].index(label.id)
 
 
 def add_data_path(data_root: str, frames: list[Frame]) -> None:
@@ -110,11 +160,15 @@ def add_data_path(data_root: str, frames: list[Frame]) -> None:
 
 def prepare_labels(frames: list[Frame], global_instance_ids: bool = False) -> None:
     """Add category id and instance id to labels, return class frequencies."""
-    instance_ids: Dict[str, list[str]] = defaultdict(list)
+    # per video, the instance id of each label id, in order of appearance
+    instance_ids: Dict[str, Dict[str, int]] = defaultdict(dict)
     for frame_id, ann in enumerate(frames):
         if ann.labels is None:
             continue
 
+        video_name = (
+            ann.videoName if ann.videoName is not None else "no-video-" + str(frame_id)
+        )
         for label in ann.labels:
             attr: Dict[str, bool | int | float | str] = {}
             if label.attributes is not None:
@@ -124,14 +178,10 @@ def prepare_labels(frames: list[Frame], global_instance_ids: bool = False) -> No
                 continue
 
             assert label.category is not None
-            video_name = (
-                ann.videoName
-                if ann.videoName is not None
-                else "no-video-" + str(frame_id)
+            video_instance_ids = instance_ids[video_name]
+            attr["instance_id"] = video_instance_ids.setdefault(
+                label.id, len(video_instance_ids)
             )
-            if label.id not in instance_ids[video_name]:
-                instance_ids[video_name].append(label.id)
-            attr["instance_id"] = instance_ids[video_name].index(label.id)
             label.attributes = attr
 
     if global_instance_ids:
@@ -143,12 +193,68 @@ def prepare_labels(frames: list[Frame], global_instance_ids: bool = False) -> No
 CategoryMap = Union[Dict[str, int], Dict[str, Dict[str, int]]]
 
 
+class TargetLabels:
+    """Labels of a target in an annotation store, grouped by frame."""
+
+    def __init__(
+        self,
+        offsets: NDArrayI64,
+        indices: NDArrayI64,
+        classes: NDArrayI64,
+        track_ids: NDArrayI64,
+    ):
+        """Creates an instance of the class.
+
+        Args:
+            offsets (NDArrayI64): Start of the labels of each frame in
+                indices, with one extra trailing entry holding the total.
+            indices (NDArrayI64): Indices of the labels in the store.
+            classes (NDArrayI64): Class id of each label.
+            track_ids (NDArrayI64): Track id of each label.
+        """
+        self.offsets = offsets
+        self.indices = indices
+        self.classes = classes
+        self.track_ids = track_ids
+
+    def get(self, index: int) -> tuple[NDArrayI64, NDArrayI64, NDArrayI64]:
+        """Get the store indices, class and track ids of the labels of a frame.
+
+        The class and track ids are copies, so that the tensors made from
+        them can be modified in place.
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return (
+            self.indices[start:end],
+            self.classes[start:end].copy(),
+            self.track_ids[start:end].copy(),
+        )
+
+
 class Scalabel(Dataset, CacheMappingMixin):
     """Scalabel type dataset.
 
     This class loads scalabel format data into Vis4D.
     """
 
+    # keys of a sample yielded by each key to load
+    OUTPUT_KEYS = {
+        Keys.images: (
+            Keys.images,
+            Keys.original_hw,
+            Keys.input_hw,
+            Keys.frame_ids,
+            "name",
+            "videoName",
+        ),
+        Keys.points3d: (Keys.points3d,),
+        Keys.intrinsics: (Keys.intrinsics,),
+        Keys.extrinsics: (Keys.extrinsics,),
+        Keys.boxes2d: (Keys.boxes2d, Keys.boxes2d_classes, Keys.boxes2d_track_ids),
+        Keys.masks: (Keys.masks,),
+        Keys.boxes3d: (Keys.boxes3d, Keys.boxes3d_classes, Keys.boxes3d_track_ids),
+    }
+
     def __init__(
         self,
         data_root: str,
@@ -163,6 +269,13 @@ class Scalabel(Dataset, CacheMappingMixin):
         global_instance_ids: bool = False,
         bg_as_class: bool = False,
         use_cache: bool = False,
+        use_store: bool = False,
+        node_local_cache: bool = False,
+        image_dtype: torch.dtype = torch.float32,
+        image_channels_last: bool = False,
+        image_scale: int = 1,
+        image_decoder: str = "pil",
+        mask_format: str = "bitmask",
     ) -> None:
         """Creates an instance of the class.
 
@@ -185,7 +298,43 @@ class Scalabel(Dataset, CacheMappingMixin):
                 per-video IDs. Defaults to false.
             bg_as_class (bool): Whether to include background pixels as an
                 additional class for masks.
+            use_cache (bool): Whether to cache the loaded annotations on disk.
+                The cache is keyed on the fingerprints (path, size, mtime and
+                content hash) of the annotation and config files and written
+                atomically. Defaults to False.
+            use_store (bool): Whether to hold the annotations in a columnar
+                AnnotationStore instead of a list of pickled Frames. With
+                use_cache, the store is memory-mapped from the cache file and
+                shared among workers. Polygon masks are not supported by the
+                store. Defaults to False.
+            node_local_cache (bool): Whether to keep the cache in memory,
+                shared by all processes of a node, see CacheMappingMixin.
+                Only the process of local rank 0 parses the annotations, the
+                others wait for its cache and memory-map the same store.
+                Requires use_cache. Defaults to False.
+            image_dtype (torch.dtype): Type of the loaded images, torch.uint8
+                or a floating point type, see decode_image. Defaults to
+                torch.float32.
+            image_channels_last (bool): Whether to load the images in
+                channels last memory format. Defaults to False.
+            image_scale (int): Factor to downscale the images by while
+                decoding, one of 1, 2, 4 or 8. The annotations stay in the
+                coordinates of the full resolution, original_hw, while
+                input_hw is the size of the downscaled image. Defaults to 1.
+            image_decoder (str): The image decoder, see rgb_decode. Defaults
+                to "pil".
+            mask_format (str): Format of the instance masks, "bitmask" for a
+                [N, H, W] uint8 tensor, "rle" for RLEMasks, decoded on demand,
+                or "cropped" for CroppedMasks, decoded to the bounding boxes
+                and pasted into the image on demand. Defaults to "bitmask".
         """
+        assert (
+            image_dtype == torch.uint8 or image_dtype.is_floating_point
+        ), f"Invalid image_dtype {image_dtype}."
+        assert image_scale in IMAGE_SCALES, f"Invalid image_scale {image_scale}."
+        assert image_decoder in IMAGE_DECODERS, f"Invalid decoder {image_decoder}."
+        assert mask_format in MASK_FORMATS, f"Invalid mask_format {mask_format}."
+        assert use_cache or not node_local_cache, "node_local_cache needs use_cache."
         super().__init__()
         self.data_root = data_root
         self.annotation_path = annotation_path
@@ -193,6 +342,13 @@ class Scalabel(Dataset, CacheMappingMixin):
         self.global_instance_ids = global_instance_ids
         self.bg_as_class = bg_as_class
         self.use_cache = use_cache
+        self.use_store = use_store
+        self.node_local_cache = node_local_cache
+        self.image_dtype = image_dtype
+        self.image_channels_last = image_channels_last
+        self.image_scale = image_scale
+        self.image_decoder = image_decoder
+        self.mask_format = mask_format
         self.data_backend = data_backend if data_backend is not None else FileBackend()
         self.config_path = config_path
         self.frames, self.cfg = self._load_mapping(self._generate_mapping, use_cache)
@@ -210,6 +366,28 @@ class Scalabel(Dataset, CacheMappingMixin):
             ), "Class names are not unique!"
             category_map = {c: i for i, c in enumerate(class_list)}
         self._setup_categories(category_map)
+        if self.use_store:
+            self._setup_store_categories()
+
+    def __repr__(self) -> str:
+        """Concise representation of the dataset, also used as cache key."""
+        return (
+            f"{self.__class__.__name__}(annotation_path={self.annotation_path}, "
+            f"config_path={self.config_path}, "
+            f"global_instance_ids={self.global_instance_ids})"
+        )
+
+    def _get_cache_sources(self) -> list[str]:
+        """Get the annotation and config files the mapping is generated from."""
+        if os.path.isdir(self.annotation_path):
+            sources = sorted(
+                glob.glob(os.path.join(self.annotation_path, "**", "*.json"), recursive=True)
+            )
+        else:
+            sources = [self.annotation_path]
+        if self.config_path is not None:
+            sources.append(self.config_path)
+        return sources
 
     def _setup_categories(self, category_map: CategoryMap) -> None:
         """Setup categories."""
@@ -224,21 +402,127 @@ class Scalabel(Dataset, CacheMappingMixin):
                 assert isinstance(target_map, dict)
                 self.cats_name2id[target] = target_map
 
+    def _setup_store_categories(self) -> None:
+        """Map the category names table of the store to class ids per target.
+
+        Each lookup array holds one trailing -1 entry, so that labels without
+        category (index -1) map to -1 as well.
+        """
+        category_names = self.frames.category_names.tolist()
+        self._store_class_ids: Dict[str, NDArrayI64] = {}
+        for target, cats_name2id in self.cats_name2id.items():
+            self._store_class_ids[target] = np.asarray(
+                [cats_name2id.get(name, -1) for name in category_names] + [-1],
+                dtype=np.int64,
+            )
+        self._setup_store_labels()
+
+    def _setup_store_labels(self) -> None:
+        """Select the labels of each target once, for all frames of the store.
+
+        For each of boxes2d, masks and boxes3d, the labels that are not
+        ignored, have the annotation of the target and a category mapped to a
+        class are gathered in one index array, ordered by frame as in the
+        store, together with their class and track ids. The offsets of the
+        frames into this array turn loading the annotations of a frame into
+        slicing, with no per-sample category lookup or filtering.
+        """
+        store: AnnotationStore = self.frames
+        used = ~store.ignored
+        if self.global_instance_ids:
+            instance_ids = store.global_instance_ids
+        else:
+            instance_ids = store.instance_ids
+        self._store_labels: Dict[str, TargetLabels] = {}
+        for target, has_target in (
+            (Keys.boxes2d, store.has_box2d),
+            (Keys.masks, store.has_rle),
+            (Keys.boxes3d, store.has_box3d),
+        ):
+            if target not in self.keys_to_load:
+                continue
+            classes = self._store_class_ids[target][store.categories]
+            indices = np.flatnonzero(used & has_target & (classes >= 0))
+            self._store_labels[target] = TargetLabels(
+                offsets=np.searchsorted(indices, store.label_offsets),
+                indices=indices,
+                classes=classes[indices],
+                track_ids=instance_ids[indices],
+            )
+
     def _load_mapping(
         self,
         generate_map_func: Callable[[], list[DictStrAny]],
         use_cache: bool = True,
     ) -> tuple[Dataset, Config]:
-        """Load cached mapping or generate if not exists."""
+        """Load cached mapping or generate if not exists.
+
+        Also builds the sequence index of the loaded frames.
+        """
+        if self.use_store:
+            store, cfg = self._load_store(generate_map_func, use_cache)
+            self.sequence_index = SequenceIndex(
+                store.video_ids, store.frame_indices, store.video_names.tolist()
+            )
+            return store, cfg
         timer = Timer()
         data = self._load_mapping_data(generate_map_func, use_cache)
         frames, cfg = data.frames, data.config  # type: ignore
         add_data_path(self.data_root, frames)
         prepare_labels(frames, global_instance_ids=self.global_instance_ids)
+        self.sequence_index = SequenceIndex.from_names(
+            [frame.videoName for frame in frames],
+            [frame.frameIndex for frame in frames],
+        )
         frames = DatasetFromList(frames)
         logger.info(f"Loading annotation takes {timer.time():.2f} seconds.")
         return frames, cfg
 
+    def _load_store(
+        self,
+        generate_map_func: Callable[[], ScalabelData],
+        use_cache: bool = True,
+    ) -> tuple[AnnotationStore, Config]:
+        """Load the annotation store from cache or build it if not exists."""
+        timer = Timer()
+        cache_path = self._get_cache_path(".ann") if use_cache else None
+        store = None
+        if cache_path is not None and self._waits_for_cache():
+            wait_for_file(cache_path)
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                store = AnnotationStore.load(cache_path)
+                logger.info(f"Annotation cache hit: {cache_path}")
+            except ValueError as e:
+                logger.warning(f"Invalid annotation cache {cache_path}: {e}")
+        if store is None:
+            if cache_path is not None:
+                logger.info(
+                    f"Annotation cache miss, generating and dumping to {cache_path} .."
+                )
+            if cache_path is not None and not self._waits_for_cache():
+                # only local rank 0 writes the node-local cache
+                with self._building_cache(cache_path):
+                    store = self._generate_store(generate_map_func)
+                    with atomic_write(cache_path) as tmp_path:
+                        store.save(tmp_path)
+                store = AnnotationStore.load(cache_path)
+            else:
+                store = self._generate_store(generate_map_func)
+        logger.info(f"Loading annotation takes {timer.time():.2f} seconds.")
+        return store, store.config
+
+    def _generate_store(
+        self, generate_map_func: Callable[[], ScalabelData]
+    ) -> AnnotationStore:
+        """Generate the annotation store from the data mapping.
+
+        Subclasses can override this to fill the store without building the
+        intermediate Scalabel frames.
+        """
+        data = generate_map_func()
+        return AnnotationStore.from_frames(data.frames, data.config)
+
     def _generate_mapping(self) -> ScalabelData:
         """Generate data mapping."""
         data = load(self.annotation_path)
@@ -246,32 +530,177 @@ class Scalabel(Dataset, CacheMappingMixin):
             data.config = load_label_config(self.config_path)
         return data
 
-    def _load_inputs(self, frame: Frame) -> DictData:
+    def _read(self, url: str, inputs: None | Dict[str, bytes] = None) -> bytes:
+        """Get the content at url, from inputs if already fetched."""
+        if inputs is not None and url in inputs:
+            return inputs[url]
+        return self.data_backend.get(url)
+
+    def _read_image(
+        self, url: str, inputs: None | Dict[str, bytes | Tensor] = None
+    ) -> Tensor:
+        """Get the image at url, from inputs if already fetched or decoded."""
+        content = self._read(url, inputs)
+        if isinstance(content, Tensor):
+            return content
+        return decode_image(
+            content,
+            self.image_dtype,
+            self.image_channels_last,
+            self.image_scale,
+            self.image_decoder,
+        )
+
+    def get_input_urls(self, index: int) -> list[str]:
+        """Get the urls of the data read from the backend for a sample.
+
+        The content at those urls can be fetched in advance, e.g. together
+        with other data via DataBackend.get_many, and passed to get_sample.
+
+        Args:
+            index (int): Index of the sample.
+
+        Returns:
+            list[str]: The urls, empty if no data is read from the backend.
+        """
+        if not any(key in self.keys_to_load for key in (Keys.images, Keys.points3d)):
+            return []
+        if self.use_store:
+            return [self._get_store_url(index)]
+        url = self.frames[index].url
+        return [] if url is None else [url]
+
+    def _get_original_hw(self, input_hw: tuple[int, int]) -> tuple[int, int]:
+        """Get the full resolution of an image downscaled by image_scale.
+
+        The downscaled size is rounded up, so this may exceed the original
+        size by up to image_scale - 1 pixels, e.g. for 1242x375 images.
+        """
+        return (input_hw[0] * self.image_scale, input_hw[1] * self.image_scale)
+
+    def _load_inputs(
+        self,
+        frame: Frame,
+        inputs: None | Dict[str, bytes | Tensor] = None,
+        keys_to_load: None | Sequence[str] = None,
+    ) -> DictData:
         """Load inputs given a scalabel frame."""
+        if keys_to_load is None:
+            keys_to_load = self.keys_to_load
         data: DictData = {}
-        if frame.url is not None and Keys.images in self.keys_to_load:
-            image = load_image(frame.url, self.data_backend)
+        if frame.url is not None and Keys.images in keys_to_load:
+            image = self._read_image(frame.url, inputs)
             input_hw = (image.shape[2], image.shape[3])
             data[Keys.images] = image
-            data[Keys.original_hw] = input_hw
+            data[Keys.original_hw] = self._get_original_hw(input_hw)
             data[Keys.input_hw] = input_hw
             data[Keys.frame_ids] = frame.frameIndex
             # TODO how to properly integrate such metadata?
             data["name"] = frame.name
             data["videoName"] = frame.videoName
 
-        if frame.url is not None and Keys.points3d in self.keys_to_load:
-            data[Keys.points3d] = load_pointcloud(frame.url, self.data_backend)
+        if frame.url is not None and Keys.points3d in keys_to_load:
+            assert frame.url.endswith(".ply"), "Only PLY files are supported now."
+            data[Keys.points3d] = decode_pointcloud(self._read(frame.url, inputs))
 
-        if frame.intrinsics is not None and Keys.intrinsics in self.keys_to_load:
+        if frame.intrinsics is not None and Keys.intrinsics in keys_to_load:
             data[Keys.intrinsics] = load_intrinsics(frame.intrinsics)
 
-        if frame.extrinsics is not None and Keys.extrinsics in self.keys_to_load:
+        if frame.extrinsics is not None and Keys.extrinsics in keys_to_load:
             data[Keys.extrinsics] = load_extrinsics(frame.extrinsics)
         return data
 
-    def _add_annotations(self, frame: Frame, data: DictData) -> None:
+    def _get_store_url(self, index: int) -> str:
+        """Get the data path of a frame in the store, see add_data_path."""
+        url = self.frames.url(index)
+        if url is not None:
+            return os.path.join(self.data_root, url)
+        video_name = self.frames.video_name(index)
+        if video_name is not None:
+            return os.path.join(self.data_root, video_name, self.frames.name(index))
+        return os.path.join(self.data_root, self.frames.name(index))
+
+    def _load_inputs_from_store(
+        self,
+        index: int,
+        inputs: None | Dict[str, bytes | Tensor] = None,
+        keys_to_load: None | Sequence[str] = None,
+    ) -> DictData:
+        """Load inputs given the index of a frame in the annotation store."""
+        if keys_to_load is None:
+            keys_to_load = self.keys_to_load
+        store: AnnotationStore = self.frames
+        data: DictData = {}
+        url = self._get_store_url(index)
+        if Keys.images in keys_to_load:
+            image = self._read_image(url, inputs)
+            input_hw = (image.shape[2], image.shape[3])
+            data[Keys.images] = image
+            data[Keys.original_hw] = self._get_original_hw(input_hw)
+            data[Keys.input_hw] = input_hw
+            data[Keys.frame_ids] = store.frame_index(index)
+            data["name"] = store.name(index)
+            data["videoName"] = store.video_name(index)
+
+        if Keys.points3d in keys_to_load:
+            assert url.endswith(".ply"), "Only PLY files are supported now."
+            data[Keys.points3d] = decode_pointcloud(self._read(url, inputs))
+
+        if store.has_intrinsics[index] and Keys.intrinsics in keys_to_load:
+            data[Keys.intrinsics] = torch.tensor(store.intrinsics[index])
+
+        if store.has_extrinsics[index] and Keys.extrinsics in keys_to_load:
+            data[Keys.extrinsics] = torch.tensor(store.extrinsics[index])
+        return data
+
+    def _add_annotations_from_store(
+        self, index: int, data: DictData, keys_to_load: None | Sequence[str] = None
+    ) -> None:
+        """Add annotations given the index of a frame in the annotation store.
+
+        Equivalent to _add_annotations, but slices the labels of the frame
+        from the ones selected per target by _setup_store_labels.
+        """
+        if keys_to_load is None:
+            keys_to_load = self.keys_to_load
+        store: AnnotationStore = self.frames
+
+        if Keys.boxes2d in keys_to_load:
+            indices, classes, track_ids = self._store_labels[Keys.boxes2d].get(index)
+            data[Keys.boxes2d] = torch.from_numpy(store.boxes2d[indices])
+            data[Keys.boxes2d_classes] = torch.from_numpy(classes)
+            data[Keys.boxes2d_track_ids] = torch.from_numpy(track_ids)
+
+        if Keys.masks in keys_to_load:
+            indices, _, _ = self._store_labels[Keys.masks].get(index)
+            if Keys.original_hw in data:
+                image_hw = data[Keys.original_hw]
+            else:
+                image_hw = tuple(store.sizes[index]) if store.sizes[index, 0] > 0 else None
+            data[Keys.masks] = instance_masks_from_store(
+                store,
+                indices,
+                image_hw=image_hw,
+                bg_as_class=self.bg_as_class,
+                mask_format=self.mask_format,
+            )
+
+        if Keys.boxes3d in keys_to_load:
+            indices, classes, track_ids = self._store_labels[Keys.boxes3d].get(index)
+            if len(indices) > 0:
+                data[Keys.boxes3d] = torch.from_numpy(store.boxes3d[indices])
+            else:
+                # keep the empty shape consistent with boxes3d_from_scalabel
+                data[Keys.boxes3d] = torch.empty(0, 10)
+            data[Keys.boxes3d_classes] = torch.from_numpy(classes)
+            data[Keys.boxes3d_track_ids] = torch.from_numpy(track_ids)
+
+    def _add_annotations(
+        self, frame: Frame, data: DictData, keys_to_load: None | Sequence[str] = None
+    ) -> None:
         """Add annotations given a scalabel frame and a data dictionary."""
+        if keys_to_load is None:
+            keys_to_load = self.keys_to_load
         if frame.labels is None:
             return
         labels_used, instid_map = [], {}
@@ -285,12 +714,12 @@ class Scalabel(Dataset, CacheMappingMixin):
         #     return  # pragma: no cover
 
         image_size = (
-            ImageSize(height=data[Keys.input_hw][0], width=data[Keys.input_hw][0])
-            if Keys.input_hw in data
+            ImageSize(height=data[Keys.original_hw][0], width=data[Keys.original_hw][1])
+            if Keys.original_hw in data
             else frame.size
         )
 
-        if Keys.boxes2d in self.keys_to_load:
+        if Keys.boxes2d in keys_to_load:
             cats_name2id = self.cats_name2id[Keys.boxes2d]
             boxes2d, classes, track_ids = boxes2d_from_scalabel(
                 labels_used, cats_name2id, instid_map
@@ -299,7 +728,7 @@ class Scalabel(Dataset, CacheMappingMixin):
             data[Keys.boxes2d_classes] = classes
             data[Keys.boxes2d_track_ids] = track_ids
 
-        if Keys.masks in self.keys_to_load:
+        if Keys.masks in keys_to_load:
             # NOTE: instance masks' mapping is consistent with boxes2d
             cats_name2id = self.cats_name2id[Keys.masks]
             instance_masks = instance_masks_from_scalabel(
@@ -307,10 +736,11 @@ class Scalabel(Dataset, CacheMappingMixin):
                 cats_name2id,
                 image_size=image_size,
                 bg_as_class=self.bg_as_class,
+                mask_format=self.mask_format,
             )
             data[Keys.masks] = instance_masks
 
-        if Keys.boxes3d in self.keys_to_load:
+        if Keys.boxes3d in keys_to_load:
             boxes3d, classes, track_ids = boxes3d_from_scalabel(
                 labels_used, self.cats_name2id[Keys.boxes3d], instid_map
             )
@@ -324,47 +754,88 @@ class Scalabel(Dataset, CacheMappingMixin):
 
     def __getitem__(self, index: int) -> DictData:
         """Get item from dataset at given index."""
-        frame = self.frames[index]  # type: Frame
-        data = self._load_inputs(frame)
-        if len(self.keys_to_load) > 0:
+        return self.get_sample(index)
+
+    def get_sample(
+        self,
+        index: int,
+        inputs: None | Dict[str, bytes | Tensor] = None,
+        keys_to_load: None | Sequence[str] = None,
+    ) -> DictData:
+        """Get item from dataset at given index.
+
+        Args:
+            index (int): Index of the sample.
+            inputs (None | Dict[str, bytes | Tensor], optional): Already
+                fetched content of (some of) the urls returned by
+                get_input_urls, or the image tensor already decoded from it.
+                Urls not contained are read from the backend. Defaults to
+                None.
+            keys_to_load (None | Sequence[str], optional): The keys to load
+                for this sample, a subset of keys_to_load. See OUTPUT_KEYS
+                for the keys of the sample they yield. Defaults to None,
+                which loads all of keys_to_load.
+
+        Returns:
+            DictData: The sample.
+        """
+        if keys_to_load is None:
+            keys_to_load = self.keys_to_load
+        if self.use_store:
+            data = self._load_inputs_from_store(index, inputs, keys_to_load)
+        else:
+            frame = self.frames[index]  # type: Frame
+            data = self._load_inputs(frame, inputs, keys_to_load)
+        if len(keys_to_load) > 0:
             if len(self.cats_name2id) == 0:
                 raise AttributeError(
                     "Category mapping is empty but keys_to_load is not. "
                     "Please specify a category mapping."
                 )
             # load annotations to input sample
-            self._add_annotations(frame, data)
+            if self.use_store:
+                self._add_annotations_from_store(index, data, keys_to_load)
+            else:
+                self._add_annotations(frame, data, keys_to_load)
         return data
 
+    def get_frame_key(self, index: int) -> tuple[None | str, str]:
+        """Get the frame identifier (video name, frame name) by index."""
+        if self.use_store:
+            return self.frames.video_name(index), self.frames.name(index)
+        frame = self.frames[index]
+        return frame.videoName, frame.name
+
+    def get_frame_keys(self) -> list[tuple[None | str, str]]:
+        """Get the frame identifiers of all frames, see get_frame_key."""
+        if self.use_store:
+            video_names = self.frames.video_names.tolist()
+            return [
+                (None if video_id < 0 else video_names[video_id], name)
+                for video_id, name in zip(
+                    self.frames.video_ids.tolist(), self.frames.names.tolist()
+                )
+            ]
+        return [(frame.videoName, frame.name) for frame in self.frames]
+
     @property
     def video_to_indices(self) -> dict[str, list[int]]:
         """Group all dataset sample indices (int) by their video ID (str).
 
+        The mapping is built once from the sequence index and shared, so it
+        must not be modified.
+
         Returns:
             dict[str, list[int]]: Mapping video to index.
         """
-        video_to_indices: dict[str, list[int]] = defaultdict(list)
-        video_to_frameidx: dict[str, list[int]] = defaultdict(list)
-        for idx, frame in enumerate(self.frames):
-            if frame.videoName is not None:
-                assert (
-                    frame.frameIndex is not None
-                ), "found videoName but no frameIndex!"
-                video_to_frameidx[frame.videoName].append(frame.frameIndex)
-                video_to_indices[frame.videoName].append(idx)
-
-        # sort dataset indices by frame indices
-        for key, idcs in video_to_indices.items():
-            zip_frame_idx = sorted(zip(video_to_frameidx[key], idcs))
-            video_to_indices[key] = [idx for _, idx in zip_frame_idx]
-        return video_to_indices
+        return self.sequence_index.video_to_indices()
 
     def get_video_indices(self, idx: int) -> list[int]:
         """Get all dataset indices in a video given a single dataset index."""
-        for indices in self.video_to_indices.values():
-            if idx in indices:
-                return indices
-        raise ValueError(f"Dataset index {idx} not found in video_to_indices!")
+        video_id = int(self.sequence_index.video_ids[idx])
+        if video_id < 0:
+            raise ValueError(f"Dataset index {idx} not found in video_to_indices!")
+        return self.video_to_indices[self.sequence_index.video_names[video_id]]
 
 
 
@@ -456,7 +927,8 @@ def instance_masks_from_scalabel(
     class_to_idx: Dict[str, int],
     image_size: ImageSize | None = None,
     bg_as_class: bool = False,
-) -> Tensor:
+    mask_format: str = "bitmask",
+) -> Tensor | RLEMasks | CroppedMasks:
     """Convert from scalabel format to Vis4D.
 
     Args:
@@ -465,39 +937,51 @@ def instance_masks_from_scalabel(
         image_size (ImageSize, optional): image size. Defaults to None.
         bg_as_class (bool, optional): whether to include background as a class.
             Defaults to False.
+        mask_format (str, optional): format of the masks, see masks_from_rles.
+            Defaults to "bitmask".
 
     Returns:
-        Tensor: instance masks.
+        Tensor | RLEMasks | CroppedMasks: instance masks.
     """
-    bitmask_list = []
-    if bg_as_class:
-        foreground = None
+    rles = []
     for label in labels:
         if label.category not in class_to_idx:
             continue
-        if label.poly2d is None and label.rle is None:
-            continue
         if label.rle is not None:
-            bitmask = rle_to_mask(label.rle)
+            rles.append(dict(label.rle))
         elif label.poly2d is not None:
             assert (
                 image_size is not None
             ), "image size must be specified for masks with polygons!"
-            bitmask_raw = poly2ds_to_mask(image_size, label.poly2d)
-            bitmask: NDArrayU8 = (bitmask_raw > 0).astype(  # type: ignore
-                bitmask_raw.dtype
-            )
-        bitmask_list.append(bitmask)
-        if bg_as_class:
-            foreground = (
-                bitmask if foreground is None else np.logical_or(foreground, bitmask)
-            )
-    if bg_as_class:
-        if foreground is None:  # pragma: no cover
-            assert image_size is not None
-            foreground = np.zeros((image_size.height, image_size.width), dtype=np.uint8)
-        bitmask_list.append(np.logical_not(foreground))
-    if len(bitmask_list) == 0:  # pragma: no cover
-        return torch.empty(0, 0, 0, dtype=torch.uint8)
-    mask_tensor = torch.tensor(np.array(bitmask_list), dtype=torch.uint8)
-    return mask_tensor
+            bitmask = poly2ds_to_mask(image_size, label.poly2d) > 0
+            rles.append(mask_utils.encode(np.asfortranarray(bitmask, dtype=np.uint8)))
+    image_hw = None if image_size is None else (image_size.height, image_size.width)
+    return masks_from_rles(rles, image_hw, bg_as_class, mask_format)
+
+
+def instance_masks_from_store(
+    store: AnnotationStore,
+    label_indices: NDArrayI64,
+    image_hw: tuple[int, int] | None = None,
+    bg_as_class: bool = False,
+    mask_format: str = "bitmask",
+) -> Tensor | RLEMasks | CroppedMasks:
+    """Convert RLE masks of an annotation store to Vis4D.
+
+    Args:
+        store (AnnotationStore): annotation store holding the masks.
+        label_indices (NDArrayI64): indices of the labels to convert.
+        image_hw (tuple[int, int], optional): image size. Defaults to None.
+        bg_as_class (bool, optional): whether to include background as a class.
+            Defaults to False.
+        mask_format (str, optional): format of the masks, see masks_from_rles.
+            Defaults to "bitmask".
+
+    Returns:
+        Tensor | RLEMasks | CroppedMasks: instance masks.
+    """
+    rles = [
+        {"counts": store.rle_counts[i], "size": store.rle_sizes[i].tolist()}
+        for i in label_indices
+    ]
+    return masks_from_rles(rles, image_hw, bg_as_class, mask_format)
@@ -0,0 +1,140 @@
+"""Index of the video sequences in a dataset."""
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+
+from shift_dev.types import NDArrayI64
+
+
+class SequenceIndex:
+    """Precomputed grouping of dataset indices by video.
+
+    Videos are numbered in order of their first frame in the dataset. The
+    dataset indices of all frames are stored in one array, grouped by video
+    and sorted by frame index within each video, so that the frames of a
+    video are a contiguous slice.
+
+    Attributes:
+        video_names (list[str]): Name of each video.
+        offsets (NDArrayI64): [V + 1] start of each video in indices.
+        indices (NDArrayI64): Dataset indices grouped by video.
+        video_ids (NDArrayI64): [N] video of each dataset index, -1 if the
+            frame does not belong to a video.
+        positions (NDArrayI64): [N] position of each dataset index inside its
+            video, -1 if the frame does not belong to a video.
+    """
+
+    def __init__(
+        self,
+        video_ids: NDArrayI64,
+        frame_indices: NDArrayI64,
+        video_names: Sequence[str],
+    ) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            video_ids (NDArrayI64): Video of each dataset index as index into
+                video_names, -1 if the frame does not belong to a video.
+            frame_indices (NDArrayI64): Frame index of each dataset index
+                inside its video.
+            video_names (Sequence[str]): Names of the videos.
+        """
+        video_ids = np.asarray(video_ids, dtype=np.int64)
+        frame_indices = np.asarray(frame_indices, dtype=np.int64)
+        in_video = np.flatnonzero(video_ids >= 0)
+        assert np.all(
+            frame_indices[in_video] >= 0
+        ), "found videoName but no frameIndex!"
+
+        # renumber videos in order of their first frame
+        _, first_seen, inverse = np.unique(
+            video_ids[in_video], return_index=True, return_inverse=True
+        )
+        video_order = np.argsort(first_seen)
+        ranks = np.empty_like(video_order)
+        ranks[video_order] = np.arange(len(video_order))
+        self.video_names = [
+            video_names[video_ids[in_video[i]]] for i in first_seen[video_order]
+        ]
+        self.video_ids = np.full(len(video_ids), -1, dtype=np.int64)
+        self.video_ids[in_video] = ranks[inverse.reshape(-1)]
+
+        # group by video, then sort by frame index and dataset index
+        self.indices = in_video[
+            np.lexsort((in_video, frame_indices[in_video], self.video_ids[in_video]))
+        ]
+        counts = np.bincount(self.video_ids[in_video], minlength=len(self.video_names))
+        self.offsets = np.zeros(len(self.video_names) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.positions = np.full(len(video_ids), -1, dtype=np.int64)
+        self.positions[self.indices] = np.arange(len(self.indices)) - np.repeat(
+            self.offsets[:-1], counts
+        )
+        self._video_to_indices: None | dict[str, list[int]] = None
+
+    @classmethod
+    def from_names(
+        cls, video_names: Sequence[None | str], frame_indices: Sequence[None | int]
+    ) -> SequenceIndex:
+        """Build the index from the video name and frame index of each frame.
+
+        Args:
+            video_names (Sequence[None | str]): Video name of each dataset
+                index, None if the frame does not belong to a video.
+            frame_indices (Sequence[None | int]): Frame index of each dataset
+                index, None if unknown.
+
+        Returns:
+            SequenceIndex: The sequence index.
+        """
+        names: dict[str, int] = {}
+        video_ids = [
+            -1 if name is None else names.setdefault(name, len(names))
+            for name in video_names
+        ]
+        return cls(
+            np.asarray(video_ids, dtype=np.int64),
+            np.asarray([-1 if i is None else i for i in frame_indices], dtype=np.int64),
+            list(names),
+        )
+
+    @property
+    def num_videos(self) -> int:
+        """Number of videos."""
+        return len(self.video_names)
+
+    def video_indices(self, video_id: int) -> NDArrayI64:
+        """Get the sorted dataset indices of a video."""
+        return self.indices[self.offsets[video_id] : self.offsets[video_id + 1]]
+
+    def get_video_indices(self, idx: int) -> NDArrayI64:
+        """Get the sorted dataset indices of the video of a dataset index.
+
+        Raises:
+            ValueError: If the frame at idx does not belong to a video.
+        """
+        video_id = int(self.video_ids[idx])
+        if video_id < 0:
+            raise ValueError(f"Dataset index {idx} not found in video_to_indices!")
+        return self.video_indices(video_id)
+
+    def video_to_indices(self) -> dict[str, list[int]]:
+        """Get the mapping from video name to sorted dataset indices.
+
+        The mapping is built on first use and shared by all callers, so it
+        must not be modified.
+        """
+        if self._video_to_indices is None:
+            self._video_to_indices = {
+                name: self.video_indices(i).tolist()
+                for i, name in enumerate(self.video_names)
+            }
+        return self._video_to_indices
+
+    def __getstate__(self) -> dict[str, object]:
+        """Drop the lazily built mapping when pickling, e.g. to workers."""
+        state = self.__dict__.copy()
+        state["_video_to_indices"] = None
+        return state
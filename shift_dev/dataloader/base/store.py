@@ -0,0 +1,626 @@
+"""Columnar, memory-mappable annotation store for Scalabel frames.
+
+Instead of holding one pickled pydantic Frame per sample, the store keeps all
+annotations of a dataset in a handful of flat NumPy arrays (frame-level and
+label-level columns plus per-frame label offsets) and string tables. The store
+can be written to a single file and memory-mapped back, so that DataLoader
+workers share its pages through the page cache instead of copying them.
+"""
+from __future__ import annotations
+
+import json
+from array import array
+from collections.abc import Iterable, Sequence
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict
+
+import numpy as np
+import numpy.typing as npt
+from scalabel.label.typing import Config, Extrinsics, Frame, Intrinsics
+from scalabel.label.utils import (
+    get_matrix_from_extrinsics, get_matrix_from_intrinsics
+)
+
+from shift_dev.types import DictStrAny, NDArrayI32, NDArrayI64, NDArrayU8
+
+STORE_MAGIC = b"SHIFTANN"
+STORE_VERSION = 2
+_ALIGNMENT = 64
+
+
+class StringTable:
+    """Immutable table of strings stored as one uint8 blob plus offsets."""
+
+    def __init__(self, data: NDArrayU8, offsets: NDArrayI64):
+        """Creates an instance of the class.
+
+        Args:
+            data (NDArray[uint8]): Concatenated utf-8 encoded strings.
+            offsets (NDArray[int64]): Start offset of each string in data,
+                with one extra trailing entry holding the total length.
+        """
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> StringTable:
+        """Build a string table from a sequence of python strings."""
+        encoded = [s.encode("utf8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        """Number of strings in the table."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        """Get the string at the given index."""
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.data[start:end].tobytes().decode("utf8")
+
+    def tolist(self) -> list[str]:
+        """Decode all strings of the table."""
+        return [self[i] for i in range(len(self))]
+
+
+class AnnotationStore:
+    """Columnar annotation store.
+
+    Frame-level columns are indexed by the dataset index, label-level columns
+    by the global label index. The labels of frame i are found at
+    label_offsets[i]:label_offsets[i + 1].
+
+    Frame-level columns:
+        names, urls (StringTable): frame name and (possibly empty) url.
+        video_ids (int32): index into video_names, -1 if no video.
+        frame_indices (int64): frame index inside the video, -1 if unknown.
+        intrinsics (float32, [N, 3, 3]), has_intrinsics (bool).
+        extrinsics (float32, [N, 4, 4]), has_extrinsics (bool).
+        sizes (int32, [N, 2]): image (height, width), -1 if unknown.
+
+    Label-level columns:
+        categories (int32): index into category_names, -1 if no category.
+        label_ids (int32): index into label_id_names.
+        ignored (bool): whether the label is marked as crowd or ignored.
+        boxes2d (float32, [M, 4]): xyxy boxes (x2y2 excluded), has_box2d.
+        boxes3d (float32, [M, 9]): location, dimension, orientation, has_box3d.
+        instance_ids (int64): per-video instance id, -1 for crowd / ignored
+            labels.
+        global_instance_ids (int64): dataset-wide instance id, -1 for crowd /
+            ignored labels.
+        rle_counts (StringTable), rle_sizes (int32, [M, 2]), has_rle (bool).
+    """
+
+    STRING_TABLES = (
+        "names",
+        "urls",
+        "video_names",
+        "category_names",
+        "label_id_names",
+        "rle_counts",
+    )
+    # string tables that are referenced by index, and the referencing column
+    INDEXED_TABLES = {
+        "video_names": "video_ids",
+        "category_names": "categories",
+        "label_id_names": "label_ids",
+    }
+
+    def __init__(
+        self,
+        arrays: Dict[str, np.ndarray],
+        config: None | Config = None,
+        path: None | str = None,
+    ) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): The columns of the store.
+            config (None | Config, optional): The dataset config stored along
+                with the annotations. Defaults to None.
+            path (None | str, optional): The file the store is mapped from,
+                if any. Defaults to None.
+        """
+        self.arrays = arrays
+        self.config = config
+        self.path = path
+        for name in self.STRING_TABLES:
+            setattr(
+                self,
+                name,
+                StringTable(arrays[f"{name}_data"], arrays[f"{name}_offsets"]),
+            )
+        for name, array in arrays.items():
+            if not name.endswith(("_data", "_offsets")) or name == "label_offsets":
+                setattr(self, name, array)
+
+    def __len__(self) -> int:
+        """Number of frames in the store."""
+        return len(self.label_offsets) - 1
+
+    @property
+    def num_labels(self) -> int:
+        """Total number of labels in the store."""
+        return int(self.label_offsets[-1])
+
+    def label_slice(self, idx: int) -> slice:
+        """Get the slice of label-level columns belonging to frame idx."""
+        return slice(int(self.label_offsets[idx]), int(self.label_offsets[idx + 1]))
+
+    def name(self, idx: int) -> str:
+        """Get the name of the frame at idx."""
+        return self.names[idx]
+
+    def video_name(self, idx: int) -> None | str:
+        """Get the video name of the frame at idx."""
+        video_id = self.video_ids[idx]
+        return None if video_id < 0 else self.video_names[video_id]
+
+    def url(self, idx: int) -> None | str:
+        """Get the url of the frame at idx."""
+        url = self.urls[idx]
+        return url if url else None
+
+    def frame_index(self, idx: int) -> None | int:
+        """Get the frame index of the frame at idx."""
+        frame_index = int(self.frame_indices[idx])
+        return None if frame_index < 0 else frame_index
+
+    @classmethod
+    def from_frames(
+        cls, frames: Iterable[Frame], config: None | Config = None
+    ) -> AnnotationStore:
+        """Build a store from Scalabel frames."""
+        builder = AnnotationStoreBuilder()
+        for frame in frames:
+            builder.add_frame(frame)
+        return builder.build(config)
+
+    @classmethod
+    def concatenate(
+        cls, stores: Sequence[AnnotationStore], config: None | Config = None
+    ) -> AnnotationStore:
+        """Concatenate stores holding consecutive frames of one dataset.
+
+        String table indices are remapped to merged tables and instance ids
+        are re-assigned over the whole dataset, so the result equals the store
+        built from all frames at once.
+        """
+        arrays: Dict[str, np.ndarray] = {}
+        for name, column in cls.INDEXED_TABLES.items():
+            table: Dict[str, int] = {}
+            remapped = []
+            for store in stores:
+                lookup = [
+                    table.setdefault(value, len(table))
+                    for value in getattr(store, name).tolist()
+                ]
+                # trailing -1 maps the index -1 (no value) onto itself
+                lookup_array = np.asarray(lookup + [-1], dtype=np.int32)
+                remapped.append(lookup_array[store.arrays[column]])
+            arrays[column] = np.concatenate(remapped)
+            merged = StringTable.from_strings(list(table))
+            arrays[f"{name}_data"] = merged.data
+            arrays[f"{name}_offsets"] = merged.offsets
+        for name in ("names", "urls", "rle_counts"):
+            tables = [getattr(store, name) for store in stores]
+            arrays[f"{name}_data"] = np.concatenate([t.data for t in tables])
+            arrays[f"{name}_offsets"] = _concatenate_offsets([t.offsets for t in tables])
+        arrays["label_offsets"] = _concatenate_offsets([s.label_offsets for s in stores])
+        for name in stores[0].arrays:
+            if name not in arrays and name not in ("instance_ids", "global_instance_ids"):
+                arrays[name] = np.concatenate([store.arrays[name] for store in stores])
+        arrays["instance_ids"], arrays["global_instance_ids"] = assign_instance_ids(
+            arrays["video_ids"],
+            arrays["label_offsets"],
+            arrays["label_ids"],
+            arrays["ignored"],
+        )
+        return cls(arrays, config)
+
+    def _layout(self) -> tuple[bytes, int, int]:
+        """Compute header, data start and total size of the serialized store."""
+        header: DictStrAny = {
+            "version": STORE_VERSION,
+            "config": None if self.config is None else self.config.dict(),
+            "arrays": {},
+        }
+        offset = 0
+        for name, array_ in self.arrays.items():
+            header["arrays"][name] = [array_.dtype.str, list(array_.shape), offset]
+            offset += _aligned(array_.nbytes)
+        header["nbytes"] = offset
+        header_bytes = json.dumps(header).encode("utf8")
+        data_start = _aligned(len(STORE_MAGIC) + 8 + len(header_bytes))
+        return header_bytes, data_start, data_start + offset
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the serialized store in bytes."""
+        return self._layout()[2]
+
+    def write_to(self, buffer: memoryview) -> None:
+        """Serialize the store into a writable buffer of at least nbytes."""
+        header_bytes, data_start, _ = self._layout()
+        target = np.frombuffer(buffer, dtype=np.uint8)
+        pos = len(STORE_MAGIC)
+        target[:pos] = np.frombuffer(STORE_MAGIC, dtype=np.uint8)
+        target[pos : pos + 8] = np.frombuffer(
+            len(header_bytes).to_bytes(8, "little"), dtype=np.uint8
+        )
+        target[pos + 8 : pos + 8 + len(header_bytes)] = np.frombuffer(
+            header_bytes, dtype=np.uint8
+        )
+        offset = data_start
+        for array_ in self.arrays.values():
+            data = np.ascontiguousarray(array_).reshape(-1).view(np.uint8)
+            target[offset : offset + len(data)] = data
+            offset += _aligned(len(data))
+
+    def save(self, path: str) -> None:
+        """Write the store to a single memory-mappable file."""
+        header_bytes, data_start, nbytes = self._layout()
+        with open(path, "wb") as file:
+            file.write(STORE_MAGIC)
+            file.write(len(header_bytes).to_bytes(8, "little"))
+            file.write(header_bytes)
+            file.seek(data_start)
+            for array_ in self.arrays.values():
+                file.write(np.ascontiguousarray(array_).tobytes())
+                file.seek(_aligned(file.tell() - data_start) + data_start)
+            file.truncate(nbytes)
+
+    @classmethod
+    def load(cls, path: str) -> AnnotationStore:
+        """Memory-map a store previously written with save()."""
+        return cls.from_buffer(np.memmap(path, dtype=np.uint8, mode="r"), path=path)
+
+    def to_shared_memory(self) -> SharedMemory:
+        """Serialize the store into a new shared memory segment.
+
+        The caller is responsible for closing and unlinking the segment.
+        """
+        shm = SharedMemory(create=True, size=self.nbytes)
+        self.write_to(shm.buf)
+        return shm
+
+    @classmethod
+    def from_shared_memory(cls, shm: SharedMemory) -> AnnotationStore:
+        """Map a store serialized into a shared memory segment, zero-copy."""
+        store = cls.from_buffer(np.frombuffer(shm.buf, dtype=np.uint8))
+        # keep the segment open as long as the store's arrays are alive
+        store.shm = shm
+        return store
+
+    @classmethod
+    def from_buffer(
+        cls, buffer: NDArrayU8, path: None | str = None
+    ) -> AnnotationStore:
+        """Create a store viewing the serialized store in buffer, zero-copy."""
+        source = path if path is not None else "buffer"
+        if buffer[: len(STORE_MAGIC)].tobytes() != STORE_MAGIC:
+            raise ValueError(f"{source} is not a valid annotation store.")
+        pos = len(STORE_MAGIC)
+        header_len = int.from_bytes(buffer[pos : pos + 8].tobytes(), "little")
+        header = json.loads(buffer[pos + 8 : pos + 8 + header_len].tobytes())
+        if header["version"] != STORE_VERSION:
+            raise ValueError(
+                f"Annotation store {source} has version {header['version']}, "
+                f"expected {STORE_VERSION}."
+            )
+        data_start = _aligned(pos + 8 + header_len)
+        if len(buffer) < data_start + header["nbytes"]:
+            raise ValueError(f"Annotation store {source} is truncated.")
+        arrays = {}
+        for name, (dtype, shape, offset) in header["arrays"].items():
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            nbytes = dtype.itemsize * int(np.prod(shape))
+            # plain ndarray views, so that indexing yields regular arrays
+            arrays[name] = (
+                buffer[start : start + nbytes].view(dtype).reshape(shape).view(np.ndarray)
+            )
+        config = None if header["config"] is None else Config(**header["config"])
+        return cls(arrays, config, path=path)
+
+    def __getstate__(self) -> DictStrAny:
+        """Pickle memory-mapped stores by path, so workers re-map the file."""
+        if self.path is not None:
+            return {"path": self.path}
+        return {"arrays": self.arrays, "config": self.config}
+
+    def __setstate__(self, state: DictStrAny) -> None:
+        """Restore the store, re-mapping its file if it has one."""
+        if "path" in state:
+            store = AnnotationStore.load(state["path"])
+            self.__init__(store.arrays, store.config, store.path)
+        else:
+            self.__init__(state["arrays"], state["config"])
+
+
+class _StringColumn:
+    """Growable column of strings, see StringTable."""
+
+    def __init__(self) -> None:
+        """Creates an instance of the class."""
+        self.data = bytearray()
+        self.offsets = array("q", [0])
+
+    def append(self, value: str) -> None:
+        """Append a string to the column."""
+        self.data += value.encode("utf8")
+        self.offsets.append(len(self.data))
+
+    def build(self) -> StringTable:
+        """Convert the column to a string table."""
+        return StringTable(
+            np.frombuffer(self.data, dtype=np.uint8),
+            np.frombuffer(self.offsets, dtype=np.int64),
+        )
+
+
+class AnnotationStoreBuilder:
+    """Accumulate Scalabel frames into the columns of an AnnotationStore.
+
+    Frames can be added as raw JSON dictionaries, so that annotation files can
+    be streamed into the store without ever building pydantic objects, or as
+    Scalabel Frames. All columns are kept in compact typed arrays while
+    building.
+
+    Instance ids are assigned on build, see assign_instance_ids.
+    """
+
+    def __init__(self) -> None:
+        """Creates an instance of the class."""
+        self.names = _StringColumn()
+        self.urls = _StringColumn()
+        self.video_ids = array("i")
+        self.frame_indices = array("q")
+        self.intrinsics = array("f")
+        self.has_intrinsics = array("b")
+        self.extrinsics = array("f")
+        self.has_extrinsics = array("b")
+        self.sizes = array("i")
+        self.label_offsets = array("q", [0])
+
+        self.categories = array("i")
+        self.ignored = array("b")
+        self.boxes2d = array("f")
+        self.has_box2d = array("b")
+        self.boxes3d = array("f")
+        self.has_box3d = array("b")
+        self.label_ids = array("i")
+        self.rle_counts = _StringColumn()
+        self.rle_sizes = array("i")
+        self.has_rle = array("b")
+
+        self.video_map: Dict[str, int] = {}
+        self.category_map: Dict[str, int] = {}
+        self.label_id_map: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        """Number of frames added so far."""
+        return len(self.frame_indices)
+
+    def _intern(self, table: Dict[str, int], value: None | str) -> int:
+        """Get the index of value in the given string table, -1 if None."""
+        if value is None:
+            return -1
+        if value not in table:
+            table[value] = len(table)
+        return table[value]
+
+    def add_frame(self, frame: Frame) -> None:
+        """Add a single Scalabel frame."""
+        self.add_raw_frame(frame.dict())
+
+    def add_raw_frame(self, frame: DictStrAny) -> None:
+        """Add a single frame given as raw Scalabel JSON dictionary."""
+        video_name = frame.get("videoName")
+        frame_index = frame.get("frameIndex")
+        self.names.append(str(frame["name"]))
+        self.urls.append(frame.get("url") or "")
+        self.video_ids.append(self._intern(self.video_map, video_name))
+        self.frame_indices.append(-1 if frame_index is None else frame_index)
+
+        intrinsics = frame.get("intrinsics")
+        if intrinsics is not None:
+            matrix = get_matrix_from_intrinsics(Intrinsics.construct(**intrinsics))
+            self.intrinsics.extend(matrix.ravel())
+        else:
+            self.intrinsics.extend(_ZEROS[:9])
+        self.has_intrinsics.append(intrinsics is not None)
+        extrinsics = frame.get("extrinsics")
+        if extrinsics is not None:
+            matrix = get_matrix_from_extrinsics(Extrinsics.construct(**extrinsics))
+            self.extrinsics.extend(matrix.ravel())
+        else:
+            self.extrinsics.extend(_ZEROS[:16])
+        self.has_extrinsics.append(extrinsics is not None)
+        size = frame.get("size")
+        self.sizes.extend((-1, -1) if size is None else (size["height"], size["width"]))
+
+        labels = frame.get("labels") or []
+        self.label_offsets.append(self.label_offsets[-1] + len(labels))
+        for label in labels:
+            self._add_raw_label(label)
+
+    def _add_raw_label(self, label: DictStrAny) -> None:
+        """Add a single label given as raw Scalabel JSON dictionary."""
+        attributes = label.get("attributes") or {}
+        ignored = bool(attributes.get("crowd", False)) or bool(
+            attributes.get("ignored", False)
+        )
+        self.categories.append(self._intern(self.category_map, label.get("category")))
+        self.label_ids.append(self._intern(self.label_id_map, str(label["id"])))
+        self.ignored.append(ignored)
+
+        box2d = label.get("box2d")
+        if box2d is not None:
+            # see box2d_to_xyxy
+            self.boxes2d.extend(
+                (box2d["x1"], box2d["y1"], box2d["x2"] + 1, box2d["y2"] + 1)
+            )
+        else:
+            self.boxes2d.extend(_ZEROS[:4])
+        self.has_box2d.append(box2d is not None)
+        box3d = label.get("box3d")
+        if box3d is not None:
+            self.boxes3d.extend(box3d["location"])
+            self.boxes3d.extend(box3d["dimension"])
+            self.boxes3d.extend(box3d["orientation"])
+        else:
+            self.boxes3d.extend(_ZEROS[:9])
+        self.has_box3d.append(box3d is not None)
+
+        rle = label.get("rle")
+        if rle is not None:
+            self.rle_counts.append(rle["counts"])
+            self.rle_sizes.extend(rle["size"])
+        else:
+            if label.get("poly2d") is not None:
+                raise ValueError(
+                    "Polygon masks are not supported by AnnotationStore, "
+                    "please use RLE masks."
+                )
+            self.rle_counts.append("")
+            self.rle_sizes.extend((0, 0))
+        self.has_rle.append(rle is not None)
+
+    def build(self, config: None | Config = None) -> AnnotationStore:
+        """Build the store from all frames added so far."""
+        num_frames, num_labels = len(self), len(self.categories)
+        arrays = {
+            "label_offsets": np.frombuffer(self.label_offsets, dtype=np.int64),
+            "video_ids": np.frombuffer(self.video_ids, dtype=np.int32),
+            "frame_indices": np.frombuffer(self.frame_indices, dtype=np.int64),
+            "intrinsics": _as_array(self.intrinsics, np.float32, (num_frames, 3, 3)),
+            "has_intrinsics": _as_array(self.has_intrinsics, bool, (num_frames,)),
+            "extrinsics": _as_array(self.extrinsics, np.float32, (num_frames, 4, 4)),
+            "has_extrinsics": _as_array(self.has_extrinsics, bool, (num_frames,)),
+            "sizes": _as_array(self.sizes, np.int32, (num_frames, 2)),
+            "categories": np.frombuffer(self.categories, dtype=np.int32),
+            "label_ids": np.frombuffer(self.label_ids, dtype=np.int32),
+            "ignored": _as_array(self.ignored, bool, (num_labels,)),
+            "boxes2d": _as_array(self.boxes2d, np.float32, (num_labels, 4)),
+            "has_box2d": _as_array(self.has_box2d, bool, (num_labels,)),
+            "boxes3d": _as_array(self.boxes3d, np.float32, (num_labels, 9)),
+            "has_box3d": _as_array(self.has_box3d, bool, (num_labels,)),
+            "rle_sizes": _as_array(self.rle_sizes, np.int32, (num_labels, 2)),
+            "has_rle": _as_array(self.has_rle, bool, (num_labels,)),
+        }
+        tables = {
+            "names": self.names.build(),
+            "urls": self.urls.build(),
+            "video_names": StringTable.from_strings(list(self.video_map)),
+            "category_names": StringTable.from_strings(list(self.category_map)),
+            "label_id_names": StringTable.from_strings(list(self.label_id_map)),
+            "rle_counts": self.rle_counts.build(),
+        }
+        for name, table in tables.items():
+            arrays[f"{name}_data"] = table.data
+            arrays[f"{name}_offsets"] = table.offsets
+        arrays["instance_ids"], arrays["global_instance_ids"] = assign_instance_ids(
+            arrays["video_ids"],
+            arrays["label_offsets"],
+            arrays["label_ids"],
+            arrays["ignored"],
+        )
+        return AnnotationStore(arrays, config)
+
+
+def assign_instance_ids(
+    video_ids: NDArrayI32,
+    label_offsets: NDArrayI64,
+    label_ids: NDArrayI32,
+    ignored: np.ndarray,
+) -> tuple[NDArrayI64, NDArrayI64]:
+    """Assign per-video and global instance ids to labels, vectorized.
+
+    Follows prepare_labels: within each video, instances are numbered in
+    order of first appearance of their label id among non-crowd, non-ignored
+    labels, where every frame without video counts as its own video. Global
+    ids offset each video by the number of instances in all videos whose
+    first instance appeared earlier.
+
+    Args:
+        video_ids (NDArrayI32): video index per frame, -1 if no video.
+        label_offsets (NDArrayI64): label offsets per frame, see
+            AnnotationStore.
+        label_ids (NDArrayI32): label id index per label.
+        ignored (np.ndarray): whether each label is crowd or ignored.
+
+    Returns:
+        tuple[NDArrayI64, NDArrayI64]: local and global instance id per label,
+            -1 for crowd / ignored labels.
+    """
+    local_ids = np.full(len(label_ids), -1, dtype=np.int64)
+    global_ids = np.full(len(label_ids), -1, dtype=np.int64)
+    valid = np.flatnonzero(~ignored)
+    if len(valid) == 0:
+        return local_ids, global_ids
+
+    # frames without video get unique keys after all named videos
+    num_frames = len(label_offsets) - 1
+    video_keys = np.where(
+        video_ids >= 0, video_ids, video_ids.max(initial=-1) + 1 + np.arange(num_frames)
+    ).astype(np.int64)
+    label_video_keys = np.repeat(video_keys, np.diff(label_offsets))[valid]
+    num_label_ids = int(label_ids.max()) + 1
+    keys = label_video_keys * num_label_ids + label_ids[valid]
+    instances, first_seen, inverse = np.unique(
+        keys, return_index=True, return_inverse=True
+    )
+    instance_videos = instances // num_label_ids
+
+    # sort instances by video, then by first appearance, and rank them
+    order = np.lexsort((first_seen, instance_videos))
+    sorted_videos = instance_videos[order]
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = sorted_videos[1:] != sorted_videos[:-1]
+    starts = np.flatnonzero(is_start)
+    groups = np.cumsum(is_start) - 1
+    ranks = np.arange(len(order)) - starts[groups]
+
+    # offset videos by their instance counts, in order of first appearance
+    counts = np.diff(np.append(starts, len(order)))
+    video_order = np.argsort(first_seen[order][starts], kind="stable")
+    video_offsets = np.empty(len(starts), dtype=np.int64)
+    video_offsets[video_order] = np.cumsum(counts[video_order]) - counts[video_order]
+
+    instance_local = np.empty(len(order), dtype=np.int64)
+    instance_local[order] = ranks
+    instance_global = np.empty(len(order), dtype=np.int64)
+    instance_global[order] = ranks + video_offsets[groups]
+    inverse = inverse.reshape(-1)
+    local_ids[valid] = instance_local[inverse]
+    global_ids[valid] = instance_global[inverse]
+    return local_ids, global_ids
+
+
+def _concatenate_offsets(offsets: Sequence[NDArrayI64]) -> NDArrayI64:
+    """Concatenate offset arrays (with trailing total) of consecutive chunks."""
+    merged = [np.zeros(1, dtype=np.int64)]
+    total = 0
+    for offsets_ in offsets:
+        merged.append(offsets_[1:] + total)
+        total += int(offsets_[-1])
+    return np.concatenate(merged)
+
+
+_ZEROS = (0.0,) * 16
+
+
+def _aligned(num_bytes: int) -> int:
+    """Round num_bytes up to the store's array alignment."""
+    return (num_bytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _as_array(
+    values: array, dtype: npt.DTypeLike, shape: tuple[int, ...]
+) -> np.ndarray:
+    """View a typed python array as numpy array of the given dtype and shape."""
+    array_ = np.frombuffer(values, dtype=values.typecode)
+    return array_.astype(dtype, copy=False).reshape(shape)
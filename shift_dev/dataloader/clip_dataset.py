@@ -0,0 +1,171 @@
+"""Clips of consecutive frames from the SHIFT videos."""
+from __future__ import annotations
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import torch
+from torch import Tensor
+from torch.utils.data import Dataset
+
+from shift_dev.types import DataDict, Keys, NDArrayI64
+
+from .collate import RAGGED_KEYS
+from .shift_dataset import SHIFTDataset
+
+
+def stack_frames(frames: list[DataDict]) -> DataDict:
+    """Stack the samples of consecutive frames into one clip sample.
+
+    Images and optical flows of shape [1, C, H, W] are concatenated to
+    [T, C, H, W], all other tensors of equal shape are stacked to [T, ...]. The keys in RAGGED_KEYS,
+    i.e. boxes, their classes and track ids, instance masks and point
+    clouds, are always collected in a list of length T, even if the number
+    of objects happens to be equal over the frames, and so are all values
+    that cannot be stacked.
+
+    Args:
+        frames (list[DataDict]): The samples of the frames, as returned by
+            SHIFTDataset.
+
+    Returns:
+        DataDict: The clip sample.
+    """
+    clip: DataDict = {}
+    for view, view_data in frames[0].items():
+        clip_view = {}
+        for key in view_data:
+            values = [frame[view][key] for frame in frames]
+            if (
+                key not in RAGGED_KEYS
+                and isinstance(values[0], Tensor)
+                and all(value.shape == values[0].shape for value in values)
+            ):
+                if key in (Keys.images, Keys.optical_flows):
+                    clip_view[key] = torch.cat(values)
+                else:
+                    clip_view[key] = torch.stack(values)
+            else:
+                clip_view[key] = values
+        clip[view] = clip_view
+    return clip
+
+
+class SHIFTClipDataset(Dataset):
+    """Dataset of clips of consecutive frames from a SHIFT dataset.
+
+    Each sample is a clip of clip_length frames of the same video, taken
+    every dilation frames. Clips start every stride frames of each video.
+    This is meant for the 10 fps "videos" framerate, but works with any
+    dataset whose frames belong to videos.
+
+    A clip is loaded entirely by one process, and the files of all of its
+    frames are read with a single call to get_many of the backend. With
+    prefetch, the next clip is loaded in a background thread while the
+    current one is processed, which pays off when the clips are requested in
+    order, e.g. by a sequential sampler or within a batch.
+    """
+
+    def __init__(
+        self,
+        dataset: SHIFTDataset,
+        clip_length: int,
+        stride: int = 1,
+        dilation: int = 1,
+        prefetch: bool = False,
+    ) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            dataset (SHIFTDataset): The dataset to load the frames from.
+            clip_length (int): Number of frames T per clip.
+            stride (int): Number of frames between the starts of
+                consecutive clips of a video. Default: 1.
+            dilation (int): Number of frames between consecutive frames of
+                a clip. Default: 1.
+            prefetch (bool): Whether to load the clip following each
+                requested clip in a background thread. Default: False.
+        """
+        assert clip_length > 0, f"Invalid clip_length {clip_length}."
+        assert stride > 0, f"Invalid stride {stride}."
+        assert dilation > 0, f"Invalid dilation {dilation}."
+        self.dataset = dataset
+        self.clip_length = clip_length
+        self.stride = stride
+        self.dilation = dilation
+        self.prefetch = prefetch
+        self.clips = self._get_clips()
+        self._executor: None | ThreadPoolExecutor = None
+        self._executor_pid = -1
+        self._pending: dict[int, Future[DataDict]] = {}
+
+    def _get_clips(self) -> NDArrayI64:
+        """Get the dataset indices of the frames of all clips, [K, T]."""
+        sequence_index = self.dataset.sequence_index
+        span = (self.clip_length - 1) * self.dilation
+        lengths = np.diff(sequence_index.offsets)
+        starts = [
+            np.arange(offset, offset + length - span, self.stride, dtype=np.int64)
+            for offset, length in zip(sequence_index.offsets[:-1], lengths)
+            if length > span
+        ]
+        if len(starts) == 0:
+            return np.zeros((0, self.clip_length), dtype=np.int64)
+        positions = np.concatenate(starts)[:, None] + (
+            np.arange(self.clip_length, dtype=np.int64) * self.dilation
+        )
+        return sequence_index.indices[positions]
+
+    def __len__(self) -> int:
+        """Get the number of clips."""
+        return len(self.clips)
+
+    def get_clip_indices(self, idx: int) -> list[int]:
+        """Get the dataset indices of the frames of a clip."""
+        return self.clips[idx].tolist()
+
+    def _load_clip(self, idx: int) -> DataDict:
+        """Load and stack the frames of a clip, reading their files at once."""
+        return stack_frames(self.dataset.get_samples(self.get_clip_indices(idx)))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the prefetching thread, started once per process."""
+        if self._executor is None or self._executor_pid != os.getpid():
+            # a single thread, so that the backends are never used concurrently
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._executor_pid = os.getpid()
+            self._pending = {}
+        return self._executor
+
+    def __getitem__(self, idx: int) -> DataDict:
+        """Get the clip at the given index.
+
+        Args:
+            idx (int): Index of the clip.
+
+        Returns:
+            DataDict: Clip sample, holding the same views and keys as the
+                samples of the dataset, stacked over the frames of the clip.
+        """
+        if not self.prefetch:
+            return self._load_clip(idx)
+        executor = self._get_executor()
+        future = self._pending.pop(idx, None)
+        if future is None:
+            future = executor.submit(self._load_clip, idx)
+        # drop stale prefetches, e.g. after a random access
+        for pending in self._pending.values():
+            pending.cancel()
+        self._pending.clear()
+        if idx + 1 < len(self):
+            self._pending[idx + 1] = executor.submit(self._load_clip, idx + 1)
+        return future.result()
+
+    def __getstate__(self) -> DataDict:
+        """Exclude the prefetching thread when pickling, e.g. to workers."""
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_executor_pid"] = -1
+        state["_pending"] = {}
+        return state
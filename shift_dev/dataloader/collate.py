@@ -0,0 +1,224 @@
+"""Collate SHIFT samples into batches."""
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import torch
+from torch import Tensor
+
+from shift_dev.types import DataDict, Keys
+
+# keys with a varying number of entries per sample, e.g. one per object
+RAGGED_KEYS = (
+    Keys.boxes2d,
+    Keys.boxes2d_classes,
+    Keys.boxes2d_track_ids,
+    Keys.masks,
+    Keys.boxes3d,
+    Keys.boxes3d_classes,
+    Keys.boxes3d_track_ids,
+    Keys.points3d,
+)
+
+
+class PackedTensor:
+    """Batch of tensors with a varying first dimension, packed without padding.
+
+    The tensors of the samples are concatenated along the first dimension
+    into data, and offsets[i]:offsets[i + 1] are the rows of sample i. E.g.
+    the boxes of a batch are a [N, 4] tensor of all N boxes, and the instance
+    masks are a [N, H, W] uint8 tensor, taking no more memory than the masks
+    of the samples themselves.
+    """
+
+    def __init__(self, data: Tensor, offsets: Tensor) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            data (Tensor): The concatenated tensors.
+            offsets (Tensor): Start of each sample in data, with one extra
+                trailing entry holding the total length, int64 on the CPU.
+        """
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_tensors(cls, tensors: Sequence[Tensor]) -> PackedTensor:
+        """Pack the tensors of the samples of a batch.
+
+        Args:
+            tensors (Sequence[Tensor]): The tensors, of equal shape except for
+                the first dimension.
+
+        Returns:
+            PackedTensor: The packed tensors.
+        """
+        offsets = torch.zeros(len(tensors) + 1, dtype=torch.int64)
+        torch.cumsum(
+            torch.tensor([len(t) for t in tensors], dtype=torch.int64),
+            dim=0,
+            out=offsets[1:],
+        )
+        # empty tensors may have a different number of dimensions, e.g. [0]
+        non_empty = [t for t in tensors if len(t) > 0]
+        if len(non_empty) == 0:
+            return cls(tensors[0], offsets)
+        return cls(torch.cat(non_empty), offsets)
+
+    @property
+    def counts(self) -> Tensor:
+        """Number of rows of each sample."""
+        return self.offsets[1:] - self.offsets[:-1]
+
+    def batch_indices(self) -> Tensor:
+        """Get the index of the sample of each row, on the device of data."""
+        return torch.repeat_interleave(
+            torch.arange(len(self), device=self.data.device),
+            self.counts.to(self.data.device),
+        )
+
+    def __len__(self) -> int:
+        """Number of samples."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> Tensor:
+        """Get the tensor of a sample, as a view into data."""
+        return self.data[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def split(self) -> list[Tensor]:
+        """Get the tensors of all samples, as views into data."""
+        return list(torch.split(self.data, self.counts.tolist()))
+
+    def to(self, *args, **kwargs) -> PackedTensor:  # type: ignore
+        """Move or cast data, see Tensor.to. The offsets stay on the CPU."""
+        return PackedTensor(self.data.to(*args, **kwargs), self.offsets)
+
+    def pin_memory(self) -> PackedTensor:
+        """Pin data to page-locked memory, called by DataLoader(pin_memory)."""
+        return PackedTensor(self.data.pin_memory(), self.offsets)
+
+    def __repr__(self) -> str:
+        """Representation, with the shape of data and the counts."""
+        return (
+            f"{self.__class__.__name__}(shape={tuple(self.data.shape)}, "
+            f"dtype={self.data.dtype}, counts={self.counts.tolist()})"
+        )
+
+
+def _can_pack(tensors: Sequence[Tensor]) -> bool:
+    """Check if tensors match in all but the first dimension, see PackedTensor.
+
+    Empty tensors are skipped when packing, so they may have any shape.
+    """
+    if any(tensor.dim() == 0 for tensor in tensors):
+        return False
+    shapes = {tuple(tensor.shape[1:]) for tensor in tensors if len(tensor) > 0}
+    return len(shapes) <= 1
+
+
+def _collate_values(key: str, values: list[object]) -> object:
+    """Collate the values of a key over the samples of a batch."""
+    if not isinstance(values[0], Tensor):
+        if key in RAGGED_KEYS and isinstance(values[0], list):
+            raise ValueError(
+                f"{key} holds a list per sample, use shift_clip_collate for "
+                "clip samples."
+            )
+        return values
+    if key not in RAGGED_KEYS and all(
+        value.shape == values[0].shape for value in values  # type: ignore
+    ):
+        if key in (Keys.images, Keys.optical_flows):
+            # [1, C, H, W] per sample
+            shape = tuple(values[0].shape)  # type: ignore
+            if shape[0] != 1:
+                raise ValueError(
+                    f"{key} of shape {shape} is not a single frame, use "
+                    "shift_clip_collate for clip samples."
+                )
+            return torch.cat(values)  # type: ignore
+        return torch.stack(values)  # type: ignore
+    if _can_pack(values):  # type: ignore
+        return PackedTensor.from_tensors(values)  # type: ignore
+    return values
+
+
+def shift_collate(batch: Sequence[DataDict]) -> DataDict:
+    """Collate samples of SHIFTDataset into a batch, to use as collate_fn.
+
+    The samples are nested dicts, {view: {key: value}}, and so is the batch.
+    Images and optical flows of shape [1, C, H, W] are concatenated to
+    [B, C, H, W], other tensors of equal shape, e.g. depth maps and
+    intrinsics, are stacked to [B, ...]. The keys in RAGGED_KEYS, i.e. boxes,
+    their classes and track ids, instance masks and point clouds, as well as
+    tensors whose first dimension varies over the samples, are packed into a
+    PackedTensor. Tensors that differ in other dimensions, e.g. images or
+    masks of different resolutions, and all other values, e.g. names and
+    image sizes, are collected in a list of length B.
+
+    This is for samples of single frames, use shift_clip_collate for the
+    clips of SHIFTClipDataset.
+
+    Args:
+        batch (Sequence[DataDict]): The samples, as returned by SHIFTDataset,
+            also with lazy.
+
+    Raises:
+        ValueError: If the samples are clips.
+
+    Returns:
+        DataDict: The batch.
+    """
+    collated: DataDict = {}
+    for view in batch[0]:
+        # copying loads the whole view of lazy samples
+        views = [dict(sample[view]) for sample in batch]
+        collated[view] = {
+            key: _collate_values(key, [view_data[key] for view_data in views])
+            for key in views[0]
+        }
+    return collated
+
+
+def _collate_clip_values(key: str, values: list[object]) -> object:
+    """Collate the values of a key over the clips of a batch."""
+    if key in RAGGED_KEYS and isinstance(values[0], list):
+        # frame t of clip b is entry b * T + t
+        frames = [tensor for clip in values for tensor in clip]  # type: ignore
+        if _can_pack(frames):
+            return PackedTensor.from_tensors(frames)
+        return values
+    if isinstance(values[0], Tensor) and all(
+        value.shape == values[0].shape for value in values  # type: ignore
+    ):
+        return torch.stack(values)  # type: ignore
+    return values
+
+
+def shift_clip_collate(batch: Sequence[DataDict]) -> DataDict:
+    """Collate clips of SHIFTClipDataset into a batch, to use as collate_fn.
+
+    The clips are nested dicts, {view: {key: value}}, with T frames each, and
+    so is the batch. Images and optical flows of shape [T, C, H, W] and all
+    other tensors of equal shape, e.g. depth maps of shape [T, 1, H, W], are
+    stacked to [B, T, ...]. The keys in RAGGED_KEYS, lists of T tensors per
+    clip, are packed into one PackedTensor of B * T frames, where frame t of
+    clip b is entry b * T + t, unless they differ in other than the first
+    dimension, e.g. masks of different resolutions. These and all other
+    values, e.g. the names of the frames, are collected in a list of
+    length B.
+
+    Args:
+        batch (Sequence[DataDict]): The clips, as returned by SHIFTClipDataset.
+
+    Returns:
+        DataDict: The batch.
+    """
+    collated: DataDict = {}
+    for view in batch[0]:
+        views = [sample[view] for sample in batch]
+        collated[view] = {
+            key: _collate_clip_values(key, [view_data[key] for view_data in views])
+            for key in views[0]
+        }
+    return collated
@@ -0,0 +1,184 @@
+"""Samplers that keep the frames of a video together."""
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+from shift_dev.types import NDArrayI64
+from shift_dev.utils import setup_logger
+
+from .base.sequence import SequenceIndex
+
+logger = setup_logger()
+
+
+class VideoSampler(Sampler[int]):
+    """Sampler that shuffles videos and frames only within bounded windows.
+
+    The videos are shuffled, and the frames of each video follow in temporal
+    order, so that consecutive samples are read from the same video folder
+    of the archives, e.g. img.zip and depth.zip, which keeps the page cache
+    and the read-ahead of HDDs and network storage effective. The stream of
+    frames is then shuffled within windows of window_size consecutive
+    samples, which spans at most a few videos at a time.
+
+    For distributed training, the videos are assigned to the ranks, balancing
+    the number of frames of each rank, so that every video is read by one
+    rank only. All ranks compute the same assignment from seed and epoch;
+    call set_epoch at the start of each epoch to reshuffle. Ranks with fewer
+    frames repeat some of their frames, so that every rank yields the same
+    number of samples, or, with drop_last, ranks with more frames skip some.
+    Frames that do not belong to a video are treated as videos of one frame.
+    With fewer videos than ranks, the longest videos are split into chunks of
+    consecutive frames, so that every rank gets frames.
+    """
+
+    def __init__(
+        self,
+        dataset: object,
+        num_replicas: None | int = None,
+        rank: None | int = None,
+        shuffle: bool = True,
+        window_size: int = 32,
+        seed: int = 0,
+        drop_last: bool = False,
+    ) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            dataset (object): The dataset, e.g. SHIFTDataset, with a
+                sequence_index, or the SequenceIndex itself.
+            num_replicas (None | int): Number of ranks. Defaults to the
+                world size of torch.distributed if initialized, otherwise 1.
+            rank (None | int): Rank of this process. Defaults to the rank of
+                torch.distributed if initialized, otherwise 0.
+            shuffle (bool): Whether to shuffle the videos and the frames
+                within windows. If False, the videos and their frames are
+                sampled in order. Defaults to True.
+            window_size (int): Number of consecutive samples shuffled among
+                each other, 1 to keep the frames of each video in temporal
+                order. Defaults to 32.
+            seed (int): Random seed, the same on all ranks. Defaults to 0.
+            drop_last (bool): Whether to skip frames of the ranks with more
+                frames instead of repeating frames of the other ranks.
+                Defaults to False.
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_initialized() else 0
+        assert 0 <= rank < num_replicas, f"Invalid rank {rank}."
+        assert window_size > 0, "window_size must be positive."
+        if isinstance(dataset, SequenceIndex):
+            sequence_index = dataset
+        else:
+            sequence_index = dataset.sequence_index  # type: ignore
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.window_size = window_size
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+        # the frames of each video as one slice of indices, frames without
+        # video appended as videos of one frame
+        no_video = np.flatnonzero(sequence_index.video_ids < 0)
+        self.indices: NDArrayI64 = np.concatenate([sequence_index.indices, no_video])
+        self.offsets: NDArrayI64 = np.concatenate(
+            [
+                sequence_index.offsets,
+                sequence_index.offsets[-1] + np.arange(1, len(no_video) + 1),
+            ]
+        )
+        if len(self.offsets) - 1 < num_replicas:
+            logger.warning(
+                f"Only {len(self.offsets) - 1} videos for {num_replicas} ranks, "
+                "splitting videos into chunks of frames."
+            )
+            self.offsets = _split_videos(self.offsets, num_replicas)
+            if drop_last and len(self.offsets) - 1 < num_replicas:
+                raise ValueError(
+                    f"Only {len(self.indices)} frames for {num_replicas} ranks, "
+                    "every rank would yield no samples with drop_last."
+                )
+        self._rank_indices: None | NDArrayI64 = None
+        self._num_samples = 0
+        self._plan(self.epoch)
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch, which seeds the shuffling together with seed."""
+        self.epoch = epoch
+        self._plan(epoch)
+
+    def _plan(self, epoch: int) -> None:
+        """Assign the videos to the ranks and order the frames of this rank."""
+        rng = np.random.default_rng((self.seed, epoch))
+        num_videos = len(self.offsets) - 1
+        if self.shuffle:
+            videos = rng.permutation(num_videos)
+        else:
+            videos = np.arange(num_videos)
+        lengths = np.diff(self.offsets)
+
+        # assign each video to the rank with the fewest frames so far
+        counts = np.zeros(self.num_replicas, dtype=np.int64)
+        rank_videos: list[list[int]] = [[] for _ in range(self.num_replicas)]
+        for video in videos.tolist():
+            rank = int(np.argmin(counts))
+            rank_videos[rank].append(video)
+            counts[rank] += lengths[video]
+
+        own = rank_videos[self.rank]
+        if len(own) > 0:
+            indices = np.concatenate(
+                [self.indices[self.offsets[v] : self.offsets[v + 1]] for v in own]
+            )
+        else:
+            indices = np.empty(0, dtype=np.int64)
+        if self.shuffle and self.window_size > 1:
+            # sort by window, then randomly within each window
+            rng = np.random.default_rng((self.seed, epoch, self.rank))
+            windows = np.arange(len(indices)) // self.window_size
+            indices = indices[np.lexsort((rng.random(len(indices)), windows))]
+
+        num_samples = int(counts.min() if self.drop_last else counts.max())
+        if len(indices) < num_samples:
+            # repeat frames of this rank, or any if it has no videos
+            source = indices if len(indices) > 0 else self.indices
+            indices = np.resize(source, num_samples)
+        self._rank_indices = indices[:num_samples]
+        self._num_samples = num_samples
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over the dataset indices of this rank."""
+        assert self._rank_indices is not None
+        return iter(self._rank_indices.tolist())
+
+    def __len__(self) -> int:
+        """Number of samples of this rank, the same on all ranks."""
+        return self._num_samples
+
+
+def _split_videos(offsets: NDArrayI64, num_chunks: int) -> NDArrayI64:
+    """Split the longest videos in halves until there are num_chunks videos.
+
+    Args:
+        offsets (NDArrayI64): Offsets of the frames of each video.
+        num_chunks (int): Number of videos to split into, fewer if there are
+            fewer frames.
+
+    Returns:
+        NDArrayI64: Offsets of the frames of each chunk.
+    """
+    bounds = offsets.tolist()
+    while len(bounds) - 1 < num_chunks:
+        lengths = np.diff(bounds)
+        longest = int(np.argmax(lengths))
+        if lengths[longest] < 2:
+            break
+        bounds.insert(longest + 1, bounds[longest] + int(lengths[longest]) // 2)
+    return np.asarray(bounds, dtype=np.int64)
@@ -3,10 +3,13 @@ from __future__ import annotations
 
 import json
 import os
-from collections.abc import Sequence
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 import multiprocessing
 from io import BytesIO
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
 import torch
@@ -14,21 +17,36 @@ from tqdm import tqdm
 from scalabel.label.io import parse
 from scalabel.label.typing import Config
 from scalabel.label.typing import Dataset as ScalabelData
+from scalabel.label.typing import Frame
 from torch import Tensor
 from torch.utils.data import Dataset
 
-from shift_dev.types import DataDict, Keys
+from shift_dev.types import DataDict, DictStrAny, Keys, NDArrayI64
 from shift_dev.utils import setup_logger
 from shift_dev.utils.backend import DataBackend, HDF5Backend, ZipBackend
-from shift_dev.utils.load import im_decode, ply_decode
-
-from .base import Scalabel
+from shift_dev.utils.cached_backend import CachedBackend
+from shift_dev.utils.decoded import DecodedArray
+from shift_dev.utils.json_stream import index_json_array, iter_scalabel_json
+from shift_dev.utils.load import (
+    depth_8bit_decode,
+    depth_decode,
+    depth_to_meters,
+    im_decode,
+    ply_decode,
+)
+
+from .base import AnnotationStore, Scalabel
+from .base.lazy import LazyDict
+from .base.sequence import SequenceIndex
+from .base.store import AnnotationStoreBuilder
 
 logger = setup_logger()
 
 
 def _get_extension(backend: DataBackend):
     """Get the appropriate file extension for the given backend."""
+    if isinstance(backend, CachedBackend):
+        backend = backend.backend
     if isinstance(backend, HDF5Backend):
         return ".hdf5"
     if isinstance(backend, ZipBackend):
@@ -36,6 +54,47 @@ def _get_extension(backend: DataBackend):
     return ""
 
 
+def _split_spans(spans: NDArrayI64, num_chunks: int) -> list[NDArrayI64]:
+    """Split byte spans into consecutive chunks of about equal byte size."""
+    if len(spans) == 0:
+        return []
+    sizes = np.cumsum(spans[:, 1] - spans[:, 0])
+    bounds = np.searchsorted(
+        sizes, np.linspace(0, sizes[-1], num_chunks + 1)[1:-1], side="right"
+    )
+    return [chunk for chunk in np.split(spans, bounds) if len(chunk) > 0]
+
+
+def _read_spans(filepath: str, spans: NDArrayI64) -> list[DictStrAny]:
+    """Read and decode the JSON values at the given consecutive byte spans."""
+    start = int(spans[0, 0])
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        text = file.read(int(spans[-1, 1]) - start)
+    return [json.loads(text[a - start : b - start]) for a, b in spans.tolist()]
+
+
+def _parse_frames(task: tuple[str, NDArrayI64]) -> list[Frame]:
+    """Parse the Scalabel frames at the given byte spans of a file."""
+    return [parse(frame, validate_frames=False) for frame in _read_spans(*task)]
+
+
+def _build_store_chunk(task: tuple[str, NDArrayI64]) -> str:
+    """Build an annotation store from the frames at the given byte spans.
+
+    The store is written to a new shared memory segment, whose name is
+    returned. The caller takes ownership of the segment and must unlink it.
+    """
+    builder = AnnotationStoreBuilder()
+    for frame in _read_spans(*task):
+        builder.add_raw_frame(frame)
+    shm = builder.build().to_shared_memory()
+    # hand the segment over to the caller, so it survives this worker
+    resource_tracker.unregister(shm._name, "shared_memory")  # pylint: disable=protected-access
+    shm.close()
+    return shm.name
+
+
 class _SHIFTScalabelLabels(Scalabel):
     """Helper class for labels in SHIFT that are stored in Scalabel format."""
 
@@ -61,6 +120,7 @@ class _SHIFTScalabelLabels(Scalabel):
         backend: DataBackend = HDF5Backend(),
         verbose: bool = False,
         num_workers: int = 1,
+        use_cache: bool = True,
         **kwargs,
     ) -> None:
         """Initialize SHIFT dataset for one view.
@@ -73,6 +133,8 @@ class _SHIFTScalabelLabels(Scalabel):
             view (str): Which view to load. Default: "front".
             backend (DataBackend): Backend to use for loading data. Default:
                 HDF5Backend().
+            use_cache (bool): Whether to cache the parsed annotations on disk,
+                see Scalabel. Default: True.
         """
         self.verbose = verbose
         self.num_workers = num_workers
@@ -98,7 +160,13 @@ class _SHIFTScalabelLabels(Scalabel):
             data_path = os.path.join(
                 data_root, "discrete", framerate, split, view, f"{data_file}{ext}"
             )
-        super().__init__(data_path, annotation_path, data_backend=backend, **kwargs)
+        super().__init__(
+            data_path,
+            annotation_path,
+            data_backend=backend,
+            use_cache=use_cache,
+            **kwargs,
+        )
 
     def _generate_mapping(self) -> ScalabelData:
         """Generate data mapping."""
@@ -107,53 +175,97 @@ class _SHIFTScalabelLabels(Scalabel):
             logger.info(f"Loading annotation from '{self.annotation_path}' ...")
         return self._load(self.annotation_path)
 
-    def _load(self, filepath: str) -> ScalabelData:
-        """Load labels from a json file or a folder of json files."""
-        raw_frames: List[DictStrAny] = []
-        raw_groups: List[DictStrAny] = []
+    def _generate_store(
+        self, generate_map_func: Callable[[], ScalabelData]
+    ) -> AnnotationStore:
+        """Stream the annotation file directly into an annotation store.
+
+        The frames are converted one by one from their JSON representation,
+        so neither the whole JSON tree nor the Scalabel frames are held in
+        memory at any time. With num_workers > 1, the file is split into
+        byte ranges of consecutive frames, which are converted by a pool of
+        workers into stores returned via shared memory and merged in order.
+        """
+        if self.verbose:
+            logger.info(f"Loading annotation from '{self.annotation_path}' ...")
+        self._check_annotation_path(self.annotation_path)
+        if self.num_workers > 1:
+            store = self._generate_store_parallel()
+        else:
+            builder = AnnotationStoreBuilder()
+            config = None
+            for key, value in iter_scalabel_json(self.annotation_path):
+                if key == "frames":
+                    builder.add_raw_frame(value)
+                elif key == "config" and value is not None:
+                    config = Config(**value)
+            store = builder.build(config)
+        if self.verbose:
+            logger.info(f"Loading annotation from '{self.annotation_path}' Done.")
+        return store
+
+    def _generate_store_parallel(self) -> AnnotationStore:
+        """Build the annotation store from byte ranges of the file in parallel."""
+        spans, rest = index_json_array(self.annotation_path)
+        config = None
+        if rest.get("config") is not None:
+            config = Config(**rest["config"])
+        chunks = _split_spans(spans, self.num_workers * 4)
+        tasks = [(self.annotation_path, chunk) for chunk in chunks]
+        segments: list[SharedMemory] = []
+        try:
+            stores = []
+            with multiprocessing.Pool(self.num_workers) as pool:
+                with tqdm(total=len(spans)) as pbar:
+                    for chunk, name in zip(chunks, pool.imap(_build_store_chunk, tasks)):
+                        segments.append(SharedMemory(name=name))
+                        stores.append(AnnotationStore.from_shared_memory(segments[-1]))
+                        pbar.update(len(chunk))
+            store = AnnotationStore.concatenate(stores, config)
+            # release the views into the segments before closing them
+            del stores
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+        return store
+
+    @staticmethod
+    def _check_annotation_path(filepath: str) -> None:
+        """Check that the annotation path points to a JSON file."""
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"{filepath} does not exist.")
+        if not (os.path.isfile(filepath) and filepath.endswith("json")):
+            raise TypeError("Inputs must be a folder or a JSON file.")
 
-        def process_file(filepath: str) -> Optional[DictStrAny]:
-            raw_cfg = None
-            with open(filepath, mode="r", encoding="utf-8") as fp:
-                content = json.load(fp)
-            if isinstance(content, dict):
-                raw_frames.extend(content["frames"])
-                if "groups" in content and content["groups"] is not None:
-                    raw_groups.extend(content["groups"])
-                if "config" in content and content["config"] is not None:
-                    raw_cfg = content["config"]
-            elif isinstance(content, list):
-                raw_frames.extend(content)
-            else:
-                raise TypeError("The input file contains neither dict nor list.")
-            if self.verbose:
-                logger.info(f"Loading annotation from '{filepath}' Done.")
-            return raw_cfg
-
+    def _load(self, filepath: str) -> ScalabelData:
+        """Load labels from a json file."""
+        self._check_annotation_path(filepath)
+        frames: list[Frame] = []
         cfg = None
-        if os.path.isfile(filepath) and filepath.endswith("json"):
-            ret_cfg = process_file(filepath)
-            if ret_cfg is not None:
-                cfg = ret_cfg
+        if self.num_workers > 1:
+            spans, rest = index_json_array(filepath)
+            cfg = rest.get("config")
+            chunks = _split_spans(spans, self.num_workers * 4)
+            tasks = [(filepath, chunk) for chunk in chunks]
+            with multiprocessing.Pool(self.num_workers) as pool:
+                with tqdm(total=len(spans)) as pbar:
+                    for result in pool.imap(_parse_frames, tasks):
+                        frames.extend(result)
+                        pbar.update(len(result))
         else:
-            raise TypeError("Inputs must be a folder or a JSON file.")
+            parse_ = partial(parse, validate_frames=False)
+            for key, value in iter_scalabel_json(filepath):
+                if key == "frames":
+                    frames.append(parse_(value))
+                elif key == "config" and value is not None:
+                    cfg = value
+        if self.verbose:
+            logger.info(f"Loading annotation from '{filepath}' Done.")
 
         config = None
         if cfg is not None:
             config = Config(**cfg)
-
-        parse_ = partial(parse, validate_frames=False)
-        if self.num_workers > 1:
-            with multiprocessing.Pool(self.num_workers) as pool:
-                frames = []
-                with tqdm(total=len(raw_frames)) as pbar:
-                    for result in pool.imap_unordered(parse_, raw_frames, chunksize=1000):
-                        frames.append(result)
-                        pbar.update()
-        else:
-            frames = list(map(parse_, raw_frames))
         return ScalabelData(frames=frames, config=config)
 
 
@@ -239,6 +351,27 @@ class SHIFTDataset(Dataset):
 
     GROUPS_IN_SCALABEL = ["det_2d", "det_3d", "det_insseg_2d"]
 
+    # keys of the frames rather than their labels, loaded once per view
+    FRAME_KEYS = [
+        Keys.images,
+        Keys.original_hw,
+        Keys.input_hw,
+        Keys.intrinsics,
+        Keys.extrinsics,
+        Keys.timestamp,
+        Keys.axis_mode,
+    ]
+
+    # data groups that can be pre-decoded, see shift_dev.io.to_decoded
+    DECODED_GROUPS = ["img", "semseg", "depth", "depth_8bit"]
+
+    # keys stored as one file per frame: (data group, file extension)
+    DENSE_KEYS = {
+        Keys.segmentation_masks: ("semseg", "png"),
+        Keys.depth_maps: ("depth", "png"),
+        Keys.optical_flows: ("flow", "npz"),
+    }
+
     def __init__(
         self,
         data_root: str,
@@ -250,8 +383,86 @@ class SHIFTDataset(Dataset):
         backend: DataBackend = HDF5Backend(),
         num_workers: int = 1,
         verbose: bool = False,
+        use_store: bool = True,
+        use_cache: bool = True,
+        node_local_cache: bool = False,
+        use_decoded: bool = False,
+        image_dtype: torch.dtype = torch.float32,
+        image_channels_last: bool = False,
+        image_scale: int = 1,
+        image_decoder: str = "pil",
+        depth_group: str = "depth",
+        max_depth: float = 1000.0,
+        depth_raw: bool = False,
+        mask_format: str = "bitmask",
+        lazy: bool = False,
+        num_threads: int = 1,
     ) -> None:
-        """Initialize SHIFT dataset."""
+        """Initialize SHIFT dataset.
+
+        Args:
+            use_store (bool): Whether to hold the Scalabel annotations in a
+                columnar AnnotationStore, which makes per-sample annotation
+                access a matter of array slicing. Default: True.
+            use_cache (bool): Whether to cache the parsed annotations on disk.
+                The cache directory defaults to the user cache directory and
+                can be set via the SHIFT_CACHE_DIR environment variable.
+                Default: True.
+            node_local_cache (bool): Whether to keep the annotation cache in
+                memory, in /dev/shm, shared by all processes of a node. With
+                distributed training, e.g. launched by torchrun, only the
+                process of local rank 0 parses the annotations, while the
+                other ranks wait for its cache and memory-map it, so that
+                neither the startup time nor the memory of the annotations
+                grow with the number of GPUs. The other ranks wait for at
+                most SHIFT_CACHE_TIMEOUT seconds, one hour by default, and
+                fail as soon as local rank 0 does. Requires use_cache and is
+                meant for use_store. Default: False.
+            use_decoded (bool): Whether to load images, semantic
+                segmentation and depth from their pre-decoded arrays where
+                available, see shift_dev.io.to_decoded. Default: False.
+            image_dtype (torch.dtype): Type of the loaded images. Loading
+                torch.uint8 images cuts the memory of the samples sent from
+                the workers to the main process by a factor of 4, leaving
+                the normalization to be done on the device. Default:
+                torch.float32.
+            image_channels_last (bool): Whether to load the images in
+                channels last memory format, which avoids a copy when
+                decoding. Default: False.
+            image_scale (int): Factor to downscale the images by while
+                decoding, one of 1, 2, 4 or 8, e.g. 2 for a resolution of
+                640x400. This makes decoding cheaper, but the annotations and
+                dense maps stay at the full resolution, original_hw. The
+                pre-decoded images are not used when downscaling. Default: 1.
+            image_decoder (str): The image decoder, "pil", "cv2",
+                "simplejpeg" if installed, or "auto", see rgb_decode.
+                Default: "pil".
+            depth_group (str): The data group to load the depth maps from,
+                "depth" for 24 bit or "depth_8bit" for 8 bit depth. Default:
+                "depth".
+            max_depth (float): The depth in meters of the largest integer
+                depth, see depth_to_meters. Default: 1000.0.
+            depth_raw (bool): Whether to load the integer depth instead of
+                the depth in meters, as int32 for 24 bit and uint8 for 8 bit
+                depth. Default: False.
+            mask_format (str): Format of the instance masks, "bitmask" for
+                [N, H, W] uint8 tensors, or "rle" and "cropped" for masks
+                kept as RLE or cropped to their bounding boxes, which take a
+                fraction of the memory and are decoded or pasted into the
+                image on demand, see RLEMasks and CroppedMasks. Default:
+                "bitmask".
+            lazy (bool): Whether to load the data of a sample per view and
+                key on first access, see LazyDict, instead of all keys to
+                load at once. Pipelines that use only some keys of a sample,
+                e.g. with modality dropout, then skip loading the others.
+                Default: False.
+            num_threads (int): Number of threads decoding the views and
+                modalities of a sample in parallel. The files of a sample are
+                still read at once by the calling thread, as the backends
+                are not thread-safe, while the decoding mostly releases the
+                GIL. This lets fewer DataLoader workers keep up. Not used for
+                lazy samples. Default: 1.
+        """
         # Validate input
         assert split in {"train", "val", "test"}, f"Invalid split '{split}'."
         assert framerate in {"images", "videos"}, f"Invalid framerate '{framerate}'. Must be 'images' or 'videos'."
@@ -259,6 +470,9 @@ class SHIFTDataset(Dataset):
             f"Invalid shift_type '{shift_type}'. Must be one of 'discrete', 'continuous/1x', 'continuous/10x', "
             "or 'continuous/100x'."
         )
+        assert depth_group in {"depth", "depth_8bit"}, f"Invalid depth_group '{depth_group}'."
+        assert max_depth > 0, "Max depth value must be greater than 0."
+        assert num_threads > 0, f"Invalid num_threads {num_threads}."
         self.validate_keys(keys_to_load)
 
         # Set attributes
@@ -270,6 +484,17 @@ class SHIFTDataset(Dataset):
         self.shift_type = shift_type
         self.backend = backend
         self.verbose = verbose
+        self.image_dtype = image_dtype
+        self.image_channels_last = image_channels_last
+        self.image_scale = image_scale
+        self.max_depth = max_depth
+        self.depth_raw = depth_raw
+        self.lazy = lazy
+        self.num_threads = num_threads
+        self._executor: None | ThreadPoolExecutor = None
+        self._executor_pid = -1
+        self.dense_keys = dict(self.DENSE_KEYS)
+        self.dense_keys[Keys.depth_maps] = (depth_group, "png")
         self.ext = _get_extension(backend)
         if self.shift_type.startswith("continuous"):
             shift_speed = self.shift_type.split("/")[-1]
@@ -291,6 +516,19 @@ class SHIFTDataset(Dataset):
                 "loaded to load any other data group."
             )
 
+        # pre-decoded data groups, by view and data group
+        self.decoded_arrays: dict[tuple[str, str], DecodedArray] = {}
+        if use_decoded:
+            for view in self.views_to_load:
+                for group in self.DECODED_GROUPS:
+                    if group == "img" and image_scale > 1:
+                        continue
+                    path = os.path.join(self.annotation_base, view, f"{group}{self.ext}")
+                    if DecodedArray.exists(path):
+                        self.decoded_arrays[(view, group)] = DecodedArray(path)
+            if self.verbose:
+                logger.info(f"Decoded data groups: {list(self.decoded_arrays)}")
+
         self.scalabel_datasets = {}
         for view in self.views_to_load:
             if view == "center":
@@ -307,17 +545,32 @@ class SHIFTDataset(Dataset):
                     backend=backend,
                     num_workers=num_workers,
                     verbose=verbose,
+                    use_store=use_store,
+                    use_cache=use_cache,
+                    node_local_cache=node_local_cache,
+                    image_dtype=image_dtype,
+                    image_channels_last=image_channels_last,
+                    image_scale=image_scale,
+                    image_decoder=image_decoder,
+                    mask_format=mask_format,
                 )
             else:
                 # Skip the lidar data group, which is loaded separately
-                image_loaded = False
                 for group in self._data_groups_to_load:
                     name = f"{view}/{group}"
-                    keys_to_load = list(self.DATA_GROUPS[group])
-                    # Load the image data group only once
-                    if not image_loaded:
-                        keys_to_load.extend(self.DATA_GROUPS["img"])
-                        image_loaded = True
+                    if group == "det_2d":
+                        # the frame-level data of the view is loaded only
+                        # once, with det_2d, which holds the frames' metadata
+                        keys_to_load = [
+                            *self.DATA_GROUPS["det_2d"],
+                            *self.DATA_GROUPS["img"],
+                        ]
+                    else:
+                        keys_to_load = [
+                            key
+                            for key in self.DATA_GROUPS[group]
+                            if key not in self.FRAME_KEYS
+                        ]
                     self.scalabel_datasets[name] = _SHIFTScalabelLabels(
                         data_root=self.data_root,
                         split=self.split,
@@ -330,7 +583,16 @@ class SHIFTDataset(Dataset):
                         backend=backend,
                         num_workers=num_workers,
                         verbose=verbose,
+                        use_store=use_store,
+                        use_cache=use_cache,
+                        node_local_cache=node_local_cache,
+                        image_dtype=image_dtype,
+                        image_channels_last=image_channels_last,
+                        image_scale=image_scale,
+                        image_decoder=image_decoder,
+                        mask_format=mask_format,
                     )
+        self._frame_indices = self._align_frames()
 
     def validate_keys(self, keys_to_load: Sequence[str]) -> None:
         """Validate that all keys to load are supported."""
@@ -346,55 +608,134 @@ class SHIFTDataset(Dataset):
                 # If the data group is loaded by Scalabel, add it to the list
                 if any(key in group_keys for key in keys_to_load):
                     data_groups.append(data_group)
-        return list(set(data_groups))
+        return data_groups
 
-    def _load(
+    def _align_frames(self) -> dict[str, NDArrayI64]:
+        """Align the frames of all Scalabel datasets to the dataset indices.
+
+        The dataset indices are those of the first Scalabel dataset. The
+        frames of the others are joined to them by video name and frame
+        number, so that their annotation files may list the frames in any
+        order.
+
+        Raises:
+            ValueError: If a frame is missing from a Scalabel dataset.
+
+        Returns:
+            dict[str, NDArrayI64]: The frame index in each Scalabel dataset of
+                each dataset index, omitted for datasets in the same order.
+        """
+        def frame_numbers(dataset: Scalabel) -> list[tuple[None | str, str]]:
+            return [
+                (video, frame.split("_")[0]) for video, frame in dataset.get_frame_keys()
+            ]
+
+        names = list(self.scalabel_datasets)
+        if len(names) < 2:
+            return {}
+        reference = frame_numbers(self.scalabel_datasets[names[0]])
+        frame_indices = {}
+        for name in names[1:]:
+            dataset = self.scalabel_datasets[name]
+            frames = frame_numbers(dataset)
+            if frames == reference:
+                continue
+            positions = {frame: i for i, frame in enumerate(frames)}
+            missing = [frame for frame in reference if frame not in positions]
+            if len(missing) > 0:
+                raise ValueError(
+                    f"{len(missing)} frames, e.g. {missing[0]}, not found in "
+                    f"{dataset.annotation_path}."
+                )
+            frame_indices[name] = np.asarray(
+                [positions[frame] for frame in reference], dtype=np.int64
+            )
+        return frame_indices
+
+    def _get_frame_index(self, name: str, idx: int) -> int:
+        """Get the frame index in a Scalabel dataset of a dataset index."""
+        frame_indices = self._frame_indices.get(name)
+        return idx if frame_indices is None else int(frame_indices[idx])
+
+    def _get_filepath(
         self, view: str, data_group: str, file_ext: str, video: str, frame: str
-    ) -> Tensor:
-        """Load data from the given data group."""
+    ) -> str:
+        """Get the path of a frame's file of the given data group."""
         frame_number = frame.split("_")[0]
-        filepath = os.path.join(
+        return os.path.join(
             self.annotation_base,
             view,
             f"{data_group}{self.ext}",
             video,
             f"{frame_number}_{data_group}_{view}.{file_ext}",
         )
+
+    def _load(
+        self, view: str, data_group: str, file_ext: str, video: str, frame: str
+    ) -> Tensor:
+        """Load data from the given data group."""
+        filepath = self._get_filepath(view, data_group, file_ext, video, frame)
+        return self._decode(data_group, self.backend.get(filepath))
+
+    def _decode(self, data_group: str, content: bytes) -> Tensor:
+        """Decode the file content of the given data group."""
         if data_group == "semseg":
-            return self._load_semseg(filepath)
+            return self._decode_semseg(content)
         if data_group == "depth":
-            return self._load_depth(filepath)
+            return self._decode_depth(content)
+        if data_group == "depth_8bit":
+            return self._depth_to_tensor(depth_8bit_decode(content))
         if data_group == "flow":
-            return self._load_flow(filepath)
+            return self._decode_flow(content)
         raise ValueError(f"Invalid data group '{data_group}'")
 
-    def _load_semseg(self, filepath: str) -> Tensor:
-        """Load semantic segmentation data."""
-        im_bytes = self.backend.get(filepath)
+    def _decode_semseg(self, im_bytes: bytes) -> Tensor:
+        """Decode semantic segmentation data."""
         image = im_decode(im_bytes)[..., 0]
         return torch.as_tensor(image, dtype=torch.int64).unsqueeze(0)
 
-    def _load_depth(self, filepath: str, max_depth: float = 1000.0) -> Tensor:
-        """Load depth data."""
-        assert max_depth > 0, "Max depth value must be greater than 0."
+    def _decode_depth(self, im_bytes: bytes) -> Tensor:
+        """Decode depth data."""
+        return self._depth_to_tensor(depth_decode(im_bytes))
+
+    def _depth_to_tensor(self, depth: np.ndarray) -> Tensor:
+        """Convert integer depth to a tensor, in meters unless depth_raw."""
+        if self.depth_raw:
+            if depth.dtype == np.uint32:
+                # 24 bit values, int32 is supported by all torch versions
+                depth = depth.view(np.int32)
+            return torch.from_numpy(depth).unsqueeze(0)
+        return torch.from_numpy(depth_to_meters(depth, self.max_depth)).unsqueeze(0)
+
+    def _from_decoded(
+        self, data_group: str, array: np.ndarray, max_depth: float
+    ) -> Tensor:
+        """Convert pre-decoded data of the given data group to a tensor.
+
+        Depth decoded in meters is rescaled from the maximum depth it was
+        decoded with, max_depth, to the one of the dataset.
+        """
+        if data_group == "img":
+            # a view of the decoded array, unless converted
+            image = torch.from_numpy(array).unsqueeze(0)
+            if self.image_channels_last:
+                return image.to(self.image_dtype, memory_format=torch.channels_last)
+            return image.to(self.image_dtype)
+        if data_group == "semseg":
+            return torch.from_numpy(array).unsqueeze(0).to(torch.int64)
+        if data_group in {"depth", "depth_8bit"}:
+            if array.dtype != np.float16:
+                return self._depth_to_tensor(array)
+            if self.depth_raw:
+                raise ValueError("The depth has been decoded in meters, not raw.")
+            depth = array.astype(np.float32)
+            if max_depth != self.max_depth:
+                depth *= np.float32(self.max_depth / max_depth)
+            return torch.from_numpy(depth).unsqueeze(0)
+        raise ValueError(f"Invalid data group '{data_group}'")
 
-        im_bytes = self.backend.get(filepath)
-        image = im_decode(im_bytes)
-        if image.shape[2] > 3:  # pragma: no cover
-            image = image[:, :, :3]
-        image = image.astype(np.float32)
-
-        # Convert to depth
-        depth = image[:, :, 2] * 256 * 256 + image[:, :, 1] * 256 + image[:, :, 0]
-        depth /= 16777216.0  # 256 ** 3
-        return torch.as_tensor(
-            np.ascontiguousarray(depth * max_depth),
-            dtype=torch.float32,
-        ).unsqueeze(0)
-
-    def _load_flow(self, filepath: str) -> Tensor:
-        """Load optical flow data."""
-        im_bytes = self.backend.get(filepath)
+    def _decode_flow(self, im_bytes: bytes) -> Tensor:
+        """Decode optical flow data."""
         flow = np.load(BytesIO(im_bytes))
         return (
             torch.as_tensor(flow["flow"], dtype=torch.float32)
@@ -411,10 +752,9 @@ class SHIFTDataset(Dataset):
     def _get_frame_key(self, idx: int) -> tuple[str, str]:
         """Get the frame identifier (video name, frame name) by index."""
         if len(self.scalabel_datasets) > 0:
-            frames = self.scalabel_datasets[
+            return self.scalabel_datasets[
                 list(self.scalabel_datasets.keys())[0]
-            ].frames
-            return frames[idx].videoName, frames[idx].name
+            ].get_frame_key(idx)
         raise ValueError("No Scalabel file has been loaded.")
 
     def __len__(self) -> int:
@@ -423,6 +763,70 @@ class SHIFTDataset(Dataset):
             return len(self.scalabel_datasets[list(self.scalabel_datasets.keys())[0]])
         raise ValueError("No Scalabel file has been loaded.")
 
+    def _get_sources(self, idx: int) -> dict[str, tuple[list[str], dict[str, str]]]:
+        """Get the Scalabel datasets and dense files to load of each view."""
+        video_name, frame_name = self._get_frame_key(idx)
+        sources = {}
+        for view in self.views_to_load:
+            if view == "center":
+                # Lidar is only available in the center view
+                names = ["center/lidar"] if Keys.points3d in self.keys_to_load else []
+                dense_paths = {}
+            else:
+                names = [f"{view}/{group}" for group in self._data_groups_to_load]
+                dense_paths = {
+                    key: self._get_filepath(view, group, ext, video_name, frame_name)
+                    for key, (group, ext) in self.dense_keys.items()
+                    if key in self.keys_to_load
+                }
+            sources[view] = (names, dense_paths)
+        return sources
+
+    def _get_decoded(self, view: str, data_group: str, path: str) -> None | Tensor:
+        """Get the data at path from the decoded arrays, None if not decoded."""
+        array = self.decoded_arrays.get((view, data_group))
+        if array is None or path not in array:
+            return None
+        return self._from_decoded(data_group, array.get(path), array.max_depth)
+
+    def _load_scalabel(self, view: str, name: str, idx: int, key: str) -> DataDict:
+        """Load a single key to load of a Scalabel dataset."""
+        dataset = self.scalabel_datasets[name]
+        index = self._get_frame_index(name, idx)
+        inputs = {}
+        if key == Keys.images:
+            for url in dataset.get_input_urls(index):
+                image = self._get_decoded(view, "img", url)
+                if image is not None:
+                    inputs[url] = image
+        return dataset.get_sample(index, inputs, keys_to_load=[key])
+
+    def _load_dense(self, view: str, key: str, filepath: str) -> DataDict:
+        """Load a single dense key."""
+        data_group = self.dense_keys[key][0]
+        data = self._get_decoded(view, data_group, filepath)
+        if data is None:
+            data = self._decode(data_group, self.backend.get(filepath))
+        return {key: data}
+
+    def _get_lazy_sample(self, idx: int) -> DataDict:
+        """Get a sample whose data is loaded per key on first access."""
+        data_dict = {}
+        for view, (names, dense_paths) in self._get_sources(idx).items():
+            # parts in the order of the eager sample, see __getitem__
+            loaders = []
+            for name in names:
+                dataset = self.scalabel_datasets[name]
+                for key, output_keys in dataset.OUTPUT_KEYS.items():
+                    if key in dataset.keys_to_load:
+                        loaders.append(
+                            (output_keys, partial(self._load_scalabel, view, name, idx, key))
+                        )
+            for key, filepath in dense_paths.items():
+                loaders.append(((key,), partial(self._load_dense, view, key, filepath)))
+            data_dict[view] = LazyDict(loaders)
+        return data_dict
+
     def __getitem__(self, idx: int) -> DataDict:
         """Get single sample.
 
@@ -430,42 +834,140 @@ class SHIFTDataset(Dataset):
             idx (int): Index of sample.
 
         Returns:
-            DictData: sample at index in Vis4D input format.
+            DictData: sample at index in Vis4D input format. With lazy, the
+                data of each view is a LazyDict.
         """
-        # load camera frames
-        data_dict = {}
-        for view in self.views_to_load:
-            data_dict_view = {}
-            video_name, frame_name = self._get_frame_key(idx)
+        return self.get_samples([idx])[0]
 
-            if view == "center":
-                # Lidar is only available in the center view
-                if Keys.points3d in self.keys_to_load:
-                    data_dict_view.update(self.scalabel_datasets["center/lidar"][idx])
-            else:
+    def get_samples(self, idxs: Sequence[int]) -> list[DataDict]:
+        """Get several samples, fetching the files of all of them at once.
+
+        The files of all samples are read with a single call to get_many of
+        the backend, e.g. for the frames of a clip, and decoded together.
+
+        Args:
+            idxs (Sequence[int]): Indices of the samples.
+
+        Returns:
+            list[DataDict]: The samples, see __getitem__.
+        """
+        if self.lazy:
+            return [self._get_lazy_sample(idx) for idx in idxs]
+
+        # resolve the files of all samples, views and groups
+        plans = []
+        urls: list[str] = []
+        contents: DictStrAny = {}
+        for idx in idxs:
+            sources = self._get_sources(idx)
+            indices = {
+                name: self._get_frame_index(name, idx)
+                for names, _ in sources.values()
+                for name in names
+            }
+            plans.append((sources, indices))
+            urls.extend(self._get_urls(sources, indices, contents))
+        urls = list(dict.fromkeys(urls))
+        contents.update(zip(urls, self.backend.get_many(urls)))
+
+        # decode the camera frames, in parallel if num_threads > 1
+        calls = []
+        for sources, indices in plans:
+            for view, (names, dense_paths) in sources.items():
                 # Load data from Scalabel
-                for group in self._data_groups_to_load:
-                    data_dict_view.update(
-                        self.scalabel_datasets[f"{view}/{group}"][idx]
+                for name in names:
+                    calls.append(
+                        partial(
+                            self.scalabel_datasets[name].get_sample,
+                            indices[name],
+                            contents,
+                        )
                     )
-
                 # Load data from bit masks
-                if Keys.segmentation_masks in self.keys_to_load:
-                    data_dict_view[Keys.segmentation_masks] = self._load(
-                        view, "semseg", "png", video_name, frame_name
-                    )
-                if Keys.depth_maps in self.keys_to_load:
-                    data_dict_view[Keys.depth_maps] = self._load(
-                        view, "depth", "png", video_name, frame_name
-                    )
-                if Keys.optical_flows in self.keys_to_load:
-                    data_dict_view[Keys.optical_flows] = self._load(
-                        view, "flow", "npz", video_name, frame_name
-                    )
-            
-            data_dict[view] = data_dict_view
+                for key, filepath in dense_paths.items():
+                    content = contents[filepath]
+                    if isinstance(content, Tensor):
+                        calls.append(partial(dict, {key: content}))
+                    else:
+                        calls.append(partial(self._decode_dense, key, content))
+        results = iter(self._run(calls))
+
+        samples = []
+        for sources, _ in plans:
+            data_dict = {}
+            for view, (names, dense_paths) in sources.items():
+                data_dict_view = {}
+                for _ in range(len(names) + len(dense_paths)):
+                    data_dict_view.update(next(results))
+                data_dict[view] = data_dict_view
+            samples.append(data_dict)
+        return samples
+
+    def _get_urls(
+        self,
+        sources: dict[str, tuple[list[str], dict[str, str]]],
+        indices: dict[str, int],
+        contents: DictStrAny,
+    ) -> list[str]:
+        """Get the files of a sample to fetch from the backend.
 
-        return data_dict
+        Files available in the decoded arrays are added to contents instead.
+        """
+        urls = []
+        for view, (names, dense_paths) in sources.items():
+            for name in names:
+                for url in self.scalabel_datasets[name].get_input_urls(
+                    indices[name]
+                ):
+                    image = None
+                    if self.decoded_arrays:
+                        image = self._get_decoded(view, "img", url)
+                    if image is not None:
+                        contents[url] = image
+                    else:
+                        urls.append(url)
+            for key, filepath in dense_paths.items():
+                data = None
+                if self.decoded_arrays:
+                    data = self._get_decoded(view, self.dense_keys[key][0], filepath)
+                if data is not None:
+                    contents[filepath] = data
+                else:
+                    urls.append(filepath)
+        return urls
+
+    def _decode_dense(self, key: str, content: bytes) -> DataDict:
+        """Decode the file content of a dense key."""
+        return {key: self._decode(self.dense_keys[key][0], content)}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the sample threads, started once per process."""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _run(self, calls: list[Callable[[], DataDict]]) -> list[DataDict]:
+        """Run the calls, in the sample threads if num_threads > 1."""
+        if self.num_threads <= 1 or len(calls) <= 1:
+            return [call() for call in calls]
+        return list(self._get_executor().map(lambda call: call(), calls))
+
+    def __getstate__(self) -> DataDict:
+        """Exclude the sample threads when pickling, e.g. to workers."""
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_executor_pid"] = -1
+        return state
+
+    @property
+    def sequence_index(self) -> SequenceIndex:
+        """Index of the video sequences, see SequenceIndex."""
+        if len(self.scalabel_datasets) > 0:
+            return self.scalabel_datasets[
+                list(self.scalabel_datasets.keys())[0]
+            ].sequence_index
+        raise ValueError("No Scalabel file has been loaded.")
 
     @property
     def video_to_indices(self) -> dict[str, list[int]]:
@@ -480,7 +982,8 @@ class SHIFTDataset(Dataset):
 
     def get_video_indices(self, idx: int) -> list[int]:
         """Get all dataset indices in a video given a single dataset index."""
-        for indices in self.video_to_indices.values():
-            if idx in indices:
-                return indices
-        raise ValueError(f"Dataset index {idx} not found in video_to_indices!")
+        if len(self.scalabel_datasets) > 0:
+            return self.scalabel_datasets[
+                list(self.scalabel_datasets.keys())[0]
+            ].get_video_indices(idx)
+        raise ValueError("No Scalabel file has been loaded.")
@@ -0,0 +1,71 @@
+"""Read the files of a zip file or folder in chunks, by a pool of processes.
+
+Shared by the conversion tools, see to_hdf5 and to_decoded.
+"""
+
+import glob
+import os
+import zlib
+from zipfile import ZipFile
+
+# number of files read by a worker at once
+READ_CHUNK_SIZE = 64
+# sources opened by this (worker) process, keyed by path
+_SOURCES = {}
+
+
+class Source:
+    """Files of a zip file or folder, keyed by their relative path."""
+
+    def __init__(self, path, is_zip):
+        self.path = path
+        self.is_zip = is_zip
+        if is_zip:
+            self.file = ZipFile(path, "r")
+            infos = [info for info in self.file.infolist() if not info.is_dir()]
+            self.keys = [info.filename for info in infos]
+            self.sizes = [info.file_size for info in infos]
+            self.crcs = [info.CRC for info in infos]
+        else:
+            files = glob.glob(os.path.join(path, "*", "*"))
+            self.keys = [os.path.relpath(f, path).replace(os.sep, "/") for f in files]
+            self.sizes = [os.path.getsize(f) for f in files]
+            # checksums of folders are computed on verification
+            self.crcs = None
+
+    def read(self, key):
+        """Read the content of a file."""
+        if self.is_zip:
+            return self.file.read(key)
+        with open(os.path.join(self.path, key), "rb") as fp:
+            return fp.read()
+
+
+def get_source(path, is_zip):
+    """Get the source opened by this process."""
+    if (path, is_zip) not in _SOURCES:
+        _SOURCES[(path, is_zip)] = Source(path, is_zip)
+    return _SOURCES[(path, is_zip)]
+
+
+def read_chunk(task):
+    """Read the contents of a chunk of files, run by the reader processes."""
+    path, is_zip, keys = task
+    source = get_source(path, is_zip)
+    return [(key, source.read(key)) for key in keys]
+
+
+def crc_chunk(task):
+    """Compute the CRC32 checksums of a chunk of files."""
+    return [(key, zlib.crc32(content)) for key, content in read_chunk(task)]
+
+
+def imap_chunks(func, path, is_zip, keys, pool):
+    """Apply func to chunks of keys, in order and in parallel if pool is set."""
+    tasks = [
+        (path, is_zip, keys[i : i + READ_CHUNK_SIZE])
+        for i in range(0, len(keys), READ_CHUNK_SIZE)
+    ]
+    if pool is None:
+        return map(func, tasks)
+    return pool.imap(func, tasks)
@@ -0,0 +1,202 @@
+"""Decode a data group's zip file into a memory-mappable array.
+
+Images, semantic segmentation and depth are decoded once and stored as
+fixed-shape arrays in an NPY file, together with a JSON file listing the key
+of each row, see shift_dev.utils.decoded. Loading a sample from the decoded
+arrays skips the decoding, at the cost of disk space: an RGB frame of
+1280x800 takes 3 MB.
+
+The files are decoded by a pool of processes and written by the main
+process.
+"""
+
+import argparse
+import functools
+import glob
+import json
+import multiprocessing as mp
+import os
+import sys
+
+import numpy as np
+import tqdm
+
+from ..utils.decoded import get_decoded_paths
+from ..utils.load import depth_8bit_decode, depth_decode, depth_to_meters, im_decode
+from ..utils.logs import setup_logger
+from .sources import Source, imap_chunks, read_chunk
+
+logger = setup_logger()
+
+GROUPS = ("img", "semseg", "depth", "depth_8bit")
+DEPTH_DTYPES = ("uint32", "float16")
+# maximum depth in meters, see SHIFTDataset
+MAX_DEPTH = 1000.0
+
+
+def decode(content, group, depth_dtype="uint32"):
+    """Decode the content of a file of the given data group.
+
+    Args:
+        content (bytes): The file content.
+        group (str): The data group, one of GROUPS.
+        depth_dtype (str): Type of the decoded depth, "uint32" for the integer
+            depth (uint8 for 8 bit depth), or "float16" for the depth in
+            meters.
+
+    Returns:
+        np.ndarray: [C, H, W] uint8 image, [H, W] uint8 semantic segmentation
+            or [H, W] depth.
+    """
+    if group == "img":
+        return im_decode(content).transpose(2, 0, 1)
+    if group == "semseg":
+        return im_decode(content)[..., 0]
+    if group in {"depth", "depth_8bit"}:
+        if group == "depth":
+            depth = depth_decode(content)
+        else:
+            depth = depth_8bit_decode(content)
+        if depth_dtype == "float16":
+            return depth_to_meters(depth, MAX_DEPTH).astype(np.float16)
+        return depth
+    raise ValueError(f"Invalid data group '{group}'")
+
+
+def _decode_chunk(group, depth_dtype, task):
+    """Decode a chunk of files, run by the decoder processes."""
+    return [
+        (key, decode(content, group, depth_dtype))
+        for key, content in read_chunk(task)
+    ]
+
+
+def _get_group(path):
+    """Get the data group from the path of its zip file or folder."""
+    return os.path.splitext(os.path.basename(path.rstrip("/")))[0]
+
+
+def convert(path, is_zip, show_progress_bar=False, depth_dtype="uint32", pool=None):
+    """Decode a zip file or folder into an NPY file.
+
+    Args:
+        path (str): Path to the zip file or folder, named after its data
+            group, e.g. "img.zip".
+        is_zip (bool): Whether path is a zip file.
+        show_progress_bar (bool): Whether to show a progress bar.
+        depth_dtype (str): Type of the decoded depth, see decode.
+        pool (None | multiprocessing.Pool): Pool of decoder processes.
+
+    Returns:
+        bool: Whether the conversion succeeded.
+    """
+    group = _get_group(path)
+    if group not in GROUPS:
+        logger.error(f"Cannot decode {path}, data group must be one of {GROUPS}.")
+        return False
+    try:
+        source = Source(path, is_zip)
+    except Exception as e:
+        logger.error(f"Cannot open {path}. {e}")
+        return False
+    if len(source.keys) == 0:
+        logger.error(f"No files found in {path}.")
+        return False
+    array_path, keys_path = get_decoded_paths(path)
+    keys = sorted(source.keys)
+
+    # the shape of the first file fixes the shape of all rows
+    first = decode(source.read(keys[0]), group, depth_dtype)
+    array = np.lib.format.open_memmap(
+        array_path + ".tmp",
+        mode="w+",
+        dtype=first.dtype,
+        shape=(len(keys), *first.shape),
+    )
+    decode_ = functools.partial(_decode_chunk, group, depth_dtype)
+    row = 0
+    with tqdm.tqdm(
+        total=len(keys),
+        desc=os.path.basename(array_path),
+        disable=not show_progress_bar,
+    ) as progress:
+        for chunk in imap_chunks(decode_, source.path, source.is_zip, keys, pool):
+            for key, data in chunk:
+                if data.shape != first.shape:
+                    logger.error(
+                        f"Cannot decode {path}, {key} has shape {data.shape}, "
+                        f"expected {first.shape}."
+                    )
+                    del array
+                    os.remove(array_path + ".tmp")
+                    return False
+                array[row] = data
+                row += 1
+            progress.update(len(chunk))
+    array.flush()
+    del array
+
+    meta = {"group": group, "keys": keys}
+    if first.dtype == np.float16:
+        # the depth in meters depends on the maximum depth
+        meta["max_depth"] = MAX_DEPTH
+    with open(keys_path, "w", encoding="utf-8") as fp:
+        json.dump(meta, fp)
+    # the array is complete once it has its final name
+    os.replace(array_path + ".tmp", array_path)
+    logger.info(f"Decoded {path} to {array_path}.")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode images, semantic segmentation and depth into NPY files."
+    )
+    parser.add_argument(
+        "path", type=str, help="Path pattern to match the zip files or folders."
+    )
+    parser.add_argument(
+        "--zip", action="store_true", help="Whether process zip files, or folders."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes decoding the files in parallel.",
+    )
+    parser.add_argument(
+        "--depth-dtype",
+        default="uint32",
+        choices=DEPTH_DTYPES,
+        help="Type of the decoded depth, the exact integer depth or meters.",
+    )
+    args = parser.parse_args()
+    if args.zip:
+        if args.path[-4:] != ".zip":
+            logger.info("Path pattern must end with '.zip'!")
+            sys.exit(1)
+    else:
+        if args.path[-1] != "/":
+            logger.info("Path pattern must end with '/'!")
+            sys.exit(1)
+    files = [f for f in glob.glob(args.path, recursive=True) if _get_group(f) in GROUPS]
+    logger.info("Files/folders to decode: " + str(len(files)))
+
+    pool = mp.Pool(args.jobs) if args.jobs > 1 else None
+    try:
+        failed = [
+            f
+            for f in files
+            if not convert(f, args.zip, True, args.depth_dtype, pool=pool)
+        ]
+    finally:
+        if pool is not None:
+            pool.close()
+    if failed:
+        logger.error("Failed to decode: " + ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,371 @@
-"""Pack a data group's zip file into an hdf5 file."""
+"""Pack a data group's zip file into an hdf5 file.
+
+The files of a zip file or folder are read by a pool of processes and
+written by the main process, which is the single writer of each HDF5 file.
+Keys whose contents are written are recorded in a checkpoint file next to
+the output, so that an interrupted conversion resumes where it stopped.
+Finally, the output is verified against the source by comparing the keys and
+the CRC32 checksums of all files. Files failing verification are dropped from
+the checkpoint, so that running the conversion again rewrites them.
+"""
 
 import argparse
+import functools
 import glob
 import multiprocessing as mp
 import os
 import sys
+import zlib
 
 import h5py
 import numpy as np
 import tqdm
 
+from ..utils.backend import HDF5Backend
 from ..utils.logs import setup_logger
-from ..utils.storage import ZipArchiveReader
+from .sources import Source, crc_chunk, imap_chunks, read_chunk
 
+logger = setup_logger()
 
-def convert_from_zip(zip_filepath, show_progress_bar=False):
-    try:
-        zip_file = ZipArchiveReader(zip_filepath)
-    except Exception as e:
-        logger.error("Cannot open {}. ".format(zip_filepath) + e)
-        return
+# size of the buffer collecting file contents before writing them out
+WRITE_BUFFER_SIZE = 1 << 26
+CHECKPOINT_EXT = ".progress"
+
+
+def _load_checkpoint(checkpoint_path):
+    """Load the keys recorded as written by an interrupted conversion."""
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r", encoding="utf-8") as fp:
+        # the last line may be cut off, which never matches a key
+        return set(fp.read().splitlines())
+
+
+def _rewrite_checkpoint(checkpoint_path, keys):
+    """Replace the keys recorded in a checkpoint, e.g. to drop corrupted ones."""
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        fp.write("".join(key + "\n" for key in keys))
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+class _Checkpoint:
+    """Records written keys, after their content is flushed to the output."""
+
+    def __init__(self, checkpoint_path, hdf5_file):
+        self.fp = open(checkpoint_path, "a", encoding="utf-8")
+        self.hdf5_file = hdf5_file
+        self.pending = []
+
+    def add(self, key):
+        self.pending.append(key)
+
+    def commit(self):
+        """Flush the output and record the pending keys."""
+        if not self.pending:
+            return
+        self.hdf5_file.flush()
+        self.fp.write("".join(key + "\n" for key in self.pending))
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.pending = []
+
+    def close(self):
+        self.commit()
+        self.fp.close()
+
+
+def _open_output(hdf5_filepath, checkpoint_path):
+    """Open the output for writing, resuming from a checkpoint if present.
+
+    Returns:
+        tuple[h5py.File, set[str]]: The output file and the keys written
+            already.
+    """
+    done = _load_checkpoint(checkpoint_path)
+    if done and os.path.exists(hdf5_filepath):
+        try:
+            hdf5_file = h5py.File(hdf5_filepath, mode="a")
+            logger.info(f"Resuming {hdf5_filepath}, {len(done)} files done.")
+            return hdf5_file, done
+        except OSError as e:
+            logger.warning(f"Cannot resume {hdf5_filepath}, starting over. {e}")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return h5py.File(hdf5_filepath, mode="w"), set()
+
+
+def _write_datasets(hdf5_file, source, checkpoint_path, done, pool, progress):
+    """Write one dataset per file, skipping the files already written."""
+    # drop datasets written after the last checkpoint, they may be partial
+    partial = []
+    hdf5_file.visititems(
+        lambda name, obj: partial.append(name)
+        if isinstance(obj, h5py.Dataset) and name not in done
+        else None
+    )
+    for name in partial:
+        del hdf5_file[name]
+
+    keys = [key for key in source.keys if key not in done]
+    checkpoint = _Checkpoint(checkpoint_path, hdf5_file)
+    buffered = 0
+    for chunk in imap_chunks(read_chunk, source.path, source.is_zip, keys, pool):
+        for key, content in chunk:
+            hdf5_file.create_dataset(key, data=np.frombuffer(content, dtype="uint8"))
+            checkpoint.add(key)
+            buffered += len(content)
+        if buffered >= WRITE_BUFFER_SIZE:
+            checkpoint.commit()
+            buffered = 0
+        progress.update(len(chunk))
+    checkpoint.close()
+
+
+def write_packed(
+    hdf5_file, source, checkpoint_path, done=(), pool=None, progress=None
+):
+    """Write files into an HDF5 file in packed layout, see HDF5Backend.
+
+    The file contents are concatenated in one contiguous uint8 dataset in
+    order of their keys, so that the frames of a video are stored one after
+    another, and indexed by key. The offsets only depend on the source, so
+    an interrupted conversion resumes by filling in the remaining files.
+
+    Args:
+        hdf5_file (h5py.File): The HDF5 file to write to.
+        source (Source): The files to write.
+        checkpoint_path (str): Path to the file recording the written keys.
+        done (Collection[str]): Keys of the files written already.
+        pool (None | multiprocessing.Pool): Pool of reader processes.
+        progress (None | tqdm.tqdm): Progress bar, updated per file.
+    """
+    order = sorted(range(len(source.keys)), key=lambda i: source.keys[i])
+    keys = [source.keys[i] for i in order]
+    lengths = np.asarray([source.sizes[i] for i in order], dtype=np.int64)
+    offsets = np.zeros(len(keys), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+
+    index_name = HDF5Backend.PACKED_INDEX
+    if index_name in hdf5_file:
+        index = hdf5_file[index_name]
+        if index["keys"].asstr()[()].tolist() != keys or not np.array_equal(
+            index["offsets"][()], offsets
+        ):
+            raise ValueError(f"{hdf5_file.filename} does not match its source.")
+        blob = hdf5_file[HDF5Backend.PACKED_BLOB]
+    else:
+        blob = hdf5_file.create_dataset(
+            HDF5Backend.PACKED_BLOB, shape=(int(lengths.sum()),), dtype="uint8"
+        )
+        index = hdf5_file.create_group(index_name)
+        index.create_dataset("keys", data=keys, dtype=h5py.string_dtype("utf-8"))
+        index.create_dataset("offsets", data=offsets)
+        index.create_dataset("lengths", data=lengths)
+
+    spans = dict(zip(keys, zip(offsets.tolist(), lengths.tolist())))
+    todo = [key for key in keys if key not in done]
+    checkpoint = _Checkpoint(checkpoint_path, hdf5_file)
+    # contents of consecutive files, written to the blob with one write
+    buffer, start, end = [], 0, 0
+    for chunk in imap_chunks(read_chunk, source.path, source.is_zip, todo, pool):
+        for key, content in chunk:
+            offset, length = spans[key]
+            if len(content) != length:
+                raise ValueError(f"Size of {key} changed while packing.")
+            if offset != end or end - start >= WRITE_BUFFER_SIZE:
+                if buffer:
+                    blob[start:end] = np.concatenate(buffer)
+                checkpoint.commit()
+                buffer, start = [], offset
+            buffer.append(np.frombuffer(content, dtype="uint8"))
+            end = offset + length
+            checkpoint.add(key)
+        if progress is not None:
+            progress.update(len(chunk))
+    if buffer:
+        blob[start:end] = np.concatenate(buffer)
+    checkpoint.close()
+    hdf5_file.attrs["layout"] = HDF5Backend.PACKED_LAYOUT
+
+
+def _output_checksums(hdf5_file):
+    """Compute the CRC32 checksums of all files in an HDF5 file."""
+    checksums = {}
+    if hdf5_file.attrs.get("layout") == HDF5Backend.PACKED_LAYOUT:
+        index = hdf5_file[HDF5Backend.PACKED_INDEX]
+        keys = index["keys"].asstr()[()].tolist()
+        offsets = index["offsets"][()].tolist()
+        lengths = index["lengths"][()].tolist()
+        blob = hdf5_file[HDF5Backend.PACKED_BLOB]
+        start = 0
+        while start < len(keys):
+            # read the blob in large contiguous pieces
+            stop = start + 1
+            while (
+                stop < len(keys)
+                and offsets[stop] + lengths[stop] - offsets[start] <= WRITE_BUFFER_SIZE
+            ):
+                stop += 1
+            data = blob[offsets[start] : offsets[stop - 1] + lengths[stop - 1]]
+            for i in range(start, stop):
+                begin = offsets[i] - offsets[start]
+                checksums[keys[i]] = zlib.crc32(data[begin : begin + lengths[i]])
+            start = stop
+    else:
+
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                checksums[name] = zlib.crc32(obj[()])
+
+        hdf5_file.visititems(visit)
+    return checksums
+
+
+def _check_output(source, hdf5_filepath, pool=None):
+    """Compare an HDF5 file with its source by keys and checksums.
+
+    Args:
+        source (Source): The files the HDF5 file was converted from.
+        hdf5_filepath (str): Path to the HDF5 file.
+        pool (None | multiprocessing.Pool): Pool of reader processes, used to
+            compute the checksums of folders.
+
+    Returns:
+        tuple[list[str], list[str]]: The keys of the source missing or
+            corrupted in the HDF5 file, and the keys of the HDF5 file not in
+            the source.
+    """
+    if source.crcs is not None:
+        expected = dict(zip(source.keys, source.crcs))
+    else:
+        expected = {}
+        for chunk in imap_chunks(
+            crc_chunk, source.path, source.is_zip, source.keys, pool
+        ):
+            expected.update(chunk)
+    with h5py.File(hdf5_filepath, mode="r") as hdf5_file:
+        actual = _output_checksums(hdf5_file)
+    mismatches = [key for key, crc in expected.items() if actual.get(key) != crc]
+    extra = [key for key in actual if key not in expected]
+    if mismatches:
+        logger.error(
+            f"{hdf5_filepath} has {len(mismatches)} missing or corrupted files, "
+            f"e.g. {mismatches[0]}."
+        )
+    if extra:
+        logger.error(
+            f"{hdf5_filepath} holds {len(extra)} files not in the source, "
+            f"e.g. {extra[0]}."
+        )
+    return mismatches, extra
+
+
+def verify(source, hdf5_filepath, pool=None):
+    """Verify an HDF5 file against its source by file count and checksums.
+
+    Args:
+        source (Source): The files the HDF5 file was converted from.
+        hdf5_filepath (str): Path to the HDF5 file.
+        pool (None | multiprocessing.Pool): Pool of reader processes, used to
+            compute the checksums of folders.
+
+    Returns:
+        bool: Whether the HDF5 file holds exactly the files of the source.
+    """
+    mismatches, extra = _check_output(source, hdf5_filepath, pool)
+    return not mismatches and not extra
+
+
+def convert(
+    path, is_zip, show_progress_bar=False, packed=False, pool=None, check=True
+):
+    """Convert a zip file or folder into an HDF5 file.
+
+    Args:
+        path (str): Path to the zip file or folder.
+        is_zip (bool): Whether path is a zip file.
+        show_progress_bar (bool): Whether to show a progress bar.
+        packed (bool): Whether to write the packed layout, see HDF5Backend.
+        pool (None | multiprocessing.Pool): Pool of reader processes.
+        check (bool): Whether to verify the output against the source.
+
+    Returns:
+        bool: Whether the conversion succeeded.
+    """
     try:
-        hdf5_filepath = zip_filepath.replace(".zip", ".hdf5")
-        hdf5_file = h5py.File(hdf5_filepath, mode="w")
+        source = Source(path, is_zip)
     except Exception as e:
-        logger.error("Cannot create {}. ".format(hdf5_filepath) + e)
-        return
-
-    file_list = zip_file.get_list()
-    if show_progress_bar:
-        file_list = tqdm.tqdm(file_list)
-    for f in file_list:
-        seq, frame = f.split("/")
-        file_content = zip_file.get_file(f)
-        bytes = np.frombuffer(file_content.read(), dtype="uint8")
-        if seq in hdf5_file:
-            g = hdf5_file[seq]
-        else:
-            g = hdf5_file.create_group(seq)
-        g.create_dataset(frame, data=bytes)
-    hdf5_file.close()
-
-
-def convert_from_folder(path, show_progress_bar=False):
-    try:
+        logger.error(f"Cannot open {path}. {e}")
+        return False
+    if is_zip:
+        hdf5_filepath = path.replace(".zip", ".hdf5")
+    else:
         hdf5_filepath = path.rstrip("/") + ".hdf5"
-        hdf5_file = h5py.File(hdf5_filepath, mode="w")
-        print(hdf5_filepath)
+    checkpoint_path = hdf5_filepath + CHECKPOINT_EXT
+    try:
+        hdf5_file, done = _open_output(hdf5_filepath, checkpoint_path)
     except Exception as e:
-        logger.error("Cannot create {}. ".format(hdf5_filepath) + e)
-        return
-
-    file_list = glob.glob(os.path.join(path, "*", "*"))
-    if show_progress_bar:
-        file_list = tqdm.tqdm(file_list)
-    for f in file_list:
-        seq, frame = f.split("/")[-2:]
-        with open(f, "rb") as fp:
-            file_content = fp.read()
-        bytes = np.frombuffer(file_content, dtype="uint8")
-        if seq in hdf5_file:
-            g = hdf5_file[seq]
-        else:
-            g = hdf5_file.create_group(seq)
-        g.create_dataset(frame, data=bytes)
-    hdf5_file.close()
+        logger.error(f"Cannot create {hdf5_filepath}. {e}")
+        return False
+
+    with tqdm.tqdm(
+        total=len(source.keys),
+        initial=len(done),
+        desc=os.path.basename(hdf5_filepath),
+        disable=not show_progress_bar,
+    ) as progress:
+        try:
+            with hdf5_file:
+                if packed:
+                    write_packed(
+                        hdf5_file, source, checkpoint_path, done, pool, progress
+                    )
+                else:
+                    _write_datasets(
+                        hdf5_file, source, checkpoint_path, done, pool, progress
+                    )
+        except ValueError as e:
+            # the output does not match the source, e.g. it changed since an
+            # interrupted run, so the next run starts over
+            logger.error(f"Cannot convert {path}, removing {hdf5_filepath}. {e}")
+            for filepath in (checkpoint_path, hdf5_filepath):
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+            return False
+
+    if check:
+        mismatches, extra = _check_output(source, hdf5_filepath, pool)
+        if mismatches or extra:
+            if packed and extra:
+                # the index does not match the source, start over
+                os.remove(checkpoint_path)
+            else:
+                # forget the failed files, so that the next run rewrites them
+                failed = set(mismatches).union(extra)
+                done = _load_checkpoint(checkpoint_path)
+                _rewrite_checkpoint(checkpoint_path, sorted(done - failed))
+            logger.error(f"Run the conversion again to repair {hdf5_filepath}.")
+            return False
+    os.remove(checkpoint_path)
+    logger.info(f"Converted {path} to {hdf5_filepath}.")
+    return True
+
+
+def convert_from_zip(
+    zip_filepath, show_progress_bar=False, packed=False, pool=None, check=True
+):
+    """Convert a zip file into an HDF5 file, see convert."""
+    return convert(zip_filepath, True, show_progress_bar, packed, pool, check)
+
+
+def convert_from_folder(
+    path, show_progress_bar=False, packed=False, pool=None, check=True
+):
+    """Convert a folder into an HDF5 file, see convert."""
+    return convert(path, False, show_progress_bar, packed, pool, check)
 
 
 def main():
@@ -76,7 +377,21 @@ def main():
         "--zip", action="store_true", help="Whether process zip files, or folders."
     )
     parser.add_argument(
-        "-j", "--jobs", default=1, type=int, help="Number of jobs to run in parallel."
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes reading the files in parallel.",
+    )
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Whether to pack all files into one contiguous dataset with an index.",
+    )
+    parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="Whether to skip verifying the outputs against their sources.",
     )
     args = parser.parse_args()
     print(args.path)
@@ -91,22 +406,27 @@ def main():
     files = glob.glob(args.path, recursive=True)
     logger.info("Files/folders to convert: " + str(len(files)))
 
-    if args.zip:
-        convert = convert_from_zip
-    else:
-        convert = convert_from_folder
-    if args.jobs > 1:
-        with mp.Pool(args.jobs) as pool:
-            _ = list(tqdm.tqdm(pool.imap(convert, files), total=len(files)))
-    else:
+    if args.jobs <= 1:
         logger.info(
             "Note: You can also run this code using multi-processing by setting `-j` option."
         )
-        for f in files:
-            logger.info("Processing " + f)
-            convert(f, show_progress_bar=True)
+    convert_ = functools.partial(
+        convert,
+        is_zip=args.zip,
+        show_progress_bar=True,
+        packed=args.packed,
+        check=not args.no_verify,
+    )
+    pool = mp.Pool(args.jobs) if args.jobs > 1 else None
+    try:
+        failed = [f for f in files if not convert_(f, pool=pool)]
+    finally:
+        if pool is not None:
+            pool.close()
+    if failed:
+        logger.error("Failed to convert: " + ", ".join(failed))
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    logger = setup_logger()
     main()
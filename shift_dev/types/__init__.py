@@ -4,8 +4,10 @@ from .data import *
 __all__ = [
     "DictStrAny",
     "DataDict",
+    "NDArrayF32",
     "NDArrayF64",
     "NDArrayI32",
+    "NDArrayI64",
     "NDArrayU8",
     "Keys",
     "AxisMode",
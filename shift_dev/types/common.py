@@ -8,6 +8,8 @@ import numpy.typing as npt
 DictStrAny = Dict[str, Any]  # type: ignore[misc]
 DataDict = Dict[str, Any]  # type: ignore[misc]
 
+NDArrayF32 = npt.NDArray[np.float32]
 NDArrayF64 = npt.NDArray[np.float64]
 NDArrayI32 = npt.NDArray[np.int32]
+NDArrayI64 = npt.NDArray[np.int64]
 NDArrayU8 = npt.NDArray[np.uint8]
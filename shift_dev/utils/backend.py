@@ -7,8 +7,13 @@ FileBackend, which loads from / saves to file naively.
 from __future__ import annotations
 
 import os
+import weakref
 from abc import abstractmethod
-from zipfile import ZipFile
+from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
+from mmap import ACCESS_READ, mmap
+from typing import Any, Literal, Union
+from zipfile import ZIP_STORED, BadZipFile, ZipFile, ZipInfo
 
 try:
     import h5py
@@ -18,6 +23,9 @@ except:
 
 import numpy as np
 
+# file contents returned by the backends, see DataBackend
+Buffer = Union[bytes, memoryview]
+
 
 class DataBackend:
     """Abstract class of storage backends.
@@ -25,6 +33,11 @@ class DataBackend:
     All backends need to implement three functions: get(), set() and exists().
     get() reads the file as a byte stream and set() writes a byte stream to a
     file. exists() checks if a certain filepath exists.
+
+    The contents returned by get() and get_many() are bytes, or read-only
+    memoryview for backends serving files zero-copy, e.g. ZipBackend with
+    use_mmap. Callers should only rely on the buffer protocol, e.g.
+    BytesIO, np.frombuffer or bytes(content), not on methods of bytes.
     """
 
     @abstractmethod
@@ -38,17 +51,31 @@ class DataBackend:
         raise NotImplementedError
 
     @abstractmethod
-    def get(self, filepath: str) -> bytes:
+    def get(self, filepath: str) -> Buffer:
         """Get the file content at the given filepath as bytes.
 
         Args:
             filepath (str): The filepath to retrieve the data from."
 
         Returns:
-            bytes: The content of the file as bytes.
+            Buffer: The content of the file as bytes or memoryview.
         """
         raise NotImplementedError
 
+    def get_many(self, filepaths: Sequence[str]) -> list[Buffer]:
+        """Get the file contents at the given filepaths as bytes.
+
+        Backends storing many files in one archive override this to resolve
+        each archive once and read its files in on-disk order.
+
+        Args:
+            filepaths (Sequence[str]): The filepaths to retrieve the data from.
+
+        Returns:
+            list[Buffer]: The contents of the files, in the order of filepaths.
+        """
+        return [self.get(filepath) for filepath in filepaths]
+
     @abstractmethod
     def exists(self, filepath: str) -> bool:
         """Check if filepath exists.
@@ -105,7 +132,249 @@ class FileBackend(DataBackend):
         return value_buf
 
 
-class HDF5Backend(DataBackend):
+# all archive backends of this process, see worker_init_fn
+_ARCHIVE_BACKENDS: weakref.WeakSet[ArchiveBackend] = weakref.WeakSet()
+
+
+def worker_init_fn(worker_id: int) -> None:  # pylint: disable=unused-argument
+    """Drop the archives inherited by a DataLoader worker process.
+
+    Pass this as worker_init_fn to torch.utils.data.DataLoader, so that every
+    worker opens its own archive handles, independent of whether the backends
+    were used before the workers were started.
+
+    Args:
+        worker_id (int): The id of the worker, unused.
+    """
+    for backend in list(_ARCHIVE_BACKENDS):
+        backend.close()
+
+
+class ArchiveBackend(DataBackend):
+    """Abstract class of backends storing files inside archive files.
+
+    Filepaths point into an archive, e.g. 'path/to/archive.ext/key1/key2',
+    where the archive extension may be omitted. Splitting a filepath into
+    archive path and key needs file system lookups, so the archive of each
+    directory is resolved once and cached. Subsequent reads of files in the
+    same directory do not touch the file system metadata at all.
+
+    If archives are moved or replaced while the backend is in use, call
+    invalidate_cache(). Archive paths and keys that are known in advance can
+    be passed directly to get_from_archive() and get_many_from_archive().
+
+    Open archives are kept in db_cache, at most max_open_archives at a time,
+    evicting the least recently used one. The handles belong to the process
+    that opened them: after a fork, e.g. into DataLoader workers, they share
+    file offsets with the parent, so the backend detects the changed process
+    id and lazily reopens the archives in the new process. Handles are never
+    pickled either. Alternatively, pass worker_init_fn to the DataLoader to
+    drop inherited handles once at worker start.
+    """
+
+    def __init__(self, max_open_archives: int = 64) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            max_open_archives (int): Maximum number of simultaneously open
+                archives per process. Defaults to 64.
+        """
+        super().__init__()
+        assert max_open_archives > 0, "max_open_archives must be positive."
+        self.max_open_archives = max_open_archives
+        self.db_cache: OrderedDict[str, tuple[Any, str]] = OrderedDict()
+        self.archive_cache: dict[str, tuple[str, str]] = {}
+        self._pid = os.getpid()
+        _ARCHIVE_BACKENDS.add(self)
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Exclude the open archives when pickling."""
+        state = self.__dict__.copy()
+        state["db_cache"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Restore the backend in a new process."""
+        self.__dict__.update(state)
+        self._pid = os.getpid()
+        _ARCHIVE_BACKENDS.add(self)
+
+    def close(self) -> None:
+        """Close all archives opened by this process.
+
+        Archives inherited from a parent process are only dropped, not
+        closed, so that the parent's handles are not affected.
+        """
+        if self._pid == os.getpid():
+            for client, _ in self.db_cache.values():
+                client.close()
+        self.db_cache = OrderedDict()
+        self._pid = os.getpid()
+
+    @abstractmethod
+    def _open(self, archive_path: str, mode: str) -> Any:
+        """Open the archive at the given path in the given mode."""
+        raise NotImplementedError
+
+    def _get_client(self, archive_path: str, mode: str) -> Any:
+        """Get the open archive at the given path, opening it if needed.
+
+        Args:
+            archive_path (str): Path to the archive.
+            mode (str): Mode to open the archive in.
+
+        Returns:
+            Any: The open archive.
+        """
+        if self._pid != os.getpid():
+            self.close()
+        cached = self.db_cache.get(archive_path)
+        if cached is not None:
+            client, current_mode = cached
+            if current_mode == mode:
+                self.db_cache.move_to_end(archive_path)
+                return client
+            del self.db_cache[archive_path]
+            client.close()
+        while len(self.db_cache) >= self.max_open_archives:
+            _, (evicted, _) = self.db_cache.popitem(last=False)
+            evicted.close()
+        client = self._open(archive_path, mode)
+        self.db_cache[archive_path] = (client, mode)
+        return client
+
+    @staticmethod
+    @abstractmethod
+    def _split_path(filepath: str) -> tuple[str, list[str]]:
+        """Split filepath into archive path and keys in reversed order."""
+        raise NotImplementedError
+
+    def resolve(self, filepath: str) -> tuple[str, str]:
+        """Split filepath into archive path and key inside the archive.
+
+        Args:
+            filepath (str): The filepath, e.g. 'path/to/archive.ext/key1/key2'.
+
+        Returns:
+            tuple[str, str]: The archive path and the key inside the archive.
+        """
+        directory, _, basename = filepath.rpartition("/")
+        resolved = self.archive_cache.get(directory)
+        if resolved is None:
+            archive_path, keys = self._split_path(directory)
+            resolved = (archive_path, "/".join(reversed(keys)))
+            # only cache existing archives, so that missing ones can appear
+            if os.path.exists(archive_path):
+                self.archive_cache[directory] = resolved
+        archive_path, prefix = resolved
+        return archive_path, f"{prefix}/{basename}" if prefix else basename
+
+    def invalidate_cache(self, prefix: str = "") -> None:
+        """Drop cached archive resolutions and open archives.
+
+        Args:
+            prefix (str): Only drop the entries of paths starting with prefix.
+                Defaults to "", i.e. all entries.
+        """
+        self.archive_cache = {
+            directory: resolved
+            for directory, resolved in self.archive_cache.items()
+            if not directory.startswith(prefix)
+        }
+        if self._pid != os.getpid():
+            self.close()
+        for archive_path in list(self.db_cache):
+            if archive_path.startswith(prefix):
+                client, _ = self.db_cache.pop(archive_path)
+                client.close()
+
+    def _check_archive(self, archive_path: str, filepath: str) -> None:
+        """Raise FileNotFoundError if the archive does not exist.
+
+        Archives that are open already are not checked again.
+        """
+        if archive_path not in self.db_cache and not os.path.exists(archive_path):
+            raise FileNotFoundError(
+                f"Corresponding {self.ARCHIVE_TYPE} file not found:" f" {filepath}"
+            )
+
+    @abstractmethod
+    def get_from_archive(self, archive_path: str, key: str) -> Buffer:
+        """Get the content of a file inside an archive as bytes.
+
+        Args:
+            archive_path (str): The path to the archive.
+            key (str): The key of the file inside the archive, e.g.
+                'key1/key2'.
+
+        Returns:
+            Buffer: The content of the file as bytes or memoryview.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many_from_archive(
+        self, requests: Sequence[tuple[str, str]]
+    ) -> list[Buffer]:
+        """Get the contents of files inside archives as bytes.
+
+        Args:
+            requests (Sequence[tuple[str, str]]): The (archive path, key)
+                pairs of the files.
+
+        Returns:
+            list[Buffer]: The contents of the files, in the order of requests.
+        """
+        raise NotImplementedError
+
+    def get(self, filepath: str) -> Buffer:
+        """Get values according to the filepath as bytes.
+
+        Args:
+            filepath (str): The path to the file. It consists of an archive
+                path together with the relative path inside it, e.g.: "/path/
+                to/file.ext/key/subkey/data". If the archive extension is not
+                given inside filepath, the function will search for the first
+                archive present in the path, i.e. "/path/to/file/key/subkey/
+                data" will also load /key/subkey/data from /path/to/file.ext.
+
+        Raises:
+            FileNotFoundError: If no suitable file exists.
+            ValueError: If key not found inside the archive.
+
+        Returns:
+            Buffer: The file content as bytes or memoryview.
+        """
+        archive_path, key = self.resolve(filepath)
+        self._check_archive(archive_path, filepath)
+        return self.get_from_archive(archive_path, key)
+
+    def get_many(self, filepaths: Sequence[str]) -> list[Buffer]:
+        """Get values according to the filepaths as bytes.
+
+        The files are grouped by archive, and the files of each archive are
+        read in order of their offset in the archive.
+
+        Args:
+            filepaths (Sequence[str]): The paths to the files, see get().
+
+        Raises:
+            FileNotFoundError: If no suitable file exists.
+            ValueError: If a key is not found inside its archive.
+
+        Returns:
+            list[Buffer]: The file contents as bytes or memoryview, in the
+                order of filepaths.
+        """
+        requests = []
+        for filepath in filepaths:
+            archive_path, key = self.resolve(filepath)
+            self._check_archive(archive_path, filepath)
+            requests.append((archive_path, key))
+        return self.get_many_from_archive(requests)
+
+
+class HDF5Backend(ArchiveBackend):
     """Backend for loading data from HDF5 files.
 
     This backend works with filepaths pointing to valid HDF5 files. We assume
@@ -114,12 +383,68 @@ class HDF5Backend(DataBackend):
 
     You can use the provided script at vis4d/data/datasets/to_hdf5.py to
     convert your dataset to the expected hdf5 format before using this backend.
+
+    Besides one dataset per file, the backend reads the packed layout written
+    by to_hdf5.py with --packed, which is detected automatically: the
+    contents of all files are concatenated in one contiguous uint8 dataset
+    (PACKED_BLOB), sorted by key, with their keys, offsets and lengths in an
+    index (PACKED_INDEX) that is loaded once per file. Files are then read
+    by slicing the blob, and consecutive files by a single read.
     """
 
-    def __init__(self) -> None:
-        """Creates an instance of the class."""
-        super().__init__()
-        self.db_cache: dict[str, File] = {}
+    ARCHIVE_TYPE = "HDF5"
+
+    # attribute marking files in packed layout, and its datasets
+    PACKED_LAYOUT = "packed"
+    PACKED_BLOB = "blob"
+    PACKED_INDEX = "index"
+
+    def __init__(self, max_open_archives: int = 64) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            max_open_archives (int): Maximum number of simultaneously open
+                archives per process. Defaults to 64.
+        """
+        super().__init__(max_open_archives)
+        self.packed_indices: dict[str, None | dict[str, tuple[int, int]]] = {}
+
+    def _get_packed_index(
+        self, hdf5_path: str, file: File
+    ) -> None | dict[str, tuple[int, int]]:
+        """Get the (offset, length) of each key if the file is packed.
+
+        Args:
+            hdf5_path (str): Path to the HDF5 file.
+            file (File): The open HDF5 file.
+
+        Returns:
+            None | dict[str, tuple[int, int]]: The index of the packed file,
+                None if the file is not in packed layout.
+        """
+        if hdf5_path not in self.packed_indices:
+            index = None
+            if file.attrs.get("layout") == self.PACKED_LAYOUT:
+                group = file[self.PACKED_INDEX]
+                keys = group["keys"].asstr()[()].tolist()
+                spans = zip(group["offsets"][()].tolist(), group["lengths"][()].tolist())
+                index = dict(zip(keys, spans))
+            self.packed_indices[hdf5_path] = index
+        return self.packed_indices[hdf5_path]
+
+    def invalidate_cache(self, prefix: str = "") -> None:
+        """Drop cached archive resolutions, packed indices and open archives.
+
+        Args:
+            prefix (str): Only drop the entries of paths starting with prefix.
+                Defaults to "", i.e. all entries.
+        """
+        super().invalidate_cache(prefix)
+        self.packed_indices = {
+            path: index
+            for path, index in self.packed_indices.items()
+            if not path.startswith(prefix)
+        }
 
     @staticmethod
     def _get_hdf5_path(filepath: str) -> tuple[str, list[str]]:
@@ -143,6 +468,8 @@ class HDF5Backend(DataBackend):
                 filepath = filepath + ".hdf5"
         return filepath, keys
 
+    _split_path = _get_hdf5_path
+
     def exists(self, filepath: str) -> bool:
         """Check if filepath exists.
 
@@ -152,16 +479,14 @@ class HDF5Backend(DataBackend):
         Returns:
             bool: True if file exists, False otherwise.
         """
-        hdf5_path, keys = self._get_hdf5_path(filepath)
+        hdf5_path, key = self.resolve(filepath)
         if not os.path.exists(hdf5_path):
             return False
         value_buf = self._get_client(hdf5_path, "r")
-
-        while keys:
-            value_buf = value_buf.get(keys.pop())
-            if value_buf is None:
-                return False
-        return True
+        index = self._get_packed_index(hdf5_path, value_buf)
+        if index is not None:
+            return key in index
+        return value_buf.get(key) is not None
 
     def set(self, filepath: str, content: bytes) -> None:
         """Set the file content.
@@ -179,6 +504,8 @@ class HDF5Backend(DataBackend):
         hdf5_path, keys_str = filepath.split(".hdf5")
         key_list = keys_str.split("/")
         file = self._get_client(hdf5_path + ".hdf5", "a")
+        if self._get_packed_index(hdf5_path + ".hdf5", file) is not None:
+            raise ValueError(f"{filepath} is in a packed HDF5 file, cannot write!")
         if len(key_list) > 1:
             group_str = "/".join(key_list[:-1])
             if group_str == "":
@@ -188,73 +515,205 @@ class HDF5Backend(DataBackend):
             key = key_list[-1]
             group.create_dataset(key, data=np.frombuffer(content, dtype="uint8"))
 
-    def _get_client(self, hdf5_path: str, mode: str) -> File:
-        """Get HDF5 client from path.
+    def _open(self, archive_path: str, mode: str) -> File:
+        """Open the HDF5 file at the given path.
 
         Args:
-            hdf5_path (str): Path to HDF5 file.
+            archive_path (str): Path to HDF5 file.
             mode (str): Mode to open the file in.
 
         Returns:
             File: the hdf5 file.
         """
-        if hdf5_path not in self.db_cache:
-            client = File(hdf5_path, mode)
-            self.db_cache[hdf5_path] = [client, mode]
-        else:
-            client, current_mode = self.db_cache[hdf5_path]
-            if current_mode != mode:
-                client.close()
-                client = File(hdf5_path, mode)
-                self.db_cache[hdf5_path] = [client, mode]
-        return client
+        return File(archive_path, mode)
 
-    def get(self, filepath: str) -> bytes:
-        """Get values according to the filepath as bytes.
+    def get_from_archive(self, archive_path: str, key: str) -> bytes:
+        """Get the content of a dataset inside an HDF5 file as bytes.
 
         Args:
-            filepath (str): The path to the file. It consists of an HDF5 path
-                together with the relative path inside it, e.g.: "/path/to/
-                file.hdf5/key/subkey/data". If no .hdf5 given inside filepath,
-                the function will search for the first .hdf5 file present in
-                the path, i.e. "/path/to/file/key/subkey/data" will also /key/
-                subkey/data from /path/to/file.hdf5.
+            archive_path (str): The path to the HDF5 file.
+            key (str): The key of the dataset, e.g. 'key/subkey/data'.
 
         Raises:
-            FileNotFoundError: If no suitable file exists.
             ValueError: If key not found inside hdf5 file.
 
         Returns:
             bytes: The file content in bytes
         """
-        hdf5_path, keys = self._get_hdf5_path(filepath)
+        file = self._get_client(archive_path, "r")
+        index = self._get_packed_index(archive_path, file)
+        if index is not None:
+            if key not in index:
+                raise ValueError(f"Value {key} not found in {archive_path}!")
+            offset, length = index[key]
+            return file[self.PACKED_BLOB][offset : offset + length].tobytes()
+        value_buf = file.get(key)
+        if value_buf is None:
+            raise ValueError(f"Value {key} not found in {archive_path}!")
+        return bytes(value_buf[()])
 
-        if not os.path.exists(hdf5_path):
-            raise FileNotFoundError(
-                f"Corresponding HDF5 file not found:" f" {filepath}"
-            )
-        value_buf = self._get_client(hdf5_path, "r")
-        url = "/".join(reversed(keys))
-        while keys:
-            value_buf = value_buf.get(keys.pop())
-            if value_buf is None:
-                raise ValueError(f"Value {url} not found in {filepath}!")
+    def get_many_from_archive(self, requests: Sequence[tuple[str, str]]) -> list[bytes]:
+        """Get the contents of datasets inside HDF5 files as bytes.
 
-        return bytes(value_buf[()])
+        The datasets of each file are read in order of their offset in the
+        file.
+
+        Args:
+            requests (Sequence[tuple[str, str]]): The (HDF5 path, key) pairs
+                of the datasets.
+
+        Raises:
+            ValueError: If a key is not found inside its hdf5 file.
 
+        Returns:
+            list[bytes]: The contents in bytes, in the order of requests.
+        """
+        contents: list[bytes] = [b""] * len(requests)
+        for hdf5_path, keys in _group_by_archive(requests).items():
+            file = self._get_client(hdf5_path, "r")
+            index = self._get_packed_index(hdf5_path, file)
+            if index is not None:
+                self._read_packed(hdf5_path, file, index, keys, contents)
+                continue
+            datasets = []
+            for index, key in keys:
+                dataset = file.get(key)
+                if dataset is None:
+                    raise ValueError(f"Value {key} not found in {hdf5_path}!")
+                offset = dataset.id.get_offset()
+                # datasets without contiguous storage have no offset
+                datasets.append((-1 if offset is None else offset, index, dataset))
+            for _, index, dataset in sorted(datasets, key=lambda item: item[:2]):
+                contents[index] = bytes(dataset[()])
+        return contents
+
+    def _read_packed(
+        self,
+        hdf5_path: str,
+        file: File,
+        index: dict[str, tuple[int, int]],
+        keys: list[tuple[int, str]],
+        contents: list[bytes],
+    ) -> None:
+        """Read files of a packed HDF5 file, merging adjacent ones in one read.
 
-class ZipBackend(DataBackend):
+        Args:
+            hdf5_path (str): Path to the HDF5 file.
+            file (File): The open HDF5 file.
+            index (dict[str, tuple[int, int]]): The index of the file.
+            keys (list[tuple[int, str]]): The (request index, key) pairs.
+            contents (list[bytes]): The contents per request index, filled in
+                place.
+
+        Raises:
+            ValueError: If a key is not found inside the hdf5 file.
+        """
+        spans = []
+        for request, key in keys:
+            if key not in index:
+                raise ValueError(f"Value {key} not found in {hdf5_path}!")
+            spans.append((*index[key], request))
+        spans.sort()
+        blob = file[self.PACKED_BLOB]
+        start = 0
+        while start < len(spans):
+            # extend the read over all files directly following each other
+            stop, end = start + 1, spans[start][0] + spans[start][1]
+            while stop < len(spans) and spans[stop][0] <= end:
+                end = max(end, spans[stop][0] + spans[stop][1])
+                stop += 1
+            begin = spans[start][0]
+            data = blob[begin:end]
+            for offset, length, request in spans[start:stop]:
+                contents[request] = data[offset - begin : offset - begin + length].tobytes()
+            start = stop
+
+
+class MappedZipFile(ZipFile):
+    """Read-only Zip file that serves stored members from a memory map.
+
+    Members stored without compression (e.g. the already compressed images
+    in SHIFT) are returned as memoryview slices of the mapped archive, i.e.
+    without decompression, copy or the lock on the shared file position.
+    Compressed members are read as usual.
+    """
+
+    def __init__(self, file: str) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            file (str): Path to the Zip file.
+        """
+        super().__init__(file, "r")
+        self.mmap = mmap(self.fp.fileno(), 0, access=ACCESS_READ)
+        self.view = memoryview(self.mmap)
+        self.data_offsets: dict[str, int] = {}
+
+    def _data_offset(self, info: ZipInfo) -> int:
+        """Get the offset of the member data, behind its local file header."""
+        offset = self.data_offsets.get(info.filename)
+        if offset is None:
+            header = self.view[info.header_offset : info.header_offset + 30]
+            if header[:4] != b"PK\x03\x04":
+                raise BadZipFile(f"Bad local file header of {info.filename}")
+            name_length = int.from_bytes(header[26:28], "little")
+            extra_length = int.from_bytes(header[28:30], "little")
+            offset = info.header_offset + 30 + name_length + extra_length
+            self.data_offsets[info.filename] = offset
+        return offset
+
+    def read_member(self, info: ZipInfo) -> Buffer:
+        """Read a member, as memoryview if it is stored uncompressed.
+
+        Args:
+            info (ZipInfo): The member.
+
+        Returns:
+            Buffer: The content of the member.
+        """
+        if info.compress_type != ZIP_STORED or info.flag_bits & 0x1:
+            with self.open(info) as zf:
+                return zf.read()
+        offset = self._data_offset(info)
+        return self.view[offset : offset + info.file_size]
+
+    def close(self) -> None:
+        """Close the file and, once no view is in use anymore, the map."""
+        super().close()
+        self.view.release()
+        try:
+            self.mmap.close()
+        except BufferError:
+            # slices handed out are still alive, the map is closed with them
+            pass
+
+
+class ZipBackend(ArchiveBackend):
     """Backend for loading data from Zip files.
 
     This backend works with filepaths pointing to valid Zip files. We assume
     that the given Zip file contains the whole dataset associated to this
     backend.
+
+    With use_mmap, archives opened for reading are memory-mapped, see
+    MappedZipFile, and the contents of members stored uncompressed are
+    returned as read-only memoryview instead of bytes. The views keep the
+    mapping alive until they are released.
     """
 
-    def __init__(self) -> None:
-        """Creates an instance of the class."""
-        super().__init__()
-        self.db_cache: dict[str, tuple[ZipFile, str]] = {}
+    ARCHIVE_TYPE = "zip"
+
+    def __init__(self, max_open_archives: int = 64, use_mmap: bool = False) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            max_open_archives (int): Maximum number of simultaneously open
+                archives per process. Defaults to 64.
+            use_mmap (bool): Whether to read stored members zero-copy from
+                memory-mapped archives. Defaults to False.
+        """
+        super().__init__(max_open_archives)
+        self.use_mmap = use_mmap
 
     @staticmethod
     def _get_zip_path(filepath: str) -> tuple[str, list[str]]:
@@ -278,6 +737,8 @@ class ZipBackend(DataBackend):
                 filepath = filepath + ".zip"
         return filepath, keys
 
+    _split_path = _get_zip_path
+
     def exists(self, filepath: str) -> bool:
         """Check if filepath exists.
 
@@ -287,12 +748,11 @@ class ZipBackend(DataBackend):
         Returns:
             bool: True if file exists, False otherwise.
         """
-        zip_path, keys = self._get_zip_path(filepath)
+        zip_path, url = self.resolve(filepath)
         if not os.path.exists(zip_path):
             return False
         file = self._get_client(zip_path, "r")
-        url = "/".join(reversed(keys))
-        return url in file.namelist()
+        return url in file.NameToInfo
 
     def set(self, filepath: str, content: bytes) -> None:
         """Write the file content to the zip file.
@@ -314,56 +774,94 @@ class ZipBackend(DataBackend):
         url = "/".join(reversed(keys))
         zip_file.writestr(url, content)
 
-    def _get_client(self, zip_path: str, mode: Literal["r", "w", "a", "x"]) -> ZipFile:
-        """Get Zip client from path.
+    def _open(self, archive_path: str, mode: Literal["r", "w", "a", "x"]) -> ZipFile:
+        """Open the Zip file at the given path.
 
         Args:
-            zip_path (str): Path to Zip file.
+            archive_path (str): Path to Zip file.
             mode (str): Mode to open the file in.
 
         Returns:
-            ZipFile: the hdf5 file.
+            ZipFile: the zip file.
         """
         assert len(mode) == 1, "Mode must be a single character for zip file."
-        if zip_path not in self.db_cache:
-            client = ZipFile(zip_path, mode)
-            self.db_cache[zip_path] = (client, mode)
-        else:
-            client, current_mode = self.db_cache[zip_path]
-            if current_mode != mode:
-                client.close()
-                client = ZipFile(zip_path, mode)  # pylint:disable=consider-using-with
-                self.db_cache[zip_path] = (client, mode)
-        return client
+        if self.use_mmap and mode == "r":
+            return MappedZipFile(archive_path)
+        return ZipFile(archive_path, mode)  # pylint:disable=consider-using-with
 
-    def get(self, filepath: str) -> bytes:
-        """Get values according to the filepath as bytes.
+    def get_from_archive(self, archive_path: str, key: str) -> Buffer:
+        """Get the content of a member of a zip file as bytes.
 
         Args:
-            filepath (str): The path to the file. It consists of an Zip path
-                together with the relative path inside it, e.g.: "/path/to/
-                file.zip/key/subkey/data". If no .zip given inside filepath,
-                the function will search for the first .zip file present in
-                the path, i.e. "/path/to/file/key/subkey/data" will also /key/
-                subkey/data from /path/to/file.zip.
+            archive_path (str): The path to the zip file.
+            key (str): The name of the member, e.g. 'key/subkey/data'.
 
         Raises:
-            ZipFileNotFoundError: If no suitable file exists.
-            OSError: If the file cannot be opened.
             ValueError: If key not found inside zip file.
 
         Returns:
-            bytes: The file content in bytes
+            Buffer: The file content in bytes, or as memoryview with use_mmap
+                if the member is stored uncompressed.
         """
-        zip_path, keys = self._get_zip_path(filepath)
-
-        if not os.path.exists(zip_path):
-            raise FileNotFoundError(f"Corresponding zip file not found:" f" {filepath}")
-        zip_file = self._get_client(zip_path, "r")
-        url = "/".join(reversed(keys))
+        zip_file = self._get_client(archive_path, "r")
         try:
-            with zip_file.open(url) as zf:
-                content = zf.read()
+            info = zip_file.getinfo(key)
         except KeyError as e:
-            raise ValueError(f"Value '{url}' not found in {zip_path}!") from e
-        return bytes(content)
+            raise ValueError(f"Value '{key}' not found in {archive_path}!") from e
+        return _read_member(zip_file, info)
+
+    def get_many_from_archive(
+        self, requests: Sequence[tuple[str, str]]
+    ) -> list[Buffer]:
+        """Get the contents of members of zip files as bytes.
+
+        The members of each zip file are read in order of their offset in
+        the file.
+
+        Args:
+            requests (Sequence[tuple[str, str]]): The (zip path, member name)
+                pairs.
+
+        Raises:
+            ValueError: If a key is not found inside its zip file.
+
+        Returns:
+            list[Buffer]: The contents in bytes, or as memoryview with
+                use_mmap if stored uncompressed, in the order of requests.
+        """
+        contents: list[Buffer] = [b""] * len(requests)
+        for zip_path, keys in _group_by_archive(requests).items():
+            zip_file = self._get_client(zip_path, "r")
+            members = []
+            for index, key in keys:
+                try:
+                    members.append((zip_file.getinfo(key), index))
+                except KeyError as e:
+                    raise ValueError(f"Value '{key}' not found in {zip_path}!") from e
+            members.sort(key=lambda member: (member[0].header_offset, member[1]))
+            for info, index in members:
+                contents[index] = _read_member(zip_file, info)
+        return contents
+
+
+def _read_member(zip_file: ZipFile, info: ZipInfo) -> Buffer:
+    """Read a member of a zip file, zero-copy if the file is memory-mapped."""
+    if isinstance(zip_file, MappedZipFile):
+        return zip_file.read_member(info)
+    with zip_file.open(info) as zf:
+        return zf.read()
+
+
+def _group_by_archive(
+    requests: Sequence[tuple[str, str]]
+) -> dict[str, list[tuple[int, str]]]:
+    """Group (archive path, key) requests by archive.
+
+    Returns:
+        dict[str, list[tuple[int, str]]]: Mapping from archive path to the
+            (request index, key) pairs of its requests.
+    """
+    archives: dict[str, list[tuple[int, str]]] = defaultdict(list)
+    for index, (archive_path, key) in enumerate(requests):
+        archives[archive_path].append((index, key))
+    return archives
@@ -0,0 +1,475 @@
+"""Cache of file contents in memory, in front of another backend.
+
+The cache can be shared by the DataLoader workers via shared memory, see
+CachedBackend.
+"""
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import weakref
+from collections.abc import Sequence
+from mmap import mmap
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from shift_dev.types import NDArrayI32, NDArrayI64, NDArrayU8
+
+from .backend import Buffer, DataBackend
+
+# directory of the shared memory of CachedBackend
+_SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# slots of the header of CachedBackend
+_FREE_TOP, _HAND, _HITS, _MISSES, _EVICTIONS, _ENTRIES, _BYTES = range(7)
+_HEADER_SIZE = 16
+
+
+class CachedBackend(DataBackend):
+    """Cache of file contents in front of another backend.
+
+    Contents read via get() and get_many() are kept in memory up to a budget
+    of max_bytes, so that files read again, e.g. in the next epoch or by
+    another view or task of the same sample, are served from memory. When
+    the budget is exceeded, entries are evicted by the given policy, "lru"
+    for the least recently used one, or "clock", which approximates LRU by
+    one reference bit per entry and a hand sweeping over the entries.
+
+    Contents are stored in blocks of block_size bytes, so that entries of any
+    size share one fixed memory arena. Each file takes whole blocks, i.e. up
+    to block_size - 1 bytes more than its size, so block_size should be
+    small compared to the files cached. The entries are indexed by an open
+    addressing hash table of their filepath digests and linked in a doubly
+    linked list, in order of use for LRU and in the order swept by the hand
+    for CLOCK, so that lookups and evictions take constant time. Besides the
+    blocks, this takes about 49 bytes per entry, see max_entries, and 8 bytes
+    per block. All of it lives in one buffer. With shared, this buffer is a
+    file in shared memory, and all DataLoader workers read and fill the same
+    cache under a lock, so that every file is read from the backend once.
+    Otherwise, each process has its own cache, which is empty in new workers.
+
+    The counters of hits, misses and evictions, see stats(), are shared, too.
+    """
+
+    POLICIES = ("lru", "clock")
+
+    def __init__(
+        self,
+        backend: DataBackend,
+        max_bytes: int = 1 << 30,
+        policy: str = "lru",
+        shared: bool = False,
+        block_size: int = 1 << 12,
+        max_entries: None | int = None,
+        multiprocessing_context: None | str = None,
+    ) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            backend (DataBackend): The backend to read uncached files from.
+            max_bytes (int): Memory budget of the cached contents in bytes.
+                Defaults to 1 GiB.
+            policy (str): Eviction policy, "lru" or "clock". Defaults to
+                "lru".
+            shared (bool): Whether to share the cache among processes, e.g.
+                DataLoader workers, via shared memory. The memory is released
+                once the process that created the backend exits or calls
+                close(), and all processes using it are done. Defaults to
+                False.
+            block_size (int): Size of the blocks the contents are stored in.
+                Defaults to 4 KiB.
+            max_entries (None | int): Maximum number of cached files.
+                Defaults to None, one per block, the most files of at least
+                one byte that fit in max_bytes. Set it lower for large files
+                to save the memory of the unused entries.
+            multiprocessing_context (None | str): Start method of the
+                processes sharing the cache, e.g. "spawn", as passed to the
+                DataLoader. Defaults to None, the default start method.
+        """
+        super().__init__()
+        assert policy in self.POLICIES, f"Invalid policy {policy}."
+        assert max_bytes >= block_size > 0, "max_bytes must hold a block."
+        assert max_entries is None or max_entries > 0, "Invalid max_entries."
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.shared = shared
+        self.block_size = block_size
+        self.num_blocks = max_bytes // block_size
+        self.num_entries = self.num_blocks if max_entries is None else max_entries
+        # a table at most half full, which keeps the probe sequences short
+        self.num_slots = 2 * self.num_entries
+        self._path: None | str = None
+        if shared:
+            # a file in shared memory, mapped by every process using it
+            fd, self._path = tempfile.mkstemp(
+                prefix="shift_dev_cache_", dir=_SHARED_DIR
+            )
+            try:
+                os.ftruncate(fd, self._get_nbytes())
+                self._buffer: Any = mmap(fd, self._get_nbytes())
+            finally:
+                os.close(fd)
+            self._finalizer = weakref.finalize(
+                self, _remove_shared, self._path, os.getpid()
+            )
+            self._lock: Any = multiprocessing.get_context(
+                multiprocessing_context
+            ).Lock()
+        else:
+            self._lock = threading.Lock()
+            self._buffer = bytearray(self._get_nbytes())
+        self._header: NDArrayI64
+        self._keys: npt.NDArray[np.uint64]
+        self._sizes: NDArrayI64
+        self._heads: NDArrayI32
+        self._refs: NDArrayU8
+        self._prev: NDArrayI32
+        self._succ: NDArrayI32
+        self._free_entries: NDArrayI32
+        self._table: NDArrayI32
+        self._next: NDArrayI32
+        self._free_stack: NDArrayI32
+        self._arena: NDArrayU8
+        self._map_arrays()
+        self._reset()
+
+    def _get_layout(self) -> list[tuple[str, Any, int]]:
+        """Get the name, type and length of the arrays in the buffer."""
+        return [
+            ("header", np.int64, _HEADER_SIZE),
+            ("keys", np.uint64, 2 * self.num_entries),
+            ("sizes", np.int64, self.num_entries),
+            ("heads", np.int32, self.num_entries),
+            ("refs", np.uint8, self.num_entries),
+            # the last element is the sentinel of the list
+            ("prev", np.int32, self.num_entries + 1),
+            ("succ", np.int32, self.num_entries + 1),
+            ("free_entries", np.int32, self.num_entries),
+            ("table", np.int32, self.num_slots),
+            ("next", np.int32, self.num_blocks),
+            ("free_stack", np.int32, self.num_blocks),
+            ("arena", np.uint8, self.num_blocks * self.block_size),
+        ]
+
+    def _get_nbytes(self) -> int:
+        """Get the size of the buffer, with 64 byte aligned arrays."""
+        return sum(
+            -(-np.dtype(dtype).itemsize * length // 64) * 64
+            for _, dtype, length in self._get_layout()
+        )
+
+    def _map_arrays(self) -> None:
+        """Create the arrays viewing the buffer."""
+        arrays: dict[str, Any] = {}
+        offset = 0
+        for name, dtype, length in self._get_layout():
+            arrays[name] = np.frombuffer(self._buffer, dtype, length, offset)
+            offset += -(-np.dtype(dtype).itemsize * length // 64) * 64
+        self._header = arrays["header"]
+        self._keys = arrays["keys"].reshape(-1, 2)
+        self._sizes = arrays["sizes"]
+        self._heads = arrays["heads"]
+        self._refs = arrays["refs"]
+        self._prev = arrays["prev"]
+        self._succ = arrays["succ"]
+        self._free_entries = arrays["free_entries"]
+        self._table = arrays["table"]
+        self._next = arrays["next"]
+        self._free_stack = arrays["free_stack"]
+        self._arena = arrays["arena"]
+
+    def _reset(self) -> None:
+        """Initialize the arrays of an empty cache."""
+        self._free_stack[:] = np.arange(self.num_blocks, dtype=np.int32)
+        self._header[_FREE_TOP] = self.num_blocks
+        self._free_entries[:] = np.arange(self.num_entries, dtype=np.int32)
+        self._table[:] = -1
+        sentinel = self.num_entries
+        self._prev[sentinel] = self._succ[sentinel] = sentinel
+        self._header[_HAND] = sentinel
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Pickle the shared cache by its path, and a local cache as empty."""
+        arrays = {f"_{name}" for name, _, _ in self._get_layout()}
+        state = {
+            name: value
+            for name, value in self.__dict__.items()
+            if name not in {"_buffer", "_finalizer"} and name not in arrays
+        }
+        if not self.shared:
+            state["_lock"] = None
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Map the shared cache, or create an empty local cache."""
+        self.__dict__.update(state)
+        if self.shared:
+            assert self._path is not None
+            with open(self._path, "r+b") as file:
+                self._buffer = mmap(file.fileno(), self._get_nbytes())
+            self._map_arrays()
+        else:
+            self._lock = threading.Lock()
+            self._buffer = bytearray(self._get_nbytes())
+            self._map_arrays()
+            self._reset()
+
+    def close(self) -> None:
+        """Release the shared memory once unmapped, if created by this process.
+
+        The cache stays usable by the processes that have mapped it already.
+        """
+        if self.shared and hasattr(self, "_finalizer"):
+            self._finalizer()
+
+    def stats(self) -> dict[str, int]:
+        """Get the counters of the cache.
+
+        Returns:
+            dict[str, int]: The number of hits, misses and evictions, and the
+                number of entries and bytes cached.
+        """
+        with self._lock:
+            return {
+                "hits": int(self._header[_HITS]),
+                "misses": int(self._header[_MISSES]),
+                "evictions": int(self._header[_EVICTIONS]),
+                "entries": int(self._header[_ENTRIES]),
+                "bytes": int(self._header[_BYTES]),
+            }
+
+    @staticmethod
+    def _get_key(filepath: str) -> tuple[int, int]:
+        """Get the 128 bit digest of a filepath."""
+        digest = hashlib.blake2b(filepath.encode("utf8"), digest_size=16).digest()
+        return (
+            int.from_bytes(digest[:8], "little"),
+            int.from_bytes(digest[8:], "little"),
+        )
+
+    def _find_slot(self, key: tuple[int, int]) -> int:
+        """Get the table slot of a key, or the empty slot ending its probes."""
+        slot = key[0] % self.num_slots
+        while True:
+            entry = int(self._table[slot])
+            if entry < 0 or (
+                self._keys[entry, 0] == key[0] and self._keys[entry, 1] == key[1]
+            ):
+                return slot
+            slot = (slot + 1) % self.num_slots
+
+    def _find(self, key: tuple[int, int]) -> int:
+        """Get the entry of a key, or -1 if not cached."""
+        return int(self._table[self._find_slot(key)])
+
+    def _link(self, entry: int, before: int) -> None:
+        """Insert an entry into the list before another entry or the sentinel."""
+        prev = int(self._prev[before])
+        self._prev[entry], self._succ[entry] = prev, before
+        self._succ[prev] = self._prev[before] = entry
+
+    def _unlink(self, entry: int) -> None:
+        """Remove an entry from the list."""
+        prev, succ = int(self._prev[entry]), int(self._succ[entry])
+        self._succ[prev], self._prev[succ] = succ, prev
+
+    def _read_entry(self, entry: int) -> bytes:
+        """Read the content of an entry and mark it as used."""
+        if self.policy == "lru":
+            # the most recently used entry is last
+            self._unlink(entry)
+            self._link(entry, self.num_entries)
+        else:
+            self._refs[entry] = 1
+        chunks = []
+        block, remaining = int(self._heads[entry]), int(self._sizes[entry])
+        while remaining > 0:
+            start = block * self.block_size
+            length = min(remaining, self.block_size)
+            chunks.append(self._arena[start : start + length].tobytes())
+            remaining -= length
+            block = int(self._next[block])
+        return b"".join(chunks)
+
+    def _get_cached(self, filepaths: Sequence[str]) -> list[None | bytes]:
+        """Get the cached contents of filepaths, None if not cached."""
+        contents: list[None | bytes] = []
+        with self._lock:
+            for filepath in filepaths:
+                entry = self._find(self._get_key(filepath))
+                if entry < 0:
+                    self._header[_MISSES] += 1
+                    contents.append(None)
+                else:
+                    self._header[_HITS] += 1
+                    contents.append(self._read_entry(entry))
+        return contents
+
+    def _select_victim(self) -> int:
+        """Select the entry to evict by the policy."""
+        sentinel = self.num_entries
+        if self.policy == "lru":
+            return int(self._succ[sentinel])
+        # clock: clear the reference bits up to the first unreferenced entry
+        hand = int(self._header[_HAND])
+        while hand == sentinel or self._refs[hand]:
+            if hand != sentinel:
+                self._refs[hand] = 0
+            hand = int(self._succ[hand])
+        self._header[_HAND] = hand
+        return hand
+
+    def _remove(self, entry: int) -> None:
+        """Remove an entry, freeing its blocks, slot and list node."""
+        block, remaining = int(self._heads[entry]), int(self._sizes[entry])
+        top = int(self._header[_FREE_TOP])
+        while remaining > 0:
+            self._free_stack[top] = block
+            top += 1
+            remaining -= self.block_size
+            block = int(self._next[block])
+        self._header[_FREE_TOP] = top
+
+        # backward shift deletion, which keeps the probe sequences intact
+        # without tombstones
+        slot = self._find_slot(
+            (int(self._keys[entry, 0]), int(self._keys[entry, 1]))
+        )
+        hole, slot = slot, (slot + 1) % self.num_slots
+        while self._table[slot] >= 0:
+            home = int(self._keys[self._table[slot], 0]) % self.num_slots
+            # keep entries whose home lies cyclically in (hole, slot]
+            distance = (slot - hole) % self.num_slots
+            if not 0 < (home - hole) % self.num_slots <= distance:
+                self._table[hole] = self._table[slot]
+                hole = slot
+            slot = (slot + 1) % self.num_slots
+        self._table[hole] = -1
+
+        if self._header[_HAND] == entry:
+            self._header[_HAND] = self._succ[entry]
+        self._unlink(entry)
+        self._header[_ENTRIES] -= 1
+        self._free_entries[self.num_entries - self._header[_ENTRIES] - 1] = entry
+        self._header[_BYTES] -= self._sizes[entry]
+
+    def _evict(self, entry: int) -> None:
+        """Evict an entry, counted in the evictions."""
+        self._remove(entry)
+        self._header[_EVICTIONS] += 1
+
+    def _put(self, filepath: str, content: Buffer) -> None:
+        """Cache the content of filepath, evicting entries if needed."""
+        size = len(content)
+        num_blocks = -(-size // self.block_size)
+        if num_blocks > self.num_blocks:
+            return
+        key = self._get_key(filepath)
+        with self._lock:
+            if self._find(key) >= 0:
+                # cached by another process meanwhile
+                return
+            while (
+                self._header[_FREE_TOP] < num_blocks
+                or self._header[_ENTRIES] >= self.num_entries
+            ):
+                self._evict(self._select_victim())
+
+            data = np.frombuffer(content, dtype=np.uint8)
+            top = int(self._header[_FREE_TOP])
+            blocks = self._free_stack[top - num_blocks : top][::-1].copy()
+            self._header[_FREE_TOP] = top - num_blocks
+            for i, block in enumerate(blocks.tolist()):
+                chunk = data[i * self.block_size : (i + 1) * self.block_size]
+                start = block * self.block_size
+                self._arena[start : start + len(chunk)] = chunk
+            if num_blocks > 0:
+                self._next[blocks[:-1]] = blocks[1:]
+                self._next[blocks[-1]] = -1
+
+            entry = int(
+                self._free_entries[self.num_entries - self._header[_ENTRIES] - 1]
+            )
+            self._keys[entry] = key
+            self._sizes[entry] = size
+            self._heads[entry] = blocks[0] if num_blocks > 0 else -1
+            self._refs[entry] = 0
+            self._table[self._find_slot(key)] = entry
+            if self.policy == "lru":
+                self._link(entry, self.num_entries)
+            else:
+                # behind the hand, i.e. the last entry it reaches
+                self._link(entry, int(self._header[_HAND]))
+            self._header[_ENTRIES] += 1
+            self._header[_BYTES] += size
+
+    def get(self, filepath: str) -> Buffer:
+        """Get the file content at filepath, from the cache if cached.
+
+        Args:
+            filepath (str): The filepath to retrieve the data from.
+
+        Returns:
+            Buffer: The content of the file, as bytes if cached, otherwise as
+                returned by the wrapped backend, e.g. memoryview.
+        """
+        content = self._get_cached([filepath])[0]
+        if content is None:
+            content = self.backend.get(filepath)
+            self._put(filepath, content)
+        return content
+
+    def get_many(self, filepaths: Sequence[str]) -> list[Buffer]:
+        """Get the file contents at filepaths, reading uncached ones at once.
+
+        Args:
+            filepaths (Sequence[str]): The filepaths to retrieve the data from.
+
+        Returns:
+            list[Buffer]: The contents of the files, in the order of
+                filepaths, see get().
+        """
+        contents = self._get_cached(filepaths)
+        missing = [i for i, content in enumerate(contents) if content is None]
+        if missing:
+            fetched = self.backend.get_many([filepaths[i] for i in missing])
+            for i, content in zip(missing, fetched):
+                self._put(filepaths[i], content)
+                contents[i] = content
+        return contents  # type: ignore
+
+    def set(self, filepath: str, content: bytes) -> None:
+        """Set the file content at filepath in the backend and the cache.
+
+        Args:
+            filepath (str): The filepath to store the data at.
+            content (bytes): The content to store as bytes.
+        """
+        self.backend.set(filepath, content)
+        with self._lock:
+            entry = self._find(self._get_key(filepath))
+            if entry >= 0:
+                self._remove(entry)
+        self._put(filepath, content)
+
+    def exists(self, filepath: str) -> bool:
+        """Check if filepath exists in the backend.
+
+        Args:
+            filepath (str): The filepath to check.
+
+        Returns:
+            bool: True if the filepath exists, False otherwise.
+        """
+        return self.backend.exists(filepath)
+
+
+def _remove_shared(path: str, pid: int) -> None:
+    """Remove a shared cache file in the process that created it."""
+    if os.getpid() == pid and os.path.exists(path):
+        os.remove(path)
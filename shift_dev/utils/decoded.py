@@ -0,0 +1,106 @@
+"""Reader of pre-decoded data groups.
+
+A data group, e.g. the images of a view, is stored decoded in one NPY file of
+fixed-shape arrays, [N, C, H, W] uint8 for images, [N, H, W] uint8 for
+semantic segmentation and [N, H, W] uint32 (uint8 for 8 bit) or float16 for
+depth. A JSON file next to it lists the key of each row, i.e. the path of the
+file it was decoded from inside the zip file or folder,
+"<seq>/<frame>_<group>_<view>.<ext>", and for float16 depth the maximum depth
+the meters were computed with.
+See shift_dev.io.to_decoded for the conversion.
+"""
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+import numpy.typing as npt
+
+DECODED_SUFFIX = "_decoded"
+# maximum depth of float16 depth decoded before it was recorded
+DEFAULT_MAX_DEPTH = 1000.0
+
+
+def get_decoded_paths(path: str) -> tuple[str, str]:
+    """Get the paths of the decoded array and its keys for a data group.
+
+    Args:
+        path (str): Path to the zip file, HDF5 file or folder of the group.
+
+    Returns:
+        tuple[str, str]: Paths to the NPY and the JSON file.
+    """
+    base = os.path.splitext(path.rstrip("/"))[0] + DECODED_SUFFIX
+    return base + ".npy", base + ".json"
+
+
+class DecodedArray:
+    """Pre-decoded data of a data group, memory-mapped per process.
+
+    Rows are returned as views into the memory map, so that reading a sample
+    neither copies nor decodes, and torch.from_numpy turns them into tensors
+    without a copy. The map is copy-on-write, writes to a row never reach the
+    file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Creates an instance of the class.
+
+        Args:
+            path (str): Path to the zip file, HDF5 file or folder the data
+                group was decoded from, see get_decoded_paths.
+        """
+        self.array_path, keys_path = get_decoded_paths(path)
+        with open(keys_path, "r", encoding="utf-8") as fp:
+            meta = json.load(fp)
+        self.group: str = meta["group"]
+        self.max_depth: float = meta.get("max_depth", DEFAULT_MAX_DEPTH)
+        self.rows = {key: row for row, key in enumerate(meta["keys"])}
+        self._array: None | npt.NDArray[np.generic] = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """Check if the data group at path has been decoded."""
+        return all(os.path.exists(p) for p in get_decoded_paths(path))
+
+    @property
+    def array(self) -> npt.NDArray[np.generic]:
+        """The memory-mapped array, opened on first use in each process."""
+        if self._array is None:
+            self._array = np.load(self.array_path, mmap_mode="c")
+        return self._array
+
+    @staticmethod
+    def get_key(filepath: str) -> str:
+        """Get the key of a file from its path, "<seq>/<file name>"."""
+        head, name = os.path.split(filepath)
+        return f"{os.path.basename(head)}/{name}"
+
+    def __contains__(self, filepath: str) -> bool:
+        """Check if the file at filepath has been decoded."""
+        return self.get_key(filepath) in self.rows
+
+    def get(self, filepath: str) -> npt.NDArray[np.generic]:
+        """Get the decoded content of the file at filepath.
+
+        Args:
+            filepath (str): Path to the file, only its last two components,
+                the sequence and the file name, are used.
+
+        Raises:
+            ValueError: If the file has not been decoded.
+
+        Returns:
+            npt.NDArray[np.generic]: View of the decoded content.
+        """
+        key = self.get_key(filepath)
+        if key not in self.rows:
+            raise ValueError(f"File {key} not found in {self.array_path}!")
+        return self.array[self.rows[key]]
+
+    def __getstate__(self) -> dict[str, object]:
+        """Drop the memory map when pickling, e.g. to workers."""
+        state = self.__dict__.copy()
+        state["_array"] = None
+        return state
@@ -0,0 +1,297 @@
+"""Incremental parsing of large Scalabel JSON files.
+
+json.load materializes the whole document as one python object tree, which
+for the SHIFT annotation files is many times larger than the file itself.
+iter_scalabel_json instead walks the top-level structure of the file and
+decodes the elements of the frames array one at a time, holding only a
+bounded window of the file text in memory. index_json_array locates the
+elements of the frames array without decoding them, so that they can be
+decoded in parallel.
+"""
+from __future__ import annotations
+
+import json
+import re
+from collections.abc import Iterator
+from typing import Any, TextIO
+
+import numpy as np
+
+from shift_dev.types import DictStrAny, NDArrayI64, NDArrayU8
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# the JSON string key (and colon) directly preceding an array
+_ARRAY_KEY = re.compile(rb'("(?:[^"\\]|\\.)*")\s*:\s*$')
+_MAX_NUMBER_LENGTH = 64
+
+
+class _JSONStreamReader:
+    """Buffered reader decoding JSON values from a text stream."""
+
+    def __init__(self, file: TextIO, chunk_size: int) -> None:
+        """Creates an instance of the class."""
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, min_size: int) -> bool:
+        """Append at least min_size characters to the buffer if available."""
+        if self.eof:
+            return False
+        chunk = self.file.read(max(min_size, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        if self.pos > self.chunk_size:
+            # drop consumed text to keep the buffer bounded
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        self.buffer += chunk
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, "" at the end."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        """Consume the next non-whitespace character, which must be char."""
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value may continue beyond the buffered text, read at
+                # least as much again to keep retries amortized linear
+                if not self._fill(len(self.buffer) - self.pos):
+                    raise
+                continue
+            # a value ending close to the buffer end may be a truncated
+            # number (e.g. "2." of "2.5e3"), so retry with more text
+            if len(self.buffer) - end < _MAX_NUMBER_LENGTH and self._fill(
+                self.chunk_size
+            ):
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Decode the elements of the next JSON array one by one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise json.JSONDecodeError(
+                    "Expecting ',' delimiter", self.buffer, self.pos - 1
+                )
+
+
+def iter_scalabel_json(
+    filepath: str, array_key: str = "frames", chunk_size: int = 1 << 22
+) -> Iterator[tuple[str, Any]]:
+    """Incrementally parse a Scalabel JSON file.
+
+    Each element of the array stored under array_key is yielded separately as
+    (array_key, element), all other top-level entries (e.g. config) are
+    yielded as a whole as (key, value), in file order. If the file holds a
+    top-level list, its elements are yielded as (array_key, element).
+
+    Args:
+        filepath (str): Path to the JSON file.
+        array_key (str): Top-level key of the array to stream. Defaults to
+            "frames".
+        chunk_size (int): Number of characters read at once. Defaults to 4M.
+
+    Raises:
+        TypeError: If the file contains neither dict nor list.
+        json.JSONDecodeError: If the file is not valid JSON.
+
+    Yields:
+        tuple[str, Any]: Top-level key and (partial) value.
+    """
+    with open(filepath, mode="r", encoding="utf-8") as file:
+        reader = _JSONStreamReader(file, chunk_size)
+        char = reader.peek()
+        if char == "[":
+            for element in reader.iter_array():
+                yield array_key, element
+            return
+        if char != "{":
+            raise TypeError("The input file contains neither dict nor list.")
+        reader.pos += 1
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.decode()
+            reader.expect(":")
+            if key == array_key and reader.peek() == "[":
+                for element in reader.iter_array():
+                    yield key, element
+            else:
+                yield key, reader.decode()
+            char = reader.peek()
+            reader.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise json.JSONDecodeError(
+                    "Expecting ',' delimiter", reader.buffer, reader.pos - 1
+                )
+
+
+def _scan_block(
+    block: NDArrayU8, escaped: bool, in_string: bool, depth: int
+) -> tuple[dict[str, NDArrayI64], bool, bool, int]:
+    """Locate structural characters in a block of JSON text.
+
+    Args:
+        block (NDArrayU8): The JSON bytes.
+        escaped (bool): Whether the first byte is escaped by a backslash.
+        in_string (bool): Whether the block starts inside a string.
+        depth (int): Nesting depth at the start of the block.
+
+    Returns:
+        tuple[dict[str, NDArrayI64], bool, bool, int]: Block positions of
+            opening brackets, closing brackets and commas outside of strings
+            together with their depth (the number of enclosing containers,
+            not counting a bracket itself), and the state at the block end.
+    """
+    is_escaped = np.zeros(len(block) + 1, dtype=bool)
+    is_escaped[0] = escaped
+    # backslashes are rare in annotation files, resolve their runs in python
+    for pos in np.flatnonzero(block == ord("\\")).tolist():
+        if not is_escaped[pos]:
+            is_escaped[pos + 1] = True
+    quotes = block == ord('"')
+    quotes &= ~is_escaped[:-1]
+    # inside a string after the current character, by the parity of the
+    # string delimiters seen, accumulated as bool to keep the memory small
+    parity = np.logical_xor.accumulate(quotes)
+    if in_string:
+        np.logical_not(parity, out=parity)
+    end_in_string = bool(parity[-1]) if len(block) > 0 else in_string
+    outside = np.logical_or(parity, quotes, out=parity)
+    np.logical_not(outside, out=outside)
+    del quotes
+
+    # only the brackets and commas outside of strings are kept as positions,
+    # so that the depth is accumulated over those instead of the whole block
+    is_open = (block == ord("{")) | (block == ord("["))
+    brackets = is_open | (block == ord("}")) | (block == ord("]"))
+    brackets &= outside
+    bracket_pos = np.flatnonzero(brackets)
+    del brackets
+    bracket_open = is_open[bracket_pos]
+    del is_open
+    comma_pos = np.flatnonzero(outside & (block == ord(",")))
+    del outside
+
+    depth_after = np.cumsum(np.where(bracket_open, 1, -1)) + depth
+    # depth before each comma, after the last bracket preceding it
+    depth_before = np.concatenate([[depth], depth_after])
+    positions = {
+        "opens": bracket_pos[bracket_open],
+        "opens_depth": depth_after[bracket_open] - 1,
+        "closes": bracket_pos[~bracket_open],
+        "closes_depth": depth_after[~bracket_open],
+        "commas": comma_pos,
+        "commas_depth": depth_before[np.searchsorted(bracket_pos, comma_pos)],
+    }
+    end_depth = int(depth_before[-1])
+    return positions, bool(is_escaped[-1]), end_in_string, end_depth
+
+
+def index_json_array(
+    filepath: str, array_key: str = "frames", block_size: int = 1 << 24
+) -> tuple[NDArrayI64, DictStrAny]:
+    """Locate the elements of a top-level array in a Scalabel JSON file.
+
+    The structure of the file is scanned with vectorized numpy operations in
+    blocks of block_size bytes, without decoding any values, so that the
+    elements can be decoded independently, e.g. by several processes.
+
+    Args:
+        filepath (str): Path to the JSON file.
+        array_key (str): Top-level key of the array to index. Defaults to
+            "frames".
+        block_size (int): Number of bytes scanned at once. Defaults to 16M.
+
+    Raises:
+        TypeError: If the file contains neither dict nor list.
+        json.JSONDecodeError: If the file structure is not valid JSON.
+
+    Returns:
+        tuple[NDArrayI64, DictStrAny]: Byte spans [N, 2] of the array
+            elements, and all other top-level entries of the file.
+    """
+    data = np.memmap(filepath, dtype=np.uint8, mode="r")
+    text = data[: min(len(data), 4096)].tobytes().lstrip()
+    if text[:1] not in (b"{", b"["):
+        raise TypeError("The input file contains neither dict nor list.")
+    level = 1 if text[:1] == b"{" else 0
+    escaped, in_string, depth = False, False, 0
+    candidates, closes, commas = [], [], []
+    for start in range(0, len(data), block_size):
+        positions, escaped, in_string, depth = _scan_block(
+            np.asarray(data[start : start + block_size]), escaped, in_string, depth
+        )
+        candidates.append(positions["opens"][positions["opens_depth"] == level] + start)
+        closes.append(positions["closes"][positions["closes_depth"] == level] + start)
+        commas.append(
+            positions["commas"][positions["commas_depth"] == level + 1] + start
+        )
+    if depth != 0 or in_string:
+        raise json.JSONDecodeError("Unterminated JSON document", filepath, len(data))
+
+    open_pos, close_pos = np.concatenate(candidates), np.concatenate(closes)
+    array_open = -1
+    for pos in open_pos.tolist():
+        if data[pos] != ord("["):
+            continue
+        if level == 0:
+            array_open = pos
+            break
+        before = data[max(0, pos - 4096) : pos].tobytes()
+        match = _ARRAY_KEY.search(before)
+        if match is not None and json.loads(match.group(1)) == array_key:
+            array_open = pos
+            break
+    if array_open < 0:
+        config_text = data.tobytes() if level == 1 else b"{}"
+        return np.zeros((0, 2), dtype=np.int64), json.loads(config_text)
+
+    array_close = int(close_pos[np.searchsorted(close_pos, array_open)])
+    separators = np.concatenate(commas)
+    separators = separators[(separators > array_open) & (separators < array_close)]
+    bounds = np.concatenate([[array_open], separators, [array_close]])
+    spans = np.stack([bounds[:-1] + 1, bounds[1:]], axis=1).astype(np.int64)
+    if len(separators) == 0 and not data[array_open + 1 : array_close].tobytes().strip():
+        spans = spans[:0]
+
+    rest: DictStrAny = {}
+    if level == 1:
+        rest = json.loads(
+            data[:array_open].tobytes() + b"[]" + data[array_close + 1 :].tobytes()
+        )
+        rest.pop(array_key)
+    return spans, rest
@@ -3,12 +3,21 @@ from __future__ import annotations
 
 from io import BytesIO
 
+import cv2
 import numpy as np
 import numpy.typing as npt
 import plyfile
 from PIL import Image, ImageOps
 
+try:
+    import simplejpeg
+
+    SIMPLEJPEG_AVAILABLE = True
+except ImportError:
+    SIMPLEJPEG_AVAILABLE = False
+
 NDArrayUI8 = npt.NDArray[np.uint8]
+NDArrayU32 = npt.NDArray[np.uint32]
 NDArrayF32 = npt.NDArray[np.float32]
 
 
@@ -20,7 +29,7 @@ def im_decode(im_bytes: bytes, mode: str = "RGB") -> NDArrayUI8:
         "L",
     }, f"{mode} not supported for image decoding!"
 
-    pil_img = Image.open(BytesIO(bytearray(im_bytes)))
+    pil_img = Image.open(BytesIO(im_bytes))
     pil_img = ImageOps.exif_transpose(pil_img)
     if pil_img.mode == "L":  # pragma: no cover
         if mode == "L":
@@ -38,6 +47,124 @@ def im_decode(im_bytes: bytes, mode: str = "RGB") -> NDArrayUI8:
     return img
 
 
+IMAGE_DECODERS = ("auto", "pil", "cv2", "simplejpeg")
+IMAGE_SCALES = (1, 2, 4, 8)
+
+_CV2_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def _is_jpeg(im_bytes: bytes) -> bool:
+    """Check if the bytes are a JPEG image."""
+    return im_bytes[:2] == b"\xff\xd8"
+
+
+def _rgb_decode_pil(
+    im_bytes: bytes, scale: int, out: None | NDArrayUI8
+) -> NDArrayUI8:
+    """Decode an RGB image with PIL, see rgb_decode."""
+    pil_img = Image.open(BytesIO(im_bytes))
+    if scale > 1:
+        width, height = pil_img.size
+        # JPEG images are scaled in the DCT domain while decoding, by the
+        # largest factor whose size is at least the requested one, so the
+        # rounded down size is requested and any remaining factor reduced
+        pil_img.draft("RGB", (max(width // scale, 1), max(height // scale, 1)))
+        drafted = next(
+            factor
+            for factor in reversed(IMAGE_SCALES)
+            if pil_img.size[0] == -(-width // factor)
+        )
+        if drafted < scale:
+            pil_img = pil_img.reduce(scale // drafted)
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+    if out is None:
+        return np.array(pil_img)
+    np.copyto(out, np.asarray(pil_img))
+    return out
+
+
+def _rgb_decode_cv2(
+    im_bytes: bytes, scale: int, out: None | NDArrayUI8
+) -> NDArrayUI8:
+    """Decode an RGB image with OpenCV, see rgb_decode."""
+    # OpenCV scales JPEG images while decoding, rounding the size up, but
+    # resizes other images afterwards, rounding it down
+    is_jpeg = _is_jpeg(im_bytes)
+    image = cv2.imdecode(
+        np.frombuffer(im_bytes, dtype=np.uint8),
+        _CV2_FLAGS[scale if is_jpeg else 1] | cv2.IMREAD_IGNORE_ORIENTATION,
+    )
+    if image is None:
+        raise ValueError("Cannot decode image!")
+    if scale > 1 and not is_jpeg:
+        height, width = image.shape[:2]
+        image = cv2.resize(
+            image,
+            (-(-width // scale), -(-height // scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=out)
+
+
+def _rgb_decode_simplejpeg(
+    im_bytes: bytes, scale: int, out: None | NDArrayUI8
+) -> NDArrayUI8:
+    """Decode an RGB JPEG image with simplejpeg, see rgb_decode."""
+    if not _is_jpeg(im_bytes):
+        return _rgb_decode_pil(im_bytes, scale, out)
+    return simplejpeg.decode_jpeg(
+        im_bytes, colorspace="RGB", min_factor=scale, buffer=out
+    )
+
+
+def rgb_decode(
+    im_bytes: bytes,
+    scale: int = 1,
+    out: None | NDArrayUI8 = None,
+    decoder: str = "pil",
+) -> NDArrayUI8:
+    """Decode to RGB image (numpy array) from bytes, optionally downscaled.
+
+    Unlike im_decode, this ignores the EXIF orientation, which the SHIFT
+    frames do not have. JPEG images are downscaled while decoding, by
+    computing only the low frequencies of the DCT, which makes decoding
+    cheaper the more they are downscaled. Other images are decoded at full
+    resolution and downscaled by averaging.
+
+    Args:
+        im_bytes (bytes): The encoded image.
+        scale (int): Factor to downscale the image by, one of 1, 2, 4 or 8.
+            The size of the result is rounded up. Defaults to 1.
+        out (None | NDArrayUI8): Array of shape [H, W, 3] to decode into,
+            e.g. a preallocated or pinned buffer. The pil decoder copies the
+            image into it. Defaults to None.
+        decoder (str): The decoder, "pil", "cv2", "simplejpeg" if installed,
+            or "auto" for the fastest one installed. The decoders are based
+            on different versions of libjpeg, so their results may differ
+            slightly. Defaults to "pil".
+
+    Returns:
+        NDArrayUI8: The image of shape [H, W, 3], out if given.
+    """
+    assert scale in IMAGE_SCALES, f"Invalid scale {scale}, must be in {IMAGE_SCALES}."
+    assert decoder in IMAGE_DECODERS, f"{decoder} not supported for image decoding!"
+    if decoder == "auto":
+        decoder = "simplejpeg" if SIMPLEJPEG_AVAILABLE else "cv2"
+    if decoder == "simplejpeg":
+        if not SIMPLEJPEG_AVAILABLE:
+            raise ValueError("Please install simplejpeg to use it for decoding.")
+        return _rgb_decode_simplejpeg(im_bytes, scale, out)
+    if decoder == "cv2":
+        return _rgb_decode_cv2(im_bytes, scale, out)
+    return _rgb_decode_pil(im_bytes, scale, out)
+
+
 def ply_decode(ply_bytes: bytes, mode: str = "XYZI") -> NDArrayF32:
     """Decode to point clouds (numpy array) from bytes."""
     assert mode in {
@@ -45,7 +172,7 @@ def ply_decode(ply_bytes: bytes, mode: str = "XYZI") -> NDArrayF32:
         "XYZI",
     }, f"{mode} not supported for points decoding!"
 
-    plydata = plyfile.PlyData.read(BytesIO(bytearray(ply_bytes)))
+    plydata = plyfile.PlyData.read(BytesIO(ply_bytes))
     num_points = plydata["vertex"].count
     num_channels = 3 if mode == "XYZ" else 4
     points = np.zeros((num_points, num_channels), dtype=np.float32)
@@ -56,3 +183,55 @@ def ply_decode(ply_bytes: bytes, mode: str = "XYZI") -> NDArrayF32:
     if mode == "XYZI":
         points[:, 3] = plydata["vertex"].data["intensity"]
     return points
+
+
+def depth_decode(im_bytes: bytes) -> NDArrayU32:
+    """Decode depth image bytes to the 24 bit integer depth (numpy array).
+
+    The depth is encoded in the RGB channels of the image, with blue being
+    the most significant byte, see depth_to_meters. The pixels are decoded as
+    RGBA and read as little endian 32 bit integers, R + G << 8 + B << 16 +
+    A << 24, so that masking out the alpha byte yields the depth.
+    """
+    image = cv2.imdecode(
+        np.frombuffer(im_bytes, dtype=np.uint8),
+        cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION,
+    )
+    if image is None:
+        raise ValueError("Cannot decode depth image!")
+    depth = cv2.cvtColor(image, cv2.COLOR_BGR2RGBA).view("<u4")[..., 0]
+    depth &= 0xFFFFFF
+    return depth
+
+
+def depth_8bit_decode(im_bytes: bytes) -> NDArrayUI8:
+    """Decode 8 bit depth image bytes to the 8 bit depth (numpy array)."""
+    image = cv2.imdecode(
+        np.frombuffer(im_bytes, dtype=np.uint8),
+        cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION,
+    )
+    if image is None:
+        raise ValueError("Cannot decode depth image!")
+    return image
+
+
+def depth_to_meters(
+    depth: NDArrayU32 | NDArrayUI8, max_depth: float = 1000.0
+) -> NDArrayF32:
+    """Convert integer depth to meters in a single pass.
+
+    The integer depth of n bits (24 for depth_decode, 8 for
+    depth_8bit_decode) covers the range from 0 to max_depth linearly, the
+    depth in meters is depth / 2 ** n * max_depth.
+
+    Args:
+        depth (NDArrayU32 | NDArrayUI8): The integer depth.
+        max_depth (float): The maximum depth in meters. Defaults to 1000.0.
+
+    Returns:
+        NDArrayF32: The depth in meters.
+    """
+    assert max_depth > 0, "Max depth value must be greater than 0."
+    bits = 8 if depth.dtype == np.uint8 else 24
+    scale = np.float32(max_depth / 2**bits)
+    return np.multiply(depth, scale, dtype=np.float32, casting="unsafe")